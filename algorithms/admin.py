@@ -1,14 +1,19 @@
 from django.contrib import admin
-from .models import Alert,Algorithm
+from .models import Alert, AlertRetentionPolicy, Algorithm
 # Register your models here.
 @admin.register(Algorithm)
 class AlgorithmAdmin(admin.ModelAdmin):
-    list_display = ("name", "key", "type")
+    list_display = ("name", "key", "type", "suppression_window")
     search_fields = ("name", "key")
 
 
 @admin.register(Alert)
 class AlertAdmin(admin.ModelAdmin):
-    list_display = ("id", "aibox_alert_id", "alert_time", "device", "source", "hazard_level", "company")
+    list_display = ("id", "aibox_alert_id", "alert_time", "device", "source", "hazard_level", "hit_count", "company")
     list_filter = ("hazard_level", "company", "device")
     search_fields = ("aibox_alert_id", "device__name", "source__source_id")
+
+
+@admin.register(AlertRetentionPolicy)
+class AlertRetentionPolicyAdmin(admin.ModelAdmin):
+    list_display = ("company", "retention_days", "media_retention_days", "archive")
@@ -0,0 +1,186 @@
+"""
+События тревог для дашборда (поток `v2/alerts/stream/`): новые тревоги, смена статуса
+и подавленные повторы (`alert.hit`).
+
+События публикуются только после фиксации транзакции. ALERT_STREAM_BACKEND:
+- "memory" — доставка подписчикам текущего процесса (один ASGI-воркер);
+- "postgres" — через NOTIFY/LISTEN PostgreSQL: событие уходит вместе с COMMIT,
+  в каждом процессе с подписчиками его принимает поток-слушатель, так что
+  тревоги, принятые любым воркером (WSGI или ASGI), видят все дашборды.
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+EVENT_CREATED = "alert.created"
+EVENT_STATUS = "alert.status"
+EVENT_HIT = "alert.hit"
+NOTIFY_CHANNEL = "alert_events"
+# Ограничение PostgreSQL на размер NOTIFY — 8000 байт, оставляем запас
+NOTIFY_MAX_PAYLOAD = 7000
+
+
+def created_event(alert):
+    return {
+        "type": EVENT_CREATED,
+        "id": alert.pk,
+        "aibox_alert_id": alert.aibox_alert_id,
+        "alert_time": alert.alert_time,
+        "company": alert.company_id,
+        "device": alert.device_id,
+        "source": alert.source_id,
+        "alg": alert.alg.key if alert.alg_id else None,
+        "hazard_level": alert.hazard_level,
+        "status": alert.status,
+        "image": alert.image.url if alert.image else None,
+    }
+
+
+def status_event(alert):
+    return {
+        "type": EVENT_STATUS,
+        "id": alert.pk,
+        "company": alert.company_id,
+        "status": alert.status,
+        "confirmed_at": alert.confirmed_at,
+        "rejected_at": alert.rejected_at,
+    }
+
+
+def hit_event(alert):
+    return {
+        "type": EVENT_HIT,
+        "id": alert.pk,
+        "company": alert.company_id,
+        "hit_count": alert.hit_count,
+        "last_hit_at": alert.last_hit_at,
+    }
+
+
+class Subscription:
+    """Подписка одного потока: очередь событий одной компании в цикле событий подписчика."""
+
+    def __init__(self, company_id, loop):
+        self.company_id = company_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=settings.ALERT_STREAM_QUEUE_SIZE)
+        # Очередь переполнялась — часть событий потеряна, клиенту нужно перечитать список
+        self.lagging = False
+
+    def matches(self, event):
+        return self.company_id == event["company"]
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.lagging = True
+
+
+class AlertEventBroker:
+    """Pub/sub событий тревог внутри процесса; публиковать можно из любого потока."""
+
+    def __init__(self):
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+        self._listener = None
+
+    def subscribe(self, company_id):
+        """Подписка на события одной компании (поток без компании не выдаётся)."""
+        subscription = Subscription(company_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions.add(subscription)
+            if settings.ALERT_STREAM_BACKEND == "postgres" and self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name="alert-events-listener", daemon=True)
+                self._listener.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def dispatch(self, events):
+        """Раздаёт события подписчикам процесса (каждому — в его цикл событий)."""
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for event in events:
+            for subscription in subscriptions:
+                if subscription.matches(event):
+                    try:
+                        subscription.loop.call_soon_threadsafe(subscription.put, event)
+                    except RuntimeError:
+                        # Цикл событий подписчика уже закрыт
+                        self.unsubscribe(subscription)
+
+    def publish(self, events):
+        """Публикует события после фиксации текущей транзакции."""
+        if not events:
+            return
+        if settings.ALERT_STREAM_BACKEND == "postgres":
+            # NOTIFY транзакционный: слушатели получат события только после COMMIT
+            with connection.cursor() as cursor:
+                for payload in encode_notify_payloads(events):
+                    cursor.execute("SELECT pg_notify(%s, %s)", [NOTIFY_CHANNEL, payload])
+        elif self._subscriptions:
+            events = json.loads(json.dumps(events, cls=DjangoJSONEncoder))
+            transaction.on_commit(lambda: self.dispatch(events))
+
+    def _listen(self):
+        """Поток-слушатель NOTIFY: отдельное соединение с БД, переподключение при ошибках."""
+        while True:
+            listener = connections.create_connection("default")
+            try:
+                with listener.cursor() as cursor:
+                    cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                raw = listener.connection
+                while True:
+                    if not select.select([raw], [], [], settings.ALERT_STREAM_HEARTBEAT)[0]:
+                        continue
+                    raw.poll()
+                    while raw.notifies:
+                        self.dispatch(json.loads(raw.notifies.pop(0).payload))
+            except Exception as e:
+                logger.warning("Слушатель событий тревог остановлен, переподключение: %s", e)
+                time.sleep(1)
+            finally:
+                listener.close()
+
+
+def encode_notify_payloads(events):
+    """JSON-массивы событий, каждый не длиннее NOTIFY_MAX_PAYLOAD байт."""
+    payloads, chunk, size = [], [], 2
+    for event in events:
+        encoded = json.dumps(event, cls=DjangoJSONEncoder, ensure_ascii=False)
+        length = len(encoded.encode()) + 1
+        if chunk and size + length > NOTIFY_MAX_PAYLOAD:
+            payloads.append(f"[{','.join(chunk)}]")
+            chunk, size = [], 2
+        chunk.append(encoded)
+        size += length
+    if chunk:
+        payloads.append(f"[{','.join(chunk)}]")
+    return payloads
+
+
+broker = AlertEventBroker()
+
+
+def publish_alerts_created(alerts):
+    broker.publish([created_event(alert) for alert in alerts])
+
+
+def publish_alerts_hit(alerts):
+    broker.publish([hit_event(alert) for alert in alerts])
+
+
+def publish_alerts_status(alerts):
+    broker.publish([status_event(alert) for alert in alerts])
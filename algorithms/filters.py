@@ -0,0 +1,12 @@
+import django_filters
+
+from .models import Alert
+
+
+class AlertFilter(django_filters.FilterSet):
+    """Фильтры списка тревог; диапазон времени: `alert_time_after` / `alert_time_before` (ISO 8601)."""
+    alert_time = django_filters.IsoDateTimeFromToRangeFilter()
+
+    class Meta:
+        model = Alert
+        fields = ("company", "device", "source", "alg", "status", "hazard_level")
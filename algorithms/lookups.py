@@ -0,0 +1,22 @@
+from django.db import transaction
+
+from visionaibox.cache import ReferenceCache
+from .models import Algorithm
+
+algorithm_cache = ReferenceCache("algorithm")
+
+
+def get_or_create_algorithm(alg_data):
+    """Алгоритм по ключу (`alg.name` от AIBox) из кэша или БД, создаётся при первом появлении."""
+    alg_key = alg_data.get("name")
+    algorithm = algorithm_cache.get(alg_key)
+    if algorithm is None:
+        algorithm, created = Algorithm.objects.get_or_create(
+            key=alg_key,
+            defaults={"name": alg_data.get("ch_name", ""), "type": alg_data.get("type", "")}
+        )
+        if created:
+            transaction.on_commit(lambda: algorithm_cache.set(alg_key, algorithm))
+        else:
+            algorithm_cache.set(alg_key, algorithm)
+    return algorithm
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from algorithms.retention import apply_retention
+
+
+class Command(BaseCommand):
+    help = "Архивирует и удаляет старые тревоги и их медиафайлы по политикам хранения компаний"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--company", type=int, action="append", dest="companies",
+                            help="ID компании (можно указать несколько раз), по умолчанию все")
+        parser.add_argument("--batch-size", type=int, default=settings.ALERT_RETENTION_BATCH_SIZE,
+                            help="Размер пачки тревог на одну транзакцию")
+        parser.add_argument("--max-batches", type=int, default=None,
+                            help="Ограничить число пачек на компанию за запуск (для постепенной очистки)")
+
+    def handle(self, *args, **options):
+        result = apply_retention(options["companies"], options["batch_size"], options["max_batches"])
+        for company_id, (expired, media_expired) in result.items():
+            self.stdout.write(f"Компания {company_id}: удалено тревог {expired}, очищено медиа {media_expired}")
+        self.stdout.write(f"Всего удалено тревог: {sum(expired for expired, _ in result.values())}")
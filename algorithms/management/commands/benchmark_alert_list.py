@@ -0,0 +1,85 @@
+import time
+
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now, timedelta
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from algorithms.models import Alert, Algorithm
+from algorithms.serializers import AlertListSerializer, AlertSerializer
+from companies.models import Company
+from devices.models import Device, Source
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает скорость страницы списка тревог: прежний путь (prefetch_related + AlertSerializer) "
+        "и values() + AlertListSerializer. Тестовые тревоги создаются в транзакции и откатываются"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10000, help="Строк на странице")
+        parser.add_argument("--repeat", type=int, default=3, help="Повторов каждого варианта (берётся лучший)")
+
+    def handle(self, *args, **options):
+        rows, repeat = options["rows"], options["repeat"]
+        request = Request(RequestFactory().get("/api/algorithms/v1/alerts/"))
+        try:
+            with transaction.atomic():
+                company = self.create_alerts(rows)
+                queryset = Alert.objects.filter(company=company).order_by("-alert_time", "-id")
+                variants = {
+                    "prefetch_related + AlertSerializer": lambda: AlertSerializer(
+                        queryset.prefetch_related("device", "source", "alg", "company")[:rows],
+                        many=True, context={"request": request},
+                    ).data,
+                    "values() + AlertListSerializer": lambda: AlertListSerializer(
+                        queryset.values(*AlertListSerializer.get_values())[:rows],
+                        many=True, context={"request": request},
+                    ).data,
+                }
+                for name, serialize in variants.items():
+                    self.run(name, serialize, rows, repeat)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def create_alerts(self, rows):
+        company = Company.objects.create(name="benchmark")
+        device = Device.objects.create(company=company, aibox_id=f"benchmark-{time.time()}", name="benchmark")
+        source = Source.objects.create(device=device, source_id="1", ipv4="10.0.0.1")
+        algorithm = Algorithm.objects.filter(key="benchmark").first() or Algorithm.objects.create(
+            key="benchmark", name="benchmark", type="detect"
+        )
+        start = now()
+        Alert.objects.bulk_create(
+            [
+                Alert(
+                    aibox_alert_id=f"benchmark-{index}", alert_time=start - timedelta(seconds=index),
+                    device=device, source=source, alg=algorithm, company=company,
+                    image=f"alerts/images/benchmark_{index}.jpg", reserved_data={"index": index},
+                )
+                for index in range(rows)
+            ],
+            batch_size=2000,
+        )
+        return company
+
+    def run(self, name, serialize, rows, repeat):
+        best = None
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                JSONRenderer().render(serialize())
+                elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        self.stdout.write(
+            f"{name}: {best * 1000:.0f} мс, {rows / best:.0f} строк/с, запросов {len(queries)}"
+        )
@@ -0,0 +1,291 @@
+import base64
+import io
+import json
+import math
+import os
+import random
+import tempfile
+import time
+import uuid
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.utils.timezone import now, timedelta
+from PIL import Image
+
+from algorithms.lookups import algorithm_cache, get_or_create_algorithm
+from algorithms.models import Alert, AlertKey, AlertRollup, Algorithm
+from companies.models import Company
+from devices.lookups import device_cache, get_device, get_or_create_source, source_cache
+from devices.models import Device, Source
+from users.lookups import get_recipients_map, recipient_cache
+from users.models import User
+from visionaibox.metrics import count_queries, enable_query_counting
+
+# Лимиты, подавление повторов и сброс нагрузки исказили бы замеры — на время прогона выключены
+BENCHMARK_SETTINGS = {
+    "ALERT_RATE_LIMIT_DEVICE": 0,
+    "ALERT_RATE_LIMIT_COMPANY": 0,
+    "ALERT_SHED_MAX_INFLIGHT": 0,
+    "ALERT_SHED_MAX_OUTBOX": 0,
+    "ALERT_SUPPRESSION_WINDOW": 0,
+}
+STATUSES = [Alert.STATUS_PENDING] * 7 + [Alert.STATUS_CONFIRMED] * 2 + [Alert.STATUS_REJECTED]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный прогон API: заполняет БД компаниями, устройствами, источниками, алгоритмами и тревогами, "
+        "измеряет пропускную способность, p50/p99 и число SQL-запросов на запрос для приёма тревог, списка, "
+        "send-action, статистики и ссылок Telegram. С --baseline сравнивает с сохранённым прогоном и завершается "
+        "ошибкой при росте числа запросов или задержек. Данные создаются в транзакции и откатываются"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--companies", type=int, default=5, help="Компаний")
+        parser.add_argument("--devices", type=int, default=10, help="Устройств AIBox на компанию")
+        parser.add_argument("--sources", type=int, default=4, help="Камер на устройство")
+        parser.add_argument("--algorithms", type=int, default=8, help="Алгоритмов")
+        parser.add_argument("--alerts", type=int, default=50000, help="Тревог за последние 30 дней")
+        parser.add_argument("--requests", type=int, default=200, help="Измеряемых запросов на сценарий")
+        parser.add_argument("--warmup", type=int, default=10, help="Запросов прогрева на сценарий (не измеряются)")
+        parser.add_argument("--scenario", action="append", default=[], help="Только указанные сценарии")
+        parser.add_argument("--baseline", help="JSON прошлого прогона для сравнения")
+        parser.add_argument("--save", help="Сохранить результаты в JSON (например, как новый baseline)")
+        parser.add_argument("--threshold", type=float, default=1.3,
+                            help="Допустимый рост p50/p99 относительно baseline (во сколько раз)")
+        parser.add_argument("--min-delta-ms", type=float, default=1.0,
+                            help="Рост задержки меньше этого не считается регрессией (шум)")
+        parser.add_argument("--seed", type=int, default=0, help="Seed генератора данных")
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options["seed"])
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"]) as file:
+                baseline = json.load(file)
+
+        results = {}
+        enable_query_counting()
+        try:
+            with tempfile.TemporaryDirectory() as media_root, \
+                    override_settings(MEDIA_ROOT=media_root, **BENCHMARK_SETTINGS), transaction.atomic():
+                started = time.perf_counter()
+                self.seed(options)
+                self.stdout.write(f"Данные созданы за {time.perf_counter() - started:.1f} с")
+                for name, prepare, send in self.get_scenarios(options):
+                    if options["scenario"] and name not in options["scenario"]:
+                        continue
+                    results[name] = self.run(name, prepare, send, options)
+                raise Rollback
+        except Rollback:
+            pass
+        finally:
+            # В кэшах процесса могли остаться откаченные объекты
+            for cache in (device_cache, source_cache, algorithm_cache, recipient_cache):
+                cache.invalidate()
+
+        if options["save"]:
+            with open(options["save"], "w") as file:
+                json.dump({"options": self.describe(options), "scenarios": results}, file, indent=2, ensure_ascii=False)
+                file.write("\n")
+        if baseline is not None:
+            self.compare(results, baseline, options)
+
+    def describe(self, options):
+        return {
+            name: options[name]
+            for name in ("companies", "devices", "sources", "algorithms", "alerts", "requests", "warmup", "seed")
+        }
+
+    def seed(self, options):
+        rnd = self.random
+        suffix = uuid.uuid4().hex[:8]
+        telegram_ids = iter(range(9_000_000_000 + rnd.randrange(10 ** 8), 10 ** 12))
+        self.companies = Company.objects.bulk_create(
+            [Company(name=f"benchmark-{suffix}-{index}") for index in range(options["companies"])]
+        )
+        users = []
+        for company in self.companies:
+            users.append(User(company=company, telegram_id=next(telegram_ids), is_security=True))
+            users.append(User(company=company, telegram_id=next(telegram_ids), is_executive=True))
+        self.users = User.objects.bulk_create(users)
+        self.telegram_ids = telegram_ids
+
+        self.devices = Device.objects.bulk_create([
+            Device(company=company, aibox_id=f"benchmark-{suffix}-{company.pk}-{index}", name=f"AIBox {index}")
+            for company in self.companies for index in range(options["devices"])
+        ])
+        sources = Source.objects.bulk_create([
+            Source(device=device, source_id=str(index), ipv4=f"10.0.{device.pk % 250}.{index + 1}")
+            for device in self.devices for index in range(options["sources"])
+        ])
+        self.algorithms = Algorithm.objects.bulk_create([
+            Algorithm(key=f"benchmark-{suffix}-{index}", name=f"Алгоритм {index}", type="detect")
+            for index in range(options["algorithms"])
+        ])
+
+        end = now()
+        alerts = []
+        for index in range(options["alerts"]):
+            source = rnd.choice(sources)
+            device = source.device
+            alert_status = rnd.choice(STATUSES)
+            alert_time = end - timedelta(seconds=rnd.randrange(30 * 24 * 3600))
+            alerts.append(Alert(
+                aibox_alert_id=f"benchmark-{suffix}-{index}", alert_time=alert_time, device=device, source=source,
+                alg=rnd.choice(self.algorithms), company_id=device.company_id, status=alert_status,
+                hazard_level=str(rnd.randint(1, 3)), image=f"alerts/images/benchmark_{index}.jpg",
+                reserved_data={"boxes": [{"x": 10, "y": 20, "w": 64, "h": 48, "score": 0.9}]},
+                confirmed_at=alert_time if alert_status == Alert.STATUS_CONFIRMED else None,
+                rejected_at=alert_time if alert_status == Alert.STATUS_REJECTED else None,
+            ))
+        Alert.objects.bulk_create(alerts, batch_size=2000)
+        AlertKey.objects.bulk_create(
+            [AlertKey(aibox_alert_id=alert.aibox_alert_id, alert=alert, alert_time=alert.alert_time) for alert in alerts],
+            batch_size=2000,
+        )
+        # Устройства новые, строк счётчиков ещё нет — вставляем их пачками, без UPDATE на каждый ключ
+        deltas = Counter()
+        for alert in alerts:
+            deltas.update(AlertRollup.objects.get_deltas(alert))
+        AlertRollup.objects.bulk_create(
+            [AlertRollup(count=count, **dict(zip(AlertRollup.objects.KEY_FIELDS, key))) for key, count in deltas.items()],
+            batch_size=2000,
+        )
+        # Статистика планировщика — как после autovacuum в рабочей БД, иначе планы зависят от случая
+        with connection.cursor() as cursor:
+            for model in (Alert, AlertKey, AlertRollup):
+                cursor.execute(f'ANALYZE "{model._meta.db_table}"')
+        self.pending = list(
+            Alert.objects.filter(company__in=self.companies, status=Alert.STATUS_PENDING)
+            .order_by("-alert_time").values_list("pk", flat=True)[:options["requests"] + options["warmup"]]
+        )
+        self.source_count = options["sources"]
+        self.image = self.make_image()
+
+        # Справочники прогреваются заранее: замеряется установившийся режим, а не первые запросы устройств
+        for device in self.devices:
+            device = get_device(device.aibox_id)
+            for index in range(self.source_count):
+                get_or_create_source(device, {"id": str(index)})
+        for algorithm in self.algorithms:
+            get_or_create_algorithm({"name": algorithm.key})
+        get_recipients_map([company.pk for company in self.companies])
+
+    def make_image(self):
+        """JPEG 1280×720, как кадр с камеры (шум, чтобы размер был реалистичным)."""
+        image = Image.frombytes("RGB", (1280, 720), self.random.randbytes(1280 * 720 * 3))
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=80)
+        return buffer.getvalue()
+
+    def alert_body(self, index, media=False):
+        device = self.devices[index % len(self.devices)]
+        body = {
+            "id": f"benchmark-push-{uuid.uuid4().hex}",
+            "alert_time": time.time(),
+            "device": {"id": device.aibox_id},
+            "source": {"id": str(index % self.source_count)},
+            "alg": {"name": self.algorithms[index % len(self.algorithms)].key},
+            "hazard_level": "2",
+            "reserved_data": {"boxes": [{"x": 10, "y": 20, "w": 64, "h": 48, "score": 0.9}]},
+        }
+        if media:
+            # Байты после EOI делают каждый кадр уникальным, чтобы запись в хранилище не пропускалась
+            body["image"] = base64.b64encode(self.image + index.to_bytes(4, "big")).decode()
+        return json.dumps(body)
+
+    def get_scenarios(self, options):
+        """(имя, prepare(i) → аргументы запроса вне замера, send(client, args) → response)."""
+        def post_json(path):
+            return lambda client, body: client.post(path, body, content_type="application/json")
+
+        def get(client, path):
+            return client.get(path)
+
+        company = self.companies[0].pk
+        return [
+            ("ingest", lambda i: self.alert_body(i), post_json("/api/algorithms/v1/alerts/")),
+            ("ingest_media", lambda i: self.alert_body(i, media=True), post_json("/api/algorithms/v1/alerts/")),
+            ("ingest_async", lambda i: self.alert_body(i), post_json("/api/algorithms/v2/alerts/")),
+            ("list", lambda i: "/api/algorithms/v1/alerts/?page_size=50", get),
+            ("list_company_pending",
+             lambda i: f"/api/algorithms/v1/alerts/?page_size=50&company={company}&status=pending", get),
+            ("send_action", lambda i: self.pending[i],
+             lambda client, pk: client.post(f"/api/algorithms/v1/alerts/{pk}/send-action/", {"action": "confirm"},
+                                            content_type="application/json")),
+            ("alert_stats", lambda i: "/api/algorithms/alert-stats/?period=month", get),
+            ("alert_histogram", lambda i: "/api/algorithms/alert-histogram/?period=month&bucket=day", get),
+            ("telegram_link", lambda i: f"/api/users/v1/get_telegram_link/{self.users[i % len(self.users)].pk}/", get),
+            ("telegram_register", self.prepare_register, post_json("/api/users/v1/register_telegram/")),
+        ]
+
+    def prepare_register(self, index):
+        user = self.users[index % len(self.users)]
+        token = str(uuid.uuid4())
+        User.objects.filter(pk=user.pk).update(telegram_token=token)
+        return json.dumps({"telegram_id": next(self.telegram_ids), "token": token})
+
+    def run(self, name, prepare, send, options):
+        client = Client()
+        warmup, count = options["warmup"], options["requests"]
+        if name == "send_action":
+            count = max(min(count, len(self.pending) - warmup), 0)
+        timings, queries = [], []
+        for index in range(warmup + count):
+            args = prepare(index)
+            with count_queries() as captured:
+                started = time.perf_counter()
+                response = send(client, args)
+                elapsed = time.perf_counter() - started
+            if response.status_code >= 400:
+                raise CommandError(f"{name}: ответ {response.status_code} {response.content[:300]!r}")
+            if index >= warmup:
+                timings.append(elapsed)
+                queries.append(captured[0])
+        if not timings:
+            self.stdout.write(f"{name}: нет данных для замера")
+            return None
+
+        timings.sort()
+        result = {
+            "requests": len(timings),
+            "rps": round(len(timings) / sum(timings), 1),
+            "p50_ms": round(percentile(timings, 50) * 1000, 2),
+            "p99_ms": round(percentile(timings, 99) * 1000, 2),
+            "queries": max(queries),
+        }
+        unstable = " (нестабильно: {}–{})".format(min(queries), max(queries)) if min(queries) != max(queries) else ""
+        self.stdout.write(
+            f"{name:22} {result['rps']:>8} запр/с  p50 {result['p50_ms']:>8} мс  p99 {result['p99_ms']:>8} мс  "
+            f"SQL {result['queries']}{unstable}"
+        )
+        return result
+
+    def compare(self, results, baseline, options):
+        regressions = []
+        for name, result in results.items():
+            base = baseline.get("scenarios", {}).get(name)
+            if not result or not base:
+                continue
+            if result["queries"] > base["queries"]:
+                regressions.append(f"{name}: SQL-запросов {base['queries']} → {result['queries']}")
+            for key in ("p50_ms", "p99_ms"):
+                limit = max(base[key] * options["threshold"], base[key] + options["min_delta_ms"])
+                if result[key] > limit:
+                    regressions.append(f"{name}: {key} {base[key]} → {result[key]} (допустимо до {limit:.2f})")
+        if regressions:
+            raise CommandError("Регрессия относительно baseline:\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS(f"Регрессий относительно {os.path.basename(options['baseline'])} нет"))
+
+
+def percentile(values, percent):
+    """Перцентиль отсортированного списка (nearest-rank)."""
+    return values[max(math.ceil(len(values) * percent / 100) - 1, 0)]
@@ -0,0 +1,75 @@
+import base64
+import io
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework import parsers, renderers
+
+from visionaibox import fastjson
+
+
+def make_alert(index, image_size):
+    """Тело запроса AIBox: тревога с изображением `image_size` байт (base64) и reserved_data."""
+    return {
+        "id": f"benchmark-{index}",
+        "alert_time": 1700000000.0 + index,
+        "device": {"id": "aibox-benchmark", "ip": "10.0.0.2"},
+        "source": {"id": index % 16, "ipv4": "10.0.0.10", "desc": "Камера у входа"},
+        "alg": {"name": "fire", "ch_name": "Огонь", "type": "detect"},
+        "hazard_level": "2",
+        "image": base64.b64encode(os.urandom(image_size)).decode() if image_size else None,
+        "reserved_data": {
+            "boxes": [{"x": i * 10, "y": i * 5, "w": 64, "h": 48, "score": 0.87, "label": "fire"} for i in range(20)],
+            "firmware": "3.2.1",
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Время разбора и рендеринга JSON тел запросов AIBox: стандартные JSONParser/JSONRenderer DRF "
+        "против visionaibox.fastjson, по размерам тела"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--file", action="append", default=[], help="Реальное тело запроса (JSON), можно несколько")
+        parser.add_argument("--repeat", type=int, default=20, help="Повторов (берётся лучшее время)")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"orjson: {'да' if fastjson.orjson else 'нет (стандартный json)'}")
+        bodies = [
+            (f"тревога, изображение {size // 1024} КБ", fastjson.dumps(make_alert(0, size)))
+            for size in (0, 64 * 1024, 512 * 1024, 4 * 1024 * 1024)
+        ]
+        bodies.append(("пачка из 500 тревог без медиа", fastjson.dumps([make_alert(i, 0) for i in range(500)])))
+        for path in options["file"]:
+            with open(path, "rb") as file:
+                bodies.append((os.path.basename(path), file.read()))
+
+        variants = {
+            "DRF": (parsers.JSONParser(), renderers.JSONRenderer()),
+            "fastjson": (fastjson.JSONParser(), fastjson.JSONRenderer()),
+        }
+        for name, body in bodies:
+            timings = {}
+            for variant, (parser, renderer) in variants.items():
+                parse = self.measure(lambda: parser.parse(io.BytesIO(body)), options["repeat"])
+                data = parser.parse(io.BytesIO(body))
+                render = self.measure(lambda: renderer.render(data), options["repeat"])
+                timings[variant] = (parse, render)
+            (drf_parse, drf_render), (fast_parse, fast_render) = timings["DRF"], timings["fastjson"]
+            self.stdout.write(
+                f"{name} ({len(body) / 1024:.0f} КБ): "
+                f"разбор {drf_parse * 1e3:.2f} → {fast_parse * 1e3:.2f} мс (x{drf_parse / fast_parse:.1f}), "
+                f"рендеринг {drf_render * 1e3:.2f} → {fast_render * 1e3:.2f} мс (x{drf_render / fast_render:.1f})"
+            )
+
+    def measure(self, function, repeat):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            function()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best
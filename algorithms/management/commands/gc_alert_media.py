@@ -0,0 +1,55 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from algorithms.models import Alert, MediaBlob
+from algorithms.storage import get_alert_media_storage
+
+
+class Command(BaseCommand):
+    help = "Удаляет файлы тревог, на которые больше нет ссылок (хранилище по содержимому)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--grace", type=int, default=settings.ALERT_MEDIA_GC_GRACE,
+                            help="Сколько секунд файл должен быть без ссылок, прежде чем его удалить")
+        parser.add_argument("--scan", action="store_true",
+                            help="Также найти на диске файлы без записи MediaBlob (после откатанных транзакций)")
+
+    def handle(self, *args, **options):
+        grace = options["grace"]
+        deleted = 0
+        while True:
+            count = MediaBlob.objects.collect_garbage(grace)
+            if not count:
+                break
+            deleted += count
+        self.stdout.write(f"Удалено файлов без ссылок: {deleted}")
+
+        if options["scan"]:
+            self.stdout.write(f"Удалено файлов без записи: {self.scan_orphans(grace)}")
+
+    def scan_orphans(self, grace):
+        storage = get_alert_media_storage()
+        cutoff = time.time() - grace
+        deleted = 0
+        for field in Alert.MEDIA_FIELDS:
+            root = storage.path(Alert._meta.get_field(field).upload_to)
+            for directory, _, filenames in os.walk(root):
+                if directory == root:
+                    # Файлы в корне каталога сохранены до хранилища по содержимому
+                    continue
+                candidates = {}
+                for filename in filenames:
+                    path = os.path.join(directory, filename)
+                    name = os.path.relpath(path, storage.location).replace(os.sep, "/")
+                    if storage.is_blob(name) and os.path.getmtime(path) < cutoff:
+                        candidates[name] = path
+                if not candidates:
+                    continue
+                tracked = set(MediaBlob.objects.filter(name__in=candidates).values_list("name", flat=True))
+                for name in candidates.keys() - tracked:
+                    storage.delete(name)
+                    deleted += 1
+        return deleted
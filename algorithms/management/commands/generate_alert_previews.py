@@ -0,0 +1,28 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from algorithms.previews import process_previews
+
+
+class Command(BaseCommand):
+    help = "Воркер, создающий миниатюры и превью изображений тревог"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=settings.ALERT_PREVIEW_BATCH_SIZE,
+                            help="Размер пачки тревог")
+        parser.add_argument("--interval", type=float, default=settings.ALERT_PREVIEW_POLL_INTERVAL,
+                            help="Пауза между опросами, если новых изображений нет, сек.")
+        parser.add_argument("--once", action="store_true", help="Обработать накопившиеся изображения и выйти")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        while True:
+            processed = process_previews(batch_size=batch_size)
+            if processed:
+                self.stdout.write(f"Обработано тревог: {processed}")
+                continue
+            if options["once"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,263 @@
+import asyncio
+import base64
+import io
+import json
+import math
+import random
+import time
+import uuid
+from collections import Counter, deque
+
+import httpx
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from companies.models import Company
+from devices.models import Device
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def make_media(size, rnd, image=True):
+    """Медиафайл ~`size` байт: настоящий JPEG (для изображений) и случайные байты до нужного размера."""
+    if not image:
+        return rnd.randbytes(size)
+    buffer = io.BytesIO()
+    Image.frombytes("RGB", (64, 64), rnd.randbytes(64 * 64 * 3)).save(buffer, "JPEG")
+    head = buffer.getvalue()
+    # Байты после маркера конца JPEG декодеры игнорируют
+    return head + rnd.randbytes(max(size - len(head), 0))
+
+
+class Stats:
+    def __init__(self):
+        self.statuses = Counter()
+        self.messages = Counter()
+        self.errors = Counter()
+        self.latencies = []
+        self.retries = 0
+        # Итог по тревогам: принята (2xx) или нет после всех повторов
+        self.delivered = 0
+        self.failed = 0
+        self.duplicates = 0
+        self.scheduled = 0
+        self.lag = 0.0
+
+    def percentile(self, percent):
+        if not self.latencies:
+            return 0.0
+        values = sorted(self.latencies)
+        return values[max(math.ceil(len(values) * percent / 100) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Генератор нагрузки: N устройств AIBox × M камер отправляют тревоги в формате AIBox "
+        "(AlertCreateSerializer) на целевой URL с заданной частотой, всплесками, повторами и размером медиа. "
+        "Печатает достигнутую пропускную способность, коды ответов, ошибки и задержки"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000/api/algorithms/v1/alerts/",
+                            help="URL приёма тревог (v1/alerts/ или v2/alerts/)")
+        parser.add_argument("--devices", type=int, default=10, help="Устройств AIBox")
+        parser.add_argument("--cameras", type=int, default=4, help="Камер на устройство")
+        parser.add_argument("--rate", type=float, default=0.2,
+                            help="Средняя частота срабатываний одной камеры, в секунду (поток Пуассона)")
+        parser.add_argument("--duration", type=float, default=60, help="Длительность прогона, сек.")
+        parser.add_argument("--burst-probability", type=float, default=0.0,
+                            help="Доля срабатываний, которые дают серию тревог подряд")
+        parser.add_argument("--burst-size", type=int, default=5, help="Тревог в серии")
+        parser.add_argument("--burst-interval", type=float, default=0.5, help="Интервал между тревогами серии, сек.")
+        parser.add_argument("--duplicate-rate", type=float, default=0.0,
+                            help="Доля повторных отправок уже отправленной тревоги (тот же id и alert_time)")
+        parser.add_argument("--max-retries", type=int, default=3,
+                            help="Повторов при ошибке сети, 429 и 5xx (с учётом Retry-After)")
+        parser.add_argument("--max-retry-wait", type=float, default=10.0, help="Максимальная пауза перед повтором, сек.")
+        parser.add_argument("--image-size", type=int, default=100 * 1024, help="Размер изображения, байт (0 — без)")
+        parser.add_argument("--image-rate", type=float, default=1.0, help="Доля тревог с изображением")
+        parser.add_argument("--video-size", type=int, default=0, help="Размер видео, байт (0 — без)")
+        parser.add_argument("--video-rate", type=float, default=0.0, help="Доля тревог с видео")
+        parser.add_argument("--media-variants", type=int, default=16,
+                            help="Сколько разных файлов медиа генерировать (меньше — больше дедупликация)")
+        parser.add_argument("--algorithms", default="fire,smoke,helmet,intrusion", help="Алгоритмы через запятую")
+        parser.add_argument("--concurrency", type=int, default=64, help="Одновременных запросов")
+        parser.add_argument("--timeout", type=float, default=30.0, help="Таймаут запроса, сек.")
+        parser.add_argument("--prefix", default="loadtest", help="Префикс aibox_id устройств и id тревог")
+        parser.add_argument("--create-devices", action="store_true",
+                            help="Создать устройства в БД (компания `<prefix>`), если их нет")
+        parser.add_argument("--report-interval", type=float, default=10.0, help="Промежуточный отчёт, сек. (0 — нет)")
+        parser.add_argument("--seed", type=int, default=None, help="Seed генератора")
+
+    def handle(self, *args, **options):
+        if options["devices"] < 1 or options["cameras"] < 1 or options["rate"] <= 0:
+            raise CommandError("--devices, --cameras и --rate должны быть больше нуля.")
+        self.options = options
+        self.random = random.Random(options["seed"])
+        self.device_ids = [f"{options['prefix']}-{index}" for index in range(options["devices"])]
+        if options["create_devices"]:
+            self.create_devices()
+        self.algorithms = [name.strip() for name in options["algorithms"].split(",") if name.strip()]
+        self.images = self.make_variants(options["image_size"], image=True)
+        self.videos = self.make_variants(options["video_size"], image=False)
+        self.run_id = uuid.uuid4().hex[:8]
+        self.stats = Stats()
+        # Последние успешно принятые тревоги — кандидаты для повторной отправки
+        self.sent = deque(maxlen=1000)
+        asyncio.run(self.run())
+
+    def create_devices(self):
+        company, _ = Company.objects.get_or_create(name=self.options["prefix"])
+        existing = set(Device.objects.filter(aibox_id__in=self.device_ids).values_list("aibox_id", flat=True))
+        Device.objects.bulk_create([
+            Device(company=company, aibox_id=aibox_id, name=aibox_id)
+            for aibox_id in self.device_ids if aibox_id not in existing
+        ])
+        self.stdout.write(f"Устройств создано: {len(self.device_ids) - len(existing)}, уже было: {len(existing)}")
+
+    def make_variants(self, size, image):
+        if not size:
+            return []
+        return [
+            base64.b64encode(make_media(size, self.random, image)).decode()
+            for _ in range(max(self.options["media_variants"], 1))
+        ]
+
+    def make_alert(self, device, camera, index):
+        options, rnd = self.options, self.random
+        body = {
+            "id": f"{options['prefix']}-{self.run_id}-{device}-{camera}-{index}",
+            "alert_time": time.time(),
+            "device": {"id": self.device_ids[device], "ip": f"10.0.{device // 250}.{device % 250 + 1}"},
+            "source": {"id": camera, "ipv4": f"10.1.{device % 250}.{camera + 1}", "desc": f"Камера {camera + 1}"},
+            "alg": {"name": self.algorithms[(device + camera) % len(self.algorithms)], "type": "detect"},
+            "hazard_level": str(rnd.randint(1, 3)),
+            "reserved_data": {
+                "boxes": [{"x": rnd.randint(0, 1200), "y": rnd.randint(0, 650), "w": 64, "h": 48,
+                           "score": round(rnd.uniform(0.5, 1), 2)}],
+            },
+        }
+        if self.images and rnd.random() < options["image_rate"]:
+            body["image"] = rnd.choice(self.images)
+        if self.videos and rnd.random() < options["video_rate"]:
+            body["video"] = rnd.choice(self.videos)
+        return json.dumps(body)
+
+    async def run(self):
+        options = self.options
+        self.semaphore = asyncio.Semaphore(options["concurrency"])
+        self.tasks = set()
+        limits = httpx.Limits(max_connections=options["concurrency"], max_keepalive_connections=options["concurrency"])
+        self.started = time.perf_counter()
+        self.deadline = self.started + options["duration"]
+        async with httpx.AsyncClient(timeout=options["timeout"], limits=limits) as client:
+            self.client = client
+            reporter = asyncio.create_task(self.report_periodically()) if options["report_interval"] else None
+            cameras = [
+                asyncio.create_task(self.camera(device, camera))
+                for device in range(options["devices"]) for camera in range(options["cameras"])
+            ]
+            await asyncio.gather(*cameras)
+            # Дожидаемся отправленных запросов (вместе с повторами)
+            while self.tasks:
+                await asyncio.gather(*list(self.tasks))
+            if reporter:
+                reporter.cancel()
+        self.report(final=True)
+
+    async def camera(self, device, camera):
+        """Срабатывания одной камеры: поток Пуассона, часть срабатываний — серии тревог."""
+        options, rnd = self.options, self.random
+        index = 0
+        # Случайная фаза, чтобы камеры не срабатывали синхронно
+        next_at = time.perf_counter() + rnd.expovariate(options["rate"])
+        while next_at < self.deadline:
+            await asyncio.sleep(max(next_at - time.perf_counter(), 0))
+            count = options["burst_size"] if rnd.random() < options["burst_probability"] else 1
+            for hit in range(count):
+                if hit:
+                    await asyncio.sleep(options["burst_interval"])
+                self.submit(self.make_alert(device, camera, index), time.perf_counter())
+                index += 1
+                if self.sent and rnd.random() < options["duplicate_rate"]:
+                    self.stats.duplicates += 1
+                    self.submit(rnd.choice(self.sent), time.perf_counter())
+            next_at += rnd.expovariate(options["rate"])
+
+    def submit(self, body, scheduled_at):
+        self.stats.scheduled += 1
+        task = asyncio.create_task(self.send(body, scheduled_at))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def send(self, body, scheduled_at):
+        options, stats = self.options, self.stats
+        for attempt in range(options["max_retries"] + 1):
+            async with self.semaphore:
+                if not attempt:
+                    # Время ожидания свободного соединения — признак того, что сервер не успевает
+                    stats.lag = max(stats.lag, time.perf_counter() - scheduled_at)
+                started = time.perf_counter()
+                try:
+                    response = await self.client.post(
+                        options["url"], content=body, headers={"Content-Type": "application/json"}
+                    )
+                except httpx.HTTPError as e:
+                    stats.errors[type(e).__name__] += 1
+                    response = None
+                else:
+                    stats.latencies.append(time.perf_counter() - started)
+                    stats.statuses[response.status_code] += 1
+                    try:
+                        stats.messages[response.json().get("message")] += 1
+                    except (ValueError, AttributeError):
+                        pass
+            if response is not None and response.status_code not in RETRY_STATUSES:
+                if response.status_code < 300:
+                    stats.delivered += 1
+                    if options["duplicate_rate"]:
+                        self.sent.append(body)
+                else:
+                    stats.failed += 1
+                return
+            if attempt == options["max_retries"]:
+                stats.failed += 1
+                return
+            stats.retries += 1
+            await asyncio.sleep(self.get_retry_delay(response, attempt))
+
+    def get_retry_delay(self, response, attempt):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        try:
+            delay = float(retry_after) if retry_after else 0.5 * 2 ** attempt
+        except ValueError:
+            delay = 0.5 * 2 ** attempt
+        # Разброс, чтобы повторы всех устройств не приходили одновременно
+        return min(delay, self.options["max_retry_wait"]) * self.random.uniform(0.8, 1.2)
+
+    async def report_periodically(self):
+        while True:
+            await asyncio.sleep(self.options["report_interval"])
+            self.report()
+
+    def report(self, final=False):
+        stats = self.stats
+        elapsed = time.perf_counter() - self.started
+        responses = sum(stats.statuses.values())
+        failed = sum(count for status, count in stats.statuses.items() if status >= 400) + sum(stats.errors.values())
+        self.stdout.write(
+            f"{'Итог' if final else f'{elapsed:.0f} с'}: запланировано {stats.scheduled}, ответов {responses} "
+            f"({responses / elapsed:.1f}/с), ответов с ошибкой {failed} ({failed / max(responses + sum(stats.errors.values()), 1):.1%}), "
+            f"повторов {stats.retries}, p50 {stats.percentile(50) * 1000:.0f} мс, p99 {stats.percentile(99) * 1000:.0f} мс, "
+            f"макс. ожидание соединения {stats.lag:.2f} с"
+        )
+        if final:
+            self.stdout.write(
+                f"Тревог принято {stats.delivered} из {stats.scheduled}, не принято после повторов {stats.failed} "
+                f"({stats.failed / max(stats.scheduled, 1):.1%})"
+            )
+            self.stdout.write(f"Коды ответов: {dict(sorted(stats.statuses.items()))}")
+            self.stdout.write(f"Сообщения: {dict(stats.messages.most_common())}")
+            self.stdout.write(f"Повторных отправок тревог: {stats.duplicates}")
+            if stats.errors:
+                self.stdout.write(f"Ошибки сети: {dict(stats.errors)}")
@@ -0,0 +1,63 @@
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from algorithms.models import Alert, MediaBlob
+from algorithms.partitions import (
+    add_months, detach_partition, ensure_partitions, get_dependent_tables, is_partitioned, list_partitions,
+    month_start,
+)
+
+
+class Command(BaseCommand):
+    help = "Создаёт будущие месячные секции таблицы тревог и отсоединяет старые (PostgreSQL)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ahead", type=int, default=settings.ALERT_PARTITIONS_AHEAD,
+                            help="На сколько месяцев вперёд создать секции")
+        parser.add_argument("--keep-months", type=int, default=None,
+                            help="Отсоединить секции старше указанного числа месяцев (по умолчанию не отсоединять)")
+        parser.add_argument("--drop", action="store_true", help="Удалять отсоединённые секции")
+        parser.add_argument("--list", action="store_true", help="Вывести список секций")
+
+    def handle(self, *args, **options):
+        table = Alert._meta.db_table
+        if connection.vendor != "postgresql":
+            raise CommandError("Секционирование таблицы тревог поддерживается только в PostgreSQL.")
+        with connection.cursor() as cursor:
+            if not is_partitioned(cursor, table):
+                raise CommandError(f"Таблица {table} не секционирована, примените миграции.")
+
+        current = month_start(datetime.now(timezone.utc))
+        with transaction.atomic(), connection.cursor() as cursor:
+            for name in ensure_partitions(cursor, table, current, add_months(current, options["ahead"])):
+                self.stdout.write(f"Создана секция {name}")
+
+        if options["keep_months"] is not None:
+            boundary = add_months(current, -options["keep_months"])
+            with connection.cursor() as cursor:
+                old = [name for name, _, end in list_partitions(cursor, table) if end is not None and end <= boundary]
+            for name in old:
+                self.detach(table, name, options["drop"])
+
+        if options["list"]:
+            with connection.cursor() as cursor:
+                for name, start, end in list_partitions(cursor, table):
+                    cursor.execute(f'SELECT count(*) FROM "{name}"')
+                    bounds = f"{start:%Y-%m-%d} — {end:%Y-%m-%d}" if start else "DEFAULT"
+                    self.stdout.write(f"{name}: {bounds}, строк {cursor.fetchone()[0]}")
+
+    def detach(self, table, name, drop):
+        """
+        Отсоединяет секцию вместе со ссылками на её тревоги. Медиафайлы тревог освобождаются
+        только при удалении секции: отсоединённая таблица по-прежнему ссылается на них.
+        """
+        columns = ", ".join(f'"{Alert._meta.get_field(field).column}"' for field in Alert.MEDIA_FIELDS)
+        with transaction.atomic(), connection.cursor() as cursor:
+            if drop:
+                cursor.execute(f'SELECT {columns} FROM "{name}"')
+                MediaBlob.objects.release(media for row in cursor.fetchall() for media in row)
+            detach_partition(cursor, table, name, get_dependent_tables(Alert), drop=drop)
+        self.stdout.write(f"Секция {name} {'удалена' if drop else 'отсоединена'}")
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from algorithms.models import AlertRollup
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает часовые и суточные агрегаты тревог (AlertRollup) по таблице тревог"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            AlertRollup.objects.rebuild()
+        self.stdout.write(f"Агрегатов: {AlertRollup.objects.count()}")
@@ -0,0 +1,22 @@
+from visionaibox.metrics import Counter, Histogram
+
+ALERTS = Counter(
+    "visionaibox_alerts_total", "Тревоги AIBox по компании, устройству, алгоритму и результату приёма",
+    ("company", "device", "alg", "outcome"),
+)
+STAGE_SECONDS = Histogram(
+    "visionaibox_alert_stage_seconds",
+    "Время этапов обработки тревог: path — ingest/bulk/action/bulk_action/media, stage — этап",
+    ("path", "stage"),
+)
+
+
+def get_alert_labels(data):
+    """Метки ALERTS (кроме результата) из validated_data AlertCreateSerializer — до `save()`, который их забирает."""
+    device = data["device"]
+    alg = data.get("alg")
+    return device.company_id, device.aibox_id, alg["name"] if alg else ""
+
+
+def count_alert(labels, outcome):
+    ALERTS.inc(*labels, outcome)
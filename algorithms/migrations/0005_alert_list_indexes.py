@@ -0,0 +1,41 @@
+# Generated by Django 5.1.5 on 2026-10-18 14:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('algorithms', '0004_remove_alert_image_url'),
+        ('companies', '0001_initial'),
+        ('devices', '0002_rename_description_device_desc_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['-alert_time', '-id'], name='alert_time_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['company', '-alert_time', '-id'], name='alert_company_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['device', '-alert_time', '-id'], name='alert_device_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['source', '-alert_time', '-id'], name='alert_source_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['alg', '-alert_time', '-id'], name='alert_alg_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['status', '-alert_time', '-id'], name='alert_status_time_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.1.5 on 2026-10-18 14:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDay, TruncHour
+
+
+def backfill_rollups(apps, schema_editor):
+    Alert = apps.get_model("algorithms", "Alert")
+    AlertRollup = apps.get_model("algorithms", "AlertRollup")
+    for granularity, trunc in (("hour", TruncHour), ("day", TruncDay)):
+        rows = (
+            Alert.objects
+            .annotate(bucket=trunc("alert_time"))
+            .values("bucket", "company_id", "device_id", "source_id", "alg_id", "status")
+            .annotate(count=Count("id"))
+            .order_by()
+        )
+        AlertRollup.objects.bulk_create(
+            (AlertRollup(granularity=granularity, **row) for row in rows.iterator()), batch_size=1000
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('algorithms', '0005_alert_list_indexes'),
+        ('companies', '0001_initial'),
+        ('devices', '0002_rename_description_device_desc_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Час'), ('day', 'Сутки')], help_text='Размер бакета', max_length=4)),
+                ('bucket', models.DateTimeField(help_text='Начало бакета')),
+                ('status', models.CharField(choices=[('pending', 'Ожидание'), ('confirmed', 'Подтверждено'), ('rejected', 'Отклонено')], help_text='Статус тревоги', max_length=10)),
+                ('count', models.IntegerField(default=0, help_text='Количество тревог')),
+                ('alg', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='algorithms.algorithm')),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='companies.company')),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='devices.device')),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='devices.source')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['granularity', 'bucket'], name='rollup_granularity_bucket_idx'), models.Index(fields=['granularity', 'company', 'bucket'], name='rollup_company_bucket_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
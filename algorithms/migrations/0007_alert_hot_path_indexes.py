@@ -0,0 +1,30 @@
+# Generated by Django 5.1.5 on 2026-10-18 14:55
+
+import django.contrib.postgres.indexes
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('algorithms', '0006_alertrollup'),
+        ('companies', '0001_initial'),
+        ('devices', '0004_device_source_unique'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='alert',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['alert_time'], name='alert_time_brin'),
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['company', '-alert_time'], name='alert_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alertrollup',
+            index=models.Index(fields=['bucket', 'device', 'source', 'granularity'], name='rollup_key_idx'),
+        ),
+    ]
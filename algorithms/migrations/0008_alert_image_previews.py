@@ -0,0 +1,36 @@
+# Generated by Django 5.1.5 on 2026-10-18 15:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('algorithms', '0007_alert_hot_path_indexes'),
+        ('companies', '0001_initial'),
+        ('devices', '0004_device_source_unique'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alert',
+            name='image_preview',
+            field=models.ImageField(blank=True, help_text='Уменьшенное изображение для просмотра и бота', null=True, upload_to='alerts/previews/'),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='image_thumbnail',
+            field=models.ImageField(blank=True, help_text='Миниатюра изображения для списков', null=True, upload_to='alerts/thumbnails/'),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='previews_generated_at',
+            field=models.DateTimeField(blank=True, help_text='Когда обработано изображение (превью созданы или файл не читается)', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(condition=models.Q(('image__gt', ''), ('previews_generated_at__isnull', True)), fields=['id'], name='alert_previews_pending_idx'),
+        ),
+    ]
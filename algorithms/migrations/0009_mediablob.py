@@ -0,0 +1,47 @@
+# Generated by Django 5.1.5 on 2026-10-18 15:04
+
+import algorithms.storage
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('algorithms', '0008_alert_image_previews'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='alert',
+            name='image',
+            field=models.ImageField(blank=True, help_text='Изображение тревоги (если есть)', null=True, storage=algorithms.storage.get_alert_media_storage, upload_to='alerts/images/'),
+        ),
+        migrations.AlterField(
+            model_name='alert',
+            name='image_preview',
+            field=models.ImageField(blank=True, help_text='Уменьшенное изображение для просмотра и бота', null=True, storage=algorithms.storage.get_alert_media_storage, upload_to='alerts/previews/'),
+        ),
+        migrations.AlterField(
+            model_name='alert',
+            name='image_thumbnail',
+            field=models.ImageField(blank=True, help_text='Миниатюра изображения для списков', null=True, storage=algorithms.storage.get_alert_media_storage, upload_to='alerts/thumbnails/'),
+        ),
+        migrations.AlterField(
+            model_name='alert',
+            name='video',
+            field=models.FileField(blank=True, help_text='Видео тревоги (если есть)', null=True, storage=algorithms.storage.get_alert_media_storage, upload_to='alerts/videos/'),
+        ),
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Путь файла в хранилище', max_length=255, unique=True)),
+                ('refcount', models.IntegerField(default=0, help_text='Количество ссылок из тревог')),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now, help_text='Время последнего изменения счётчика')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('refcount__lte', 0)), fields=['updated_at'], name='mediablob_unused_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.5 on 2026-10-18 15:06
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('algorithms', '0009_mediablob'),
+        ('companies', '0001_initial'),
+        ('devices', '0004_device_source_unique'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertRetentionPolicy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('retention_days', models.PositiveIntegerField(blank=True, help_text='Через сколько дней тревоги удаляются из базы (пусто — хранить всегда)', null=True)),
+                ('media_retention_days', models.PositiveIntegerField(blank=True, help_text='Через сколько дней удаляются изображения и видео (пусто — вместе с тревогой)', null=True)),
+                ('archive', models.BooleanField(default=True, help_text='Сохранять удаляемые тревоги в архив NDJSON')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(condition=models.Q(('image__gt', ''), ('video__gt', ''), _connector='OR'), fields=['company', 'alert_time'], name='alert_media_time_idx'),
+        ),
+        migrations.AddField(
+            model_name='alertretentionpolicy',
+            name='company',
+            field=models.OneToOneField(help_text='Компания', on_delete=django.db.models.deletion.CASCADE, related_name='alert_retention_policy', to='companies.company'),
+        ),
+    ]
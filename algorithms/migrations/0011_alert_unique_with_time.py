@@ -0,0 +1,26 @@
+# Generated by Django 5.1.5 on 2026-10-18 15:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('algorithms', '0010_alert_retention_policy'),
+        ('companies', '0001_initial'),
+        ('devices', '0004_device_source_unique'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='alert',
+            name='aibox_alert_id',
+            field=models.CharField(max_length=255),
+        ),
+        migrations.AddConstraint(
+            model_name='alert',
+            constraint=models.UniqueConstraint(fields=('aibox_alert_id', 'alert_time'), name='alert_aibox_id_time_uniq'),
+        ),
+    ]
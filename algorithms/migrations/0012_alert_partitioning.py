@@ -0,0 +1,23 @@
+from django.db import migrations
+
+from algorithms.partitions import convert_to_partitioned
+
+
+def partition_alerts(apps, schema_editor):
+    # Секционирование есть только в PostgreSQL, на других СУБД таблица остаётся обычной
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        convert_to_partitioned(cursor, apps.get_model("algorithms", "Alert")._meta.db_table)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('algorithms', '0011_alert_unique_with_time'),
+        ('tgbot', '0002_botnotification_alert_no_db_constraint'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_alerts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.5 on 2026-10-18 15:20
+
+import algorithms.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('algorithms', '0012_alert_partitioning'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alert',
+            name='hit_count',
+            field=models.PositiveIntegerField(default=1, help_text='Количество срабатываний (с учётом подавленных повторов)'),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='last_hit_at',
+            field=models.DateTimeField(blank=True, help_text='Время последнего подавленного повтора', null=True),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='last_image',
+            field=models.ImageField(blank=True, help_text='Последний кадр повторов, слитых в тревогу', null=True, storage=algorithms.storage.get_alert_media_storage, upload_to='alerts/images/'),
+        ),
+        migrations.AddField(
+            model_name='algorithm',
+            name='suppression_window',
+            field=models.PositiveIntegerField(blank=True, help_text='Окно подавления повторов тревог, с (пусто — ALERT_SUPPRESSION_WINDOW, 0 — не подавлять)', null=True),
+        ),
+    ]
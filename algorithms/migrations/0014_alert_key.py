@@ -0,0 +1,49 @@
+# Generated by Django 5.1.5 on 2026-10-18 15:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_alert_keys(apps, schema_editor):
+    """
+    Переносит идентификаторы существующих тревог в AlertKey. Если после 0011 один
+    `aibox_alert_id` успел попасть в несколько тревог, ключ получает самая ранняя из них.
+    """
+    Alert = apps.get_model("algorithms", "Alert")
+    AlertKey = apps.get_model("algorithms", "AlertKey")
+    batch = []
+    rows = Alert.objects.order_by("id").values_list("aibox_alert_id", "id", "alert_time")
+    for aibox_alert_id, alert_id, alert_time in rows.iterator(chunk_size=5000):
+        batch.append(AlertKey(aibox_alert_id=aibox_alert_id, alert_id=alert_id, alert_time=alert_time))
+        if len(batch) >= 5000:
+            AlertKey.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    AlertKey.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('algorithms', '0013_alert_repeat_suppression'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('aibox_alert_id', models.CharField(help_text='Идентификатор тревоги AIBox', max_length=255, unique=True)),
+                ('alert_time', models.DateTimeField(help_text='Время тревоги (ключ секции)')),
+                ('alert', models.ForeignKey(db_constraint=False, help_text='Тревога, в которую принят идентификатор', on_delete=django.db.models.deletion.CASCADE, related_name='keys', to='algorithms.alert')),
+            ],
+        ),
+        migrations.RunPython(fill_alert_keys, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='alert',
+            name='alert_aibox_id_time_uniq',
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['aibox_alert_id'], name='alert_aibox_id_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-18 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('algorithms', '0014_alert_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alert',
+            name='previews_claimed_until',
+            field=models.DateTimeField(blank=True, help_text='До какого момента изображение обрабатывает воркер превью', null=True),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.5 on 2026-10-18 16:01
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+KEY_FIELDS = ("granularity", "bucket", "company_id", "device_id", "source_id", "alg_id", "status")
+
+
+def merge_duplicate_rollups(apps, schema_editor):
+    """Объединяет строки агрегатов с одним ключом (параллельные вставки до ON CONFLICT): счётчики суммируются."""
+    AlertRollup = apps.get_model("algorithms", "AlertRollup")
+    duplicates = (
+        AlertRollup.objects.values(*KEY_FIELDS)
+        .annotate(keep_id=Min("id"), total=Sum("count"), rows=Count("id"))
+        .filter(rows__gt=1)
+    )
+    for row in duplicates:
+        key = {name: row[name] for name in KEY_FIELDS}
+        AlertRollup.objects.filter(**key).exclude(id=row["keep_id"]).delete()
+        AlertRollup.objects.filter(id=row["keep_id"]).update(count=row["total"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('algorithms', '0015_alert_previews_claimed_until'),
+        ('companies', '0001_initial'),
+        ('devices', '0004_device_source_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_rollups, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='alertrollup',
+            constraint=models.UniqueConstraint(fields=('bucket', 'device', 'source', 'granularity', 'company', 'alg', 'status'), name='rollup_key_uniq', nulls_distinct=False),
+        ),
+        migrations.RemoveIndex(
+            model_name='alertrollup',
+            name='rollup_key_idx',
+        ),
+    ]
@@ -1,19 +1,75 @@
-from django.db import models
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.contrib.postgres.indexes import BrinIndex
+from django.db import connection, models, transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import TruncDay, TruncHour
 from devices.models import Device,Source
 from companies.models import Company
 from users.models import User
-from django.utils.timezone import now
+from django.utils.timezone import now, localtime, is_naive, make_aware
+from .storage import get_alert_media_storage
 
 # Create your models here.
 class Algorithm(models.Model):
     key = models.CharField(max_length=255, unique=True, help_text="Уникальный ключ алгоритма")
     name = models.CharField(max_length=255, help_text="Название алгоритма")
     type = models.CharField(max_length=255, help_text="Тип алгоритма")
+    suppression_window = models.PositiveIntegerField(
+        null=True, blank=True,
+        help_text="Окно подавления повторов тревог, с (пусто — ALERT_SUPPRESSION_WINDOW, 0 — не подавлять)"
+    )
 
     def __str__(self):
         return f"{self.name} ({self.key})"
 
 
+class AlertQuerySet(models.QuerySet):
+    def set_status(self, status, user=None, limit=None):
+        """
+        Переводит ожидающие тревоги queryset (не более `limit` самых старых) в `status`:
+        строки блокируются (SELECT ... FOR UPDATE), затем обновляются одним UPDATE только колонок
+        статуса, пользователя и времени. Уже обработанные тревоги не меняются.
+        Возвращает обновлённые тревоги (только поля STATUS_FIELDS).
+        """
+        model = self.model
+        queryset = self.filter(status=model.STATUS_PENDING).select_for_update().only(*model.STATUS_FIELDS)
+        if limit:
+            queryset = queryset.order_by("alert_time", "id")[:limit]
+        with transaction.atomic():
+            alerts = list(queryset)
+            if not alerts:
+                return []
+            values = model.get_status_values(status, user)
+            model.objects.filter(pk__in=[alert.pk for alert in alerts]).update(**values)
+            for alert in alerts:
+                alert.set_status_values(values)
+            AlertRollup.objects.move_alerts_status(alerts, model.STATUS_PENDING, status)
+        return alerts
+
+    def delete(self, update_rollups=True):
+        """
+        Удаляет тревоги (связанные строки — каскадом Django). Медиафайлы удалённых тревог
+        освобождаются одним вызовом `MediaBlob.objects.release`, тревоги вычитаются из AlertRollup
+        одним запросом: обработчики post_delete (algorithms/signals.py) собирают имена файлов
+        в `deleted_media` и изменения счётчиков в `rollup_deltas`, а не применяют их по одной.
+        `update_rollups=False` — агрегаты не меняются: очистка по сроку хранения оставляет
+        статистику за удалённый период, а не учтённые в агрегатах тревоги вычитать не из чего.
+        """
+        self.deleted_media = []
+        self.rollup_deltas = Counter() if update_rollups else None
+        with transaction.atomic(using=self.db, savepoint=False):
+            result = super().delete()
+            MediaBlob.objects.release(self.deleted_media)
+            if self.rollup_deltas:
+                AlertRollup.objects.apply_deltas(self.rollup_deltas)
+        return result
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
 # Create your models here.
 class Alert(models.Model):
     STATUS_PENDING = "pending"
@@ -25,15 +81,30 @@ class Alert(models.Model):
         (STATUS_CONFIRMED, "Подтверждено"),
         (STATUS_REJECTED, "Отклонено"),
     ]
-    aibox_alert_id = models.CharField(max_length=255, unique=True)
+    MEDIA_FIELDS = ("image", "video", "image_thumbnail", "image_preview", "last_image")
+    # Поля, достаточные для смены статуса (условие UPDATE, ключ секции, счётчики AlertRollup, событие дашборда)
+    STATUS_FIELDS = ("alert_time", "company", "device", "source", "alg", "status", "confirmed_at", "rejected_at")
+    STATUS_ACTOR_FIELDS = {
+        STATUS_CONFIRMED: ("confirmed_by", "confirmed_at"),
+        STATUS_REJECTED: ("rejected_by", "rejected_at"),
+    }
+
+    aibox_alert_id = models.CharField(max_length=255)
     alert_time = models.DateTimeField()
     device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name="alerts", help_text="AIBox-устройство")
     source = models.ForeignKey(Source, on_delete=models.CASCADE, related_name="alerts", help_text="Источник (камера)")
     alg = models.ForeignKey(Algorithm, on_delete=models.SET_NULL, null=True, blank=True, related_name="alerts", help_text="Алгоритм, сработавший на тревогу")
     hazard_level = models.CharField(help_text="Уровень опасности", default='1')
     company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name="alerts", help_text="Компания, связанная с тревогой")
-    image = models.ImageField(upload_to="alerts/images/", null=True, blank=True, help_text="Изображение тревоги (если есть)")
-    video = models.FileField(upload_to="alerts/videos/", null=True, blank=True, help_text="Видео тревоги (если есть)")
+    image = models.ImageField(upload_to="alerts/images/", storage=get_alert_media_storage, null=True, blank=True, help_text="Изображение тревоги (если есть)")
+    video = models.FileField(upload_to="alerts/videos/", storage=get_alert_media_storage, null=True, blank=True, help_text="Видео тревоги (если есть)")
+    image_thumbnail = models.ImageField(upload_to="alerts/thumbnails/", storage=get_alert_media_storage, null=True, blank=True, help_text="Миниатюра изображения для списков")
+    image_preview = models.ImageField(upload_to="alerts/previews/", storage=get_alert_media_storage, null=True, blank=True, help_text="Уменьшенное изображение для просмотра и бота")
+    last_image = models.ImageField(upload_to="alerts/images/", storage=get_alert_media_storage, null=True, blank=True, help_text="Последний кадр повторов, слитых в тревогу")
+    hit_count = models.PositiveIntegerField(default=1, help_text="Количество срабатываний (с учётом подавленных повторов)")
+    last_hit_at = models.DateTimeField(null=True, blank=True, help_text="Время последнего подавленного повтора")
+    previews_generated_at = models.DateTimeField(null=True, blank=True, help_text="Когда обработано изображение (превью созданы или файл не читается)")
+    previews_claimed_until = models.DateTimeField(null=True, blank=True, help_text="До какого момента изображение обрабатывает воркер превью")
     reserved_data = models.JSONField(help_text="Дополнительные данные от AIBox", null=True, blank=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending", help_text="Статус тревоги")
     confirmed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="confirmed_alerts")
@@ -41,11 +112,39 @@ class Alert(models.Model):
     rejected_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="rejected_alerts")
     rejected_at = models.DateTimeField(null=True, blank=True, help_text="Время отклонения тревоги")
     executive_users = models.ManyToManyField(User, related_name="executive_alerts", blank=True, help_text="Учредители")
-    
+
+    objects = AlertQuerySet.as_manager()
+
+    class Meta:
+        # Глобальную уникальность `aibox_alert_id` обеспечивает AlertKey: в секционированной
+        # таблице уникальный индекс обязан включать alert_time (см. algorithms/partitions.py)
+        indexes = [
+            models.Index(fields=["aibox_alert_id"], name="alert_aibox_id_idx"),
+            # Индексы под keyset-пагинацию (alert_time, id) и фильтры списка тревог
+            models.Index(fields=["-alert_time", "-id"], name="alert_time_id_idx"),
+            models.Index(fields=["company", "-alert_time", "-id"], name="alert_company_time_idx"),
+            models.Index(fields=["device", "-alert_time", "-id"], name="alert_device_time_idx"),
+            models.Index(fields=["source", "-alert_time", "-id"], name="alert_source_time_idx"),
+            models.Index(fields=["alg", "-alert_time", "-id"], name="alert_alg_time_idx"),
+            models.Index(fields=["status", "-alert_time", "-id"], name="alert_status_time_idx"),
+            # Широкие диапазонные сканы по времени (статистика, архивация)
+            BrinIndex(fields=["alert_time"], name="alert_time_brin"),
+            # Очередь необработанных тревог компании
+            models.Index(fields=["company", "-alert_time"], condition=Q(status="pending"), name="alert_pending_idx"),
+            # Тревоги с медиафайлами — для удаления медиа по политике хранения
+            models.Index(fields=["company", "alert_time"], condition=Q(image__gt="") | Q(video__gt=""), name="alert_media_time_idx"),
+            # Очередь изображений, для которых ещё не созданы превью
+            models.Index(fields=["id"], condition=Q(previews_generated_at__isnull=True, image__gt=""), name="alert_previews_pending_idx"),
+        ]
+
 
     def __str__(self):
         return f"Alert {self.airbus_alert_id}"
     
+    def get_media_names(self):
+        """Имена файлов тревоги в хранилище (для учёта ссылок в `MediaBlob`)."""
+        return [getattr(self, field).name for field in self.MEDIA_FIELDS if getattr(self, field)]
+
     @property
     def is_pending(self):
         return self.status == self.STATUS_PENDING
@@ -58,30 +157,322 @@ class Alert(models.Model):
     def is_rejected(self):
         return self.status == self.STATUS_REJECTED
 
+    @classmethod
+    def get_status_values(cls, status, user=None):
+        by_field, at_field = cls.STATUS_ACTOR_FIELDS[status]
+        return {"status": status, by_field: user, at_field: now()}
+
+    def set_status_values(self, values):
+        for name, value in values.items():
+            setattr(self, name, value)
+
+    def set_status(self, status, user=None):
+        """
+        Переводит ожидающую тревогу в `status` одним условным UPDATE ... WHERE status = 'pending'
+        (только колонки статуса, пользователя и времени). Возвращает False, если тревога
+        уже обработана, в том числе параллельным запросом.
+        """
+        values = self.get_status_values(status, user)
+        updated = Alert.objects.filter(
+            pk=self.pk, alert_time=self.alert_time, status=self.STATUS_PENDING
+        ).update(**values)
+        if not updated:
+            return False
+        self.set_status_values(values)
+        AlertRollup.objects.move_status(self, self.STATUS_PENDING, status)
+        return True
+
     def confirm_alert(self, user=None):
         """Подтверждает тревогу и записывает время и пользователя, который подтвердил."""
-        self.status = self.STATUS_CONFIRMED
-        self.confirmed_by = user
-        print(user)
-        self.confirmed_at = now() 
-        self.save()
+        return self.set_status(self.STATUS_CONFIRMED, user)
 
     def reject_alert(self, user=None):
         """Отклоняет тревогу и записывает пользователя, который отклонил."""
-        self.status = self.STATUS_REJECTED
-        self.rejected_by = user
-        print(user)
-        self.rejected_at = now()
-        self.save()
+        return self.set_status(self.STATUS_REJECTED, user)
 
     def save(self, *args, **kwargs):
-        """Если `device` задан, автоматически устанавливаем `company`"""
+        """
+        Если `device` задан, автоматически устанавливаем `company`.
+        Новая тревога записывается в AlertKey в той же транзакции: повтор `aibox_alert_id`
+        (с любым `alert_time`) падает с IntegrityError, как при уникальном поле.
+        """
         if self.device and not self.company_id:
             self.company = self.device.company
-        super().save(*args, **kwargs)
+        adding = self._state.adding
+        update_fields = kwargs.get("update_fields")
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            if adding:
+                AlertKey.objects.create(aibox_alert_id=self.aibox_alert_id, alert=self, alert_time=self.alert_time)
+            elif update_fields is None or "alert_time" in update_fields:
+                AlertKey.objects.filter(alert_id=self.pk).update(alert_time=self.alert_time)
 
     def get_executive_users(self):
         return list(self.executive_users.values_list("id", flat=True))
 
     def __str__(self):
         return f"Тревога {self.aibox_alert_id}"
+
+
+
+class AlertKeyManager(models.Manager):
+    def get_alert(self, aibox_alert_id):
+        """Тревога, принятая с этим `aibox_alert_id` (в том числе слитая как повтор), или None."""
+        key = self.filter(aibox_alert_id=aibox_alert_id).values_list("alert_id", "alert_time").first()
+        if key is None:
+            return None
+        alert_id, alert_time = key
+        return Alert.objects.filter(pk=alert_id, alert_time=alert_time).first()
+
+    def get_owners(self, aibox_alert_ids):
+        """{aibox_alert_id: id тревоги} для уже принятых идентификаторов."""
+        return dict(self.filter(aibox_alert_id__in=aibox_alert_ids).values_list("aibox_alert_id", "alert_id"))
+
+
+class AlertKey(models.Model):
+    """
+    Принятые идентификаторы тревог AIBox. Несекционированная таблица с уникальным
+    `aibox_alert_id`: повтор тревоги определяется независимо от её `alert_time`.
+    `alert_time` — ключ секции тревоги, чтобы читать её без обхода всех секций.
+    Идентификаторы повторов, слитых в тревогу (algorithms/suppression.py), ссылаются на неё же.
+    """
+    aibox_alert_id = models.CharField(max_length=255, unique=True, help_text="Идентификатор тревоги AIBox")
+    # Таблица тревог секционирована, внешний ключ на неё в БД невозможен (каскад выполняет Django)
+    alert = models.ForeignKey(Alert, on_delete=models.CASCADE, related_name="keys", db_constraint=False,
+                              help_text="Тревога, в которую принят идентификатор")
+    alert_time = models.DateTimeField(help_text="Время тревоги (ключ секции)")
+
+    objects = AlertKeyManager()
+
+    def __str__(self):
+        return self.aibox_alert_id
+
+
+def get_bucket_starts(value):
+    """Начало часового и суточного бакета (в часовом поясе TIME_ZONE) для момента времени."""
+    if is_naive(value):
+        value = make_aware(value)
+    hour = localtime(value).replace(minute=0, second=0, microsecond=0)
+    return {AlertRollup.GRANULARITY_HOUR: hour, AlertRollup.GRANULARITY_DAY: hour.replace(hour=0)}
+
+
+class AlertRollupManager(models.Manager):
+    KEY_FIELDS = ("granularity", "bucket", "company_id", "device_id", "source_id", "alg_id", "status")
+
+    def get_deltas(self, alert, delta=1, status=None):
+        """Изменения счётчиков (по ключу бакета) от одной тревоги."""
+        return Counter({
+            (granularity, bucket, alert.company_id, alert.device_id, alert.source_id, alert.alg_id,
+             status or alert.status): delta
+            for granularity, bucket in get_bucket_starts(alert.alert_time).items()
+        })
+
+    def apply_deltas(self, deltas):
+        """
+        Применяет изменения счётчиков одним запросом INSERT ... ON CONFLICT DO UPDATE:
+        строка ключа создаётся или увеличивается атомарно, поэтому параллельные приёмы
+        не создают вторую строку с тем же ключом. Строки идут в порядке ключа, чтобы
+        параллельные пакеты блокировали их в одном порядке (без взаимных блокировок).
+        """
+        rows = sorted(
+            ((key, delta) for key, delta in deltas.items() if delta),
+            key=lambda item: tuple((value is None, value) for value in item[0]),
+        )
+        if not rows:
+            return
+        table = self.model._meta.db_table
+        columns = ", ".join(self.model._meta.get_field(name).column for name in self.KEY_FIELDS)
+        row = f"({', '.join(['%s'] * (len(self.KEY_FIELDS) + 1))})"
+        params = [value for key, delta in rows for value in (*key, delta)]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}, count) VALUES {', '.join([row] * len(rows))} "
+                f"ON CONFLICT ({columns}) DO UPDATE SET count = {table}.count + EXCLUDED.count",
+                params,
+            )
+
+    def add_alerts(self, alerts):
+        """Учитывает новые тревоги."""
+        deltas = Counter()
+        for alert in alerts:
+            deltas.update(self.get_deltas(alert))
+        self.apply_deltas(deltas)
+
+    def rebuild(self):
+        """Полностью пересчитывает агрегаты по таблице тревог."""
+        self.all().delete()
+        for granularity, trunc in ((self.model.GRANULARITY_HOUR, TruncHour), (self.model.GRANULARITY_DAY, TruncDay)):
+            rows = (
+                Alert.objects
+                .annotate(bucket=trunc("alert_time"))
+                .values("bucket", "company_id", "device_id", "source_id", "alg_id", "status")
+                .annotate(count=Count("id"))
+                .order_by()
+            )
+            self.bulk_create((self.model(granularity=granularity, **row) for row in rows.iterator()),
+                             batch_size=1000)
+
+    def detach_algorithm(self, alg_id):
+        """
+        Переносит счётчики алгоритма в строки без алгоритма, как его тревоги при удалении (SET_NULL).
+        Просто обнулить `alg` нельзя: строка без алгоритма с тем же ключом может уже быть.
+        """
+        alg_index = self.KEY_FIELDS.index("alg_id")
+        rows = self.filter(alg_id=alg_id)
+        deltas = Counter()
+        for *key, count in rows.values_list(*self.KEY_FIELDS, "count"):
+            key[alg_index] = None
+            deltas[tuple(key)] += count
+        rows.delete()
+        self.apply_deltas(deltas)
+
+    def move_status(self, alert, old_status, new_status):
+        """Переносит тревогу из счётчика одного статуса в другой."""
+        self.move_alerts_status([alert], old_status, new_status)
+
+    def move_alerts_status(self, alerts, old_status, new_status):
+        """Переносит тревоги из счётчиков одного статуса в другой (изменения по бакетам суммируются)."""
+        if old_status == new_status:
+            return
+        deltas = Counter()
+        for alert in alerts:
+            deltas.update(self.get_deltas(alert, -1, old_status))
+            deltas.update(self.get_deltas(alert, 1, new_status))
+        self.apply_deltas(deltas)
+
+
+class AlertRollup(models.Model):
+    """
+    Предагрегированное количество тревог за час/сутки по компании, устройству, источнику, алгоритму и статусу.
+    Удаление тревог (`delete()` тревоги или queryset, админка) вычитает их из агрегатов; очистка по сроку
+    хранения и отсоединение секций — нет, статистика за прошлые периоды остаётся. Агрегаты удалённых
+    устройства, источника или компании удаляются каскадом, удалённого алгоритма — переходят в строки без алгоритма.
+    """
+    GRANULARITY_HOUR = "hour"
+    GRANULARITY_DAY = "day"
+
+    GRANULARITY_CHOICES = [
+        (GRANULARITY_HOUR, "Час"),
+        (GRANULARITY_DAY, "Сутки"),
+    ]
+    granularity = models.CharField(max_length=4, choices=GRANULARITY_CHOICES, help_text="Размер бакета")
+    bucket = models.DateTimeField(help_text="Начало бакета")
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name="+")
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name="+")
+    source = models.ForeignKey(Source, on_delete=models.CASCADE, related_name="+")
+    alg = models.ForeignKey(Algorithm, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    status = models.CharField(max_length=10, choices=Alert.STATUS_CHOICES, help_text="Статус тревоги")
+    count = models.IntegerField(default=0, help_text="Количество тревог")
+
+    objects = AlertRollupManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["granularity", "bucket"], name="rollup_granularity_bucket_idx"),
+            models.Index(fields=["granularity", "company", "bucket"], name="rollup_company_bucket_idx"),
+        ]
+        constraints = [
+            # Одна строка на ключ: по нему же работает ON CONFLICT в `apply_deltas` (alg может быть NULL)
+            models.UniqueConstraint(
+                fields=["bucket", "device", "source", "granularity", "company", "alg", "status"],
+                name="rollup_key_uniq", nulls_distinct=False,
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.granularity} {self.bucket}: {self.count}"
+
+
+class AlertRetentionPolicy(models.Model):
+    """Политика хранения тревог компании (см. `python manage.py apply_alert_retention`)."""
+    company = models.OneToOneField(Company, on_delete=models.CASCADE, related_name="alert_retention_policy",
+                                   help_text="Компания")
+    retention_days = models.PositiveIntegerField(null=True, blank=True,
+                                                 help_text="Через сколько дней тревоги удаляются из базы (пусто — хранить всегда)")
+    media_retention_days = models.PositiveIntegerField(null=True, blank=True,
+                                                       help_text="Через сколько дней удаляются изображения и видео (пусто — вместе с тревогой)")
+    archive = models.BooleanField(default=True, help_text="Сохранять удаляемые тревоги в архив NDJSON")
+
+    def __str__(self):
+        return f"{self.company}: {self.retention_days or '∞'} дн."
+
+
+class MediaBlobManager(models.Manager):
+    def acquire(self, names):
+        """Увеличивает счётчики ссылок на файлы, для новых файлов создаёт записи."""
+        counts = Counter(name for name in names if name)
+        if not counts:
+            return
+        self.bulk_create([self.model(name=name) for name in counts], ignore_conflicts=True)
+        by_delta = defaultdict(list)
+        for name, count in counts.items():
+            by_delta[count].append(name)
+        for delta, group in by_delta.items():
+            self.filter(name__in=group).update(refcount=F("refcount") + delta, updated_at=now())
+
+    def touch(self, name):
+        """
+        Отмечает, что приём тревоги переиспользует файл: обновляет `updated_at`, строка
+        остаётся заблокированной до конца транзакции. Возвращает False, если записи нет.
+        """
+        return bool(self.filter(name=name).update(updated_at=now()))
+
+    def release(self, names):
+        """
+        Уменьшает счётчики ссылок; файлы без ссылок удаляет `collect_garbage` после паузы.
+        Файлы без записи (сохранённые до хранилища по содержимому) удаляются сразу после коммита.
+        """
+        counts = Counter(name for name in names if name)
+        if not counts:
+            return
+        by_delta = defaultdict(list)
+        for name, count in counts.items():
+            by_delta[count].append(name)
+        for delta, group in by_delta.items():
+            self.filter(name__in=group).update(refcount=F("refcount") - delta, updated_at=now())
+
+        tracked = set(self.filter(name__in=counts).values_list("name", flat=True))
+        untracked = [name for name in counts if name not in tracked]
+        if untracked:
+            storage = get_alert_media_storage()
+            transaction.on_commit(lambda: [storage.delete(name) for name in untracked])
+
+    def collect_garbage(self, grace, batch_size=1000):
+        """
+        Удаляет файлы, которые дольше `grace` секунд не использовались: счётчик ссылок
+        нулевой, и ни один приём тревоги не находил файл в хранилище (`touch`).
+        Записи, заблокированные приёмом, пропускаются. Файлы удаляются до фиксации
+        транзакции, пока строки заблокированы: приём, ждущий блокировку, после неё
+        не найдёт записи и запишет файл заново. Возвращает количество удалённых файлов.
+        """
+        storage = get_alert_media_storage()
+        with transaction.atomic():
+            blobs = dict(
+                self.select_for_update(skip_locked=True)
+                .filter(refcount__lte=0, updated_at__lt=now() - timedelta(seconds=grace))
+                .values_list("id", "name")[:batch_size]
+            )
+            if not blobs:
+                return 0
+            self.filter(id__in=blobs).delete()
+            for name in blobs.values():
+                storage.delete(name)
+        return len(blobs)
+
+
+class MediaBlob(models.Model):
+    """Файл в хранилище по содержимому (см. `ContentAddressedStorage`) и число ссылок на него."""
+    name = models.CharField(max_length=255, unique=True, help_text="Путь файла в хранилище")
+    refcount = models.IntegerField(default=0, help_text="Количество ссылок из тревог")
+    updated_at = models.DateTimeField(default=now, help_text="Время последнего изменения счётчика")
+
+    objects = MediaBlobManager()
+
+    class Meta:
+        indexes = [
+            # Кандидаты на удаление для `collect_garbage`
+            models.Index(fields=["updated_at"], condition=Q(refcount__lte=0), name="mediablob_unused_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount})"
@@ -0,0 +1,79 @@
+from datetime import datetime
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+
+
+class AlertCursorPagination(CursorPagination):
+    """
+    Keyset-пагинация тревог по (alert_time, id): стоимость страницы не зависит от размера таблицы.
+    В CursorPagination DRF позиция курсора — только первое поле сортировки (плюс смещение среди
+    равных), и при листании назад тревоги с одинаковым alert_time перемешиваются между страницами.
+    Здесь позиция — пара (alert_time, id), она уникальна, смещение не нужно.
+    """
+    ordering = ("-alert_time", "-id")
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 500
+
+    def _get_position_from_instance(self, instance, ordering):
+        if isinstance(instance, dict):
+            alert_time, pk = instance["alert_time"], instance["id"]
+        else:
+            alert_time, pk = instance.alert_time, instance.pk
+        return f"{alert_time.isoformat()}_{pk}"
+
+    def parse_position(self, position):
+        try:
+            alert_time, pk = position.rsplit("_", 1)
+            return datetime.fromisoformat(alert_time), int(pk)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        current_position = self.cursor.position if self.cursor is not None else None
+
+        # Назад листаем в обратной сортировке от позиции к более новым тревогам
+        if reverse:
+            queryset = queryset.order_by("alert_time", "id")
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        if current_position is not None:
+            alert_time, pk = self.parse_position(current_position)
+            # Условие по одному alert_time — диапазон индекса, равные время сравниваются по id
+            if reverse:
+                queryset = queryset.filter(alert_time__gte=alert_time).exclude(alert_time=alert_time, id__lte=pk)
+            else:
+                queryset = queryset.filter(alert_time__lte=alert_time).exclude(alert_time=alert_time, id__gte=pk)
+
+        # Лишняя строка показывает, есть ли следующая страница
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_following_position = len(results) > len(self.page)
+        following_position = (
+            self._get_position_from_instance(results[-1], self.ordering) if has_following_position else None
+        )
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = current_position is not None
+            self.has_previous = has_following_position
+            self.next_position = current_position
+            self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = current_position is not None
+            self.next_position = following_position
+            self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.http.multipartparser import MultiPartParserError
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, FileUploadParser
+
+from visionaibox.fastjson import loads
+
+
+class NDJSONParser(BaseParser):
+    """Парсер NDJSON: одна тревога AIBox в каждой строке, результат — список."""
+    media_type = "application/x-ndjson"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        items = []
+        if stream is None:
+            return items
+        for number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(loads(line.decode(encoding)))
+            except ValueError as exc:
+                raise ParseError(f"NDJSON parse error (line {number}): {exc}")
+        return items
+
+
+class AlertMediaUploadParser(FileUploadParser):
+    """
+    Загрузка медиафайла тревоги «сырым» телом запроса (image/jpeg, video/mp4,
+    application/octet-stream). Файл потоково пишется обработчиками загрузки,
+    имя файла в Content-Disposition не обязательно.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return super().parse(stream, media_type, parser_context)
+        except MultiPartParserError as exc:
+            raise ParseError(str(exc))
+
+    def get_filename(self, stream, media_type, parser_context):
+        return super().get_filename(stream, media_type, parser_context) or "upload"
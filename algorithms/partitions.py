@@ -0,0 +1,179 @@
+"""
+Помесячное секционирование таблицы тревог в PostgreSQL (PARTITION BY RANGE (alert_time)).
+
+Первичный ключ секционированной таблицы — (id, alert_time): PostgreSQL требует, чтобы ключ
+секционирования входил во все уникальные ограничения. Поэтому глобальная уникальность
+`aibox_alert_id` вынесена в несекционированную таблицу AlertKey.
+Внешние ключи на тревогу (M2M учредителей, уведомления бота) на уровне БД не создаются,
+каскадное удаление выполняет Django. Строки вне созданных секций попадают в секцию DEFAULT.
+"""
+import re
+from datetime import datetime, timezone
+
+SEQUENCE_SUFFIX = "_id_seq"
+
+
+def month_start(value):
+    value = value.astimezone(timezone.utc)
+    return datetime(value.year, value.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(value, months):
+    month = value.month - 1 + months
+    return value.replace(year=value.year + month // 12, month=month % 12 + 1)
+
+
+def partition_name(table, month):
+    return f"{table}_p{month:%Y_%m}"
+
+
+def default_partition_name(table):
+    return f"{table}_default"
+
+
+def is_partitioned(cursor, table):
+    cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)", [table])
+    return cursor.fetchone() is not None
+
+
+def list_partitions(cursor, table):
+    """Секции таблицы: [(имя, начало, конец)], для секции DEFAULT начало и конец — None."""
+    cursor.execute(
+        """
+        SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+        FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = to_regclass(%s)
+        ORDER BY child.relname
+        """,
+        [table],
+    )
+    partitions = []
+    for name, bound in cursor.fetchall():
+        values = re.findall(r"'([^']+)'", bound)
+        if len(values) == 2:
+            start, end = (datetime.fromisoformat(value).astimezone(timezone.utc) for value in values)
+        else:
+            start = end = None
+        partitions.append((name, start, end))
+    return partitions
+
+
+def create_partition(cursor, table, month):
+    """
+    Создаёт секцию за месяц `month`, если её ещё нет. Строки этого месяца,
+    попавшие ранее в секцию DEFAULT, переносятся в новую секцию. Возвращает True, если создана.
+    """
+    name = partition_name(table, month)
+    cursor.execute("SELECT to_regclass(%s)", [name])
+    if cursor.fetchone()[0] is not None:
+        return False
+    start, end = month, add_months(month, 1)
+    default = default_partition_name(table)
+    cursor.execute(f'CREATE TEMPORARY TABLE "{name}_moved" (LIKE "{table}")')
+    cursor.execute(
+        f'WITH moved AS (DELETE FROM "{default}" WHERE alert_time >= %s AND alert_time < %s RETURNING *) '
+        f'INSERT INTO "{name}_moved" SELECT * FROM moved',
+        [start, end],
+    )
+    cursor.execute(f'CREATE TABLE "{name}" PARTITION OF "{table}" FOR VALUES FROM (%s) TO (%s)', [start, end])
+    cursor.execute(f'INSERT INTO "{table}" SELECT * FROM "{name}_moved"')
+    cursor.execute(f'DROP TABLE "{name}_moved"')
+    return True
+
+
+def ensure_partitions(cursor, table, first_month, last_month):
+    """Создаёт недостающие секции с `first_month` по `last_month` включительно. Возвращает имена созданных."""
+    created = []
+    month = month_start(first_month)
+    while month <= last_month:
+        if create_partition(cursor, table, month):
+            created.append(partition_name(table, month))
+        month = add_months(month, 1)
+    return created
+
+
+def get_dependent_tables(model):
+    """Таблицы со ссылками на тревогу, которые удаляются вместе с ней: [(таблица, колонка)]."""
+    dependents = [
+        (field.remote_field.through._meta.db_table, field.m2m_column_name())
+        for field in model._meta.many_to_many
+    ]
+    dependents += [
+        (relation.related_model._meta.db_table, relation.field.column)
+        for relation in model._meta.related_objects
+        if not relation.many_to_many
+    ]
+    return dependents
+
+
+def detach_partition(cursor, table, name, dependents, drop=False):
+    """
+    Отсоединяет секцию: удаляет ссылающиеся на её тревоги строки `dependents`
+    ([(таблица, колонка)]) и выполняет DETACH PARTITION, при `drop` — удаляет таблицу.
+    """
+    for dependent_table, column in dependents:
+        cursor.execute(f'DELETE FROM "{dependent_table}" WHERE "{column}" IN (SELECT id FROM "{name}")')
+    cursor.execute(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"')
+    if drop:
+        cursor.execute(f'DROP TABLE "{name}"')
+
+
+def convert_to_partitioned(cursor, table, months_ahead=3, months_back=24):
+    """
+    Превращает обычную таблицу тревог в секционированную по месяцам: переносит данные,
+    ограничения, индексы и последовательность id. Внешние ключи других таблиц на неё удаляются.
+    Секции создаются не раньше чем за `months_back` месяцев, более старые строки — в DEFAULT.
+    """
+    if is_partitioned(cursor, table):
+        return
+    old = f"{table}_unpartitioned"
+    cursor.execute(f'ALTER TABLE "{table}" RENAME TO "{old}"')
+
+    # Индексы без ограничений (ограничения переносятся отдельно)
+    cursor.execute(
+        """
+        SELECT pg_get_indexdef(i.indexrelid) FROM pg_index i
+        WHERE i.indrelid = to_regclass(%s)
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid)
+        """,
+        [old],
+    )
+    indexes = [row[0] for row in cursor.fetchall()]
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = to_regclass(%s) AND contype IN ('u', 'f', 'c')",
+        [old],
+    )
+    constraints = cursor.fetchall()
+    cursor.execute(
+        "SELECT conrelid::regclass::text, conname FROM pg_constraint WHERE confrelid = to_regclass(%s)",
+        [old],
+    )
+    for referencing_table, name in cursor.fetchall():
+        cursor.execute(f'ALTER TABLE {referencing_table} DROP CONSTRAINT "{name}"')
+
+    cursor.execute(
+        f'CREATE TABLE "{table}" (LIKE "{old}" INCLUDING DEFAULTS INCLUDING STORAGE) PARTITION BY RANGE (alert_time)'
+    )
+    cursor.execute(f'CREATE TABLE "{default_partition_name(table)}" PARTITION OF "{table}" DEFAULT')
+    cursor.execute(f'SELECT min(alert_time), max(id) FROM "{old}"')
+    first_time, max_id = cursor.fetchone()
+    current = month_start(datetime.now(timezone.utc))
+    first_month = add_months(current, -months_back)
+    if first_time:
+        first_month = max(first_month, month_start(first_time))
+    ensure_partitions(cursor, table, first_month, add_months(current, months_ahead))
+    cursor.execute(f'INSERT INTO "{table}" SELECT * FROM "{old}"')
+    cursor.execute(f'DROP TABLE "{old}"')
+
+    sequence = f"{table}{SEQUENCE_SUFFIX}"
+    cursor.execute(f'CREATE SEQUENCE "{sequence}" OWNED BY "{table}".id')
+    cursor.execute(f'ALTER TABLE "{table}" ALTER COLUMN id SET DEFAULT nextval(%s)', [sequence])
+    cursor.execute("SELECT setval(%s, %s, %s)", [sequence, max_id or 1, max_id is not None])
+
+    cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_pkey" PRIMARY KEY (id, alert_time)')
+    for name, definition in constraints:
+        cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{name}" {definition}')
+    for definition in indexes:
+        cursor.execute(re.sub(rf' ON (ONLY )?(\S+\.)?"?{old}"? ', f' ON "{table}" ', definition))
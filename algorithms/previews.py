@@ -0,0 +1,128 @@
+import logging
+import os
+from datetime import timedelta
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Q
+from django.utils.timezone import now
+from PIL import Image, ImageOps
+
+from tgbot.services import add_previews_to_notifications
+from .models import Alert, MediaBlob
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_FIELDS = ("image_thumbnail", "image_preview")
+
+
+def encode_jpeg(image):
+    buffer = BytesIO()
+    image.save(buffer, "JPEG", quality=settings.ALERT_PREVIEW_QUALITY, optimize=True, progressive=True)
+    return ContentFile(buffer.getvalue())
+
+
+def make_previews(file):
+    """
+    Превью (ALERT_PREVIEW_SIZE) и миниатюра (ALERT_THUMBNAIL_SIZE) изображения в JPEG.
+    JPEG декодируется сразу в уменьшенном масштабе (`draft`), миниатюра строится из превью.
+    Возвращает {поле модели: ContentFile}.
+    """
+    preview_size = (settings.ALERT_PREVIEW_SIZE, settings.ALERT_PREVIEW_SIZE)
+    with Image.open(file) as image:
+        image.draft("RGB", preview_size)
+        image = ImageOps.exif_transpose(image).convert("RGB")
+    image.thumbnail(preview_size, Image.Resampling.LANCZOS)
+    preview = encode_jpeg(image)
+    image.thumbnail((settings.ALERT_THUMBNAIL_SIZE, settings.ALERT_THUMBNAIL_SIZE), Image.Resampling.LANCZOS)
+    return {"image_preview": preview, "image_thumbnail": encode_jpeg(image)}
+
+
+def generate_alert_previews(alert):
+    """
+    Создаёт превью и миниатюру изображения тревоги (без сохранения модели).
+    Нечитаемое изображение только логируется: тревога помечается обработанной без превью.
+    """
+    alert.previews_generated_at = now()
+    try:
+        with alert.image.open("rb") as file:
+            previews = make_previews(file)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        logger.warning("Не удалось создать превью для тревоги %s: %s", alert.pk, e)
+        return False
+
+    name = os.path.splitext(os.path.basename(alert.image.name))[0]
+    for field, content in previews.items():
+        getattr(alert, field).save(f"{name}.jpg", content, save=False)
+    return True
+
+
+def claim_alerts(batch_size):
+    """
+    Забирает пачку тревог без превью. Строки блокируются через SKIP LOCKED только на время
+    выборки и «арендуются» на ALERT_PREVIEW_LEASE_SECONDS (`previews_claimed_until`),
+    чтобы несколько воркеров не обрабатывали одну тревогу. Аренда упавшего воркера истекает.
+    """
+    with transaction.atomic():
+        batch = list(
+            Alert.objects
+            .select_for_update(skip_locked=True)
+            .filter(previews_generated_at__isnull=True, image__gt="")
+            .filter(Q(previews_claimed_until__isnull=True) | Q(previews_claimed_until__lte=now()))
+            .only("id", "image", *PREVIEW_FIELDS, "previews_generated_at", "previews_claimed_until")
+            .order_by("id")[:batch_size]
+        )
+        if batch:
+            lease_until = now() + timedelta(seconds=settings.ALERT_PREVIEW_LEASE_SECONDS)
+            Alert.objects.filter(pk__in=[alert.pk for alert in batch]).update(previews_claimed_until=lease_until)
+    return batch
+
+
+def save_previews(batch, generated):
+    """
+    Сохраняет превью тревог, у которых за время обработки не сменилось изображение и превью
+    не сохранил другой воркер; для остальных файлы превью остаются без ссылок (их удалит
+    `gc_alert_media`), а аренда снимается. Возвращает тревоги с сохранёнными превью.
+    """
+    with transaction.atomic():
+        current = dict(
+            Alert.objects.select_for_update()
+            .filter(pk__in=[alert.pk for alert in batch], previews_generated_at__isnull=True)
+            .values_list("id", "image")
+        )
+        saved = [alert for alert in batch if current.get(alert.pk) == alert.image.name]
+        saved_ids = {alert.pk for alert in saved}
+        for alert in saved:
+            alert.previews_claimed_until = None
+        Alert.objects.bulk_update(saved, [*PREVIEW_FIELDS, "previews_generated_at", "previews_claimed_until"])
+        # Тревога со сменившимся изображением сразу доступна для повторной обработки
+        Alert.objects.filter(pk__in=set(current) - saved_ids).update(previews_claimed_until=None)
+
+        generated = [alert for alert in generated if alert.pk in saved_ids]
+        MediaBlob.objects.acquire(getattr(alert, field).name for alert in generated for field in PREVIEW_FIELDS)
+        # Запись с нулевым счётчиком, чтобы сборщик мусора удалил ненужные файлы превью
+        discarded = [getattr(alert, field).name for alert in batch if alert.pk not in saved_ids
+                     for field in PREVIEW_FIELDS]
+        MediaBlob.objects.acquire(discarded)
+        MediaBlob.objects.release(discarded)
+        add_previews_to_notifications(generated)
+    return generated
+
+
+def process_previews(batch_size=None):
+    """
+    Обрабатывает пачку тревог без превью. Тревоги забираются короткой транзакцией
+    (`claim_alerts`), изображения декодируются и уменьшаются вне транзакции, без блокировок
+    строк тревог, результат сохраняется второй короткой транзакцией (`save_previews`).
+    URL готовых превью добавляются в ещё не отправленные уведомления бота.
+    Возвращает количество обработанных тревог.
+    """
+    batch = claim_alerts(batch_size or settings.ALERT_PREVIEW_BATCH_SIZE)
+    if not batch:
+        return 0
+
+    generated = [alert for alert in batch if generate_alert_previews(alert)]
+    save_previews(batch, generated)
+    return len(batch)
@@ -0,0 +1,125 @@
+import gzip
+import json
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Q
+from django.utils.timezone import now
+
+from companies.models import Company
+from .models import Alert, AlertRetentionPolicy, MediaBlob
+
+ARCHIVE_FIELDS = (
+    "id", "aibox_alert_id", "alert_time", "company_id", "device_id", "device__aibox_id",
+    "source_id", "source__source_id", "alg__key", "hazard_level", "status", "reserved_data", "hit_count", "last_hit_at",
+    "confirmed_by_id", "confirmed_at", "rejected_by_id", "rejected_at", *Alert.MEDIA_FIELDS,
+)
+
+
+def get_retention_policies(company_ids=None):
+    """
+    Политики хранения по компаниям: {company_id: (retention_days, media_retention_days, archive)}.
+    Для компаний без AlertRetentionPolicy — ALERT_RETENTION_DAYS / ALERT_MEDIA_RETENTION_DAYS.
+    """
+    companies = Company.objects.all()
+    if company_ids:
+        companies = companies.filter(id__in=company_ids)
+    policies = {
+        company_id: (settings.ALERT_RETENTION_DAYS, settings.ALERT_MEDIA_RETENTION_DAYS, True)
+        for company_id in companies.values_list("id", flat=True)
+    }
+    for policy in AlertRetentionPolicy.objects.filter(company_id__in=policies):
+        policies[policy.company_id] = (policy.retention_days, policy.media_retention_days, policy.archive)
+    return policies
+
+
+def write_archive(company_id, rows):
+    """
+    Записывает тревоги в `ALERT_ARCHIVE_ROOT/<company_id>/<YYYY>/<MM>/alerts_<first id>_<last id>.ndjson.gz`
+    (через временный файл, чтобы в архиве не оставались недописанные файлы). Возвращает путь.
+    """
+    first = rows[0]
+    directory = os.path.join(settings.ALERT_ARCHIVE_ROOT, str(company_id), first["alert_time"].strftime("%Y/%m"))
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"alerts_{first['id']}_{rows[-1]['id']}.ndjson.gz")
+    with gzip.open(f"{path}.tmp", "wt", encoding="utf-8") as file:
+        for row in rows:
+            file.write(json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False))
+            file.write("\n")
+    os.replace(f"{path}.tmp", path)
+    return path
+
+
+def expire_alerts(company_id, cutoff, archive=True, batch_size=None):
+    """
+    Одна пачка: самые старые тревоги компании до `cutoff` пишутся в архив, их медиафайлы
+    освобождаются (MediaBlob), строки удаляются. Агрегаты AlertRollup не трогаются,
+    поэтому статистика за удалённый период сохраняется. Возвращает количество тревог.
+    """
+    with transaction.atomic():
+        ids = list(
+            Alert.objects.select_for_update(skip_locked=True)
+            .filter(company_id=company_id, alert_time__lt=cutoff)
+            .order_by("alert_time", "id")
+            .values_list("id", flat=True)[:batch_size or settings.ALERT_RETENTION_BATCH_SIZE]
+        )
+        if not ids:
+            return 0
+        rows = list(Alert.objects.filter(id__in=ids).order_by("id").values(*ARCHIVE_FIELDS))
+        if archive:
+            write_archive(company_id, rows)
+        # Медиафайлы удалённых тревог освобождает AlertQuerySet.delete, агрегаты остаются
+        Alert.objects.filter(id__in=ids).delete(update_rollups=False)
+    return len(ids)
+
+
+def expire_media(company_id, cutoff, batch_size=None):
+    """Одна пачка: у тревог компании до `cutoff` удаляются изображения, видео и превью. Возвращает количество."""
+    with transaction.atomic():
+        rows = list(
+            Alert.objects.select_for_update(skip_locked=True)
+            .filter(Q(image__gt="") | Q(video__gt=""), company_id=company_id, alert_time__lt=cutoff)
+            .order_by("alert_time", "id")
+            .values("id", *Alert.MEDIA_FIELDS)[:batch_size or settings.ALERT_RETENTION_BATCH_SIZE]
+        )
+        if not rows:
+            return 0
+        MediaBlob.objects.release(row[field] for row in rows for field in Alert.MEDIA_FIELDS)
+        Alert.objects.filter(id__in=[row["id"] for row in rows]).update(**dict.fromkeys(Alert.MEDIA_FIELDS, ""))
+    return len(rows)
+
+
+def drain(step, max_batches=None):
+    """Вызывает `step()`, пока он обрабатывает строки (не более `max_batches` раз). Возвращает сумму."""
+    total = batches = 0
+    while max_batches is None or batches < max_batches:
+        count = step()
+        if not count:
+            break
+        total += count
+        batches += 1
+    return total
+
+
+def apply_retention(company_ids=None, batch_size=None, max_batches=None):
+    """
+    Применяет политики хранения ко всем (или указанным) компаниям пачками,
+    каждая пачка — отдельная транзакция, так что прерванный запуск просто продолжится
+    при следующем. Возвращает {company_id: (удалено тревог, очищено медиа)}.
+    """
+    moment = now()
+    result = {}
+    for company_id, (retention_days, media_retention_days, archive) in get_retention_policies(company_ids).items():
+        media_expired = expired = 0
+        if media_retention_days is not None and (retention_days is None or media_retention_days < retention_days):
+            cutoff = moment - timedelta(days=media_retention_days)
+            media_expired = drain(lambda: expire_media(company_id, cutoff, batch_size), max_batches)
+        if retention_days is not None:
+            cutoff = moment - timedelta(days=retention_days)
+            expired = drain(lambda: expire_alerts(company_id, cutoff, archive, batch_size), max_batches)
+        if expired or media_expired:
+            result[company_id] = (expired, media_expired)
+    return result
@@ -1,14 +1,21 @@
 import datetime
 import base64
+import hashlib
 import uuid
 from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import UploadedFile
 from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers
 
 from companies.serializers import CompanySerializer
 from devices.serializers import DeviceSerializer, SourceSerializer
-from .models import Alert, Algorithm
-from devices.models import Device, Source
+from visionaibox.mixins import DynamicFieldsMixin
+from .models import Alert, AlertRollup, Algorithm, MediaBlob
+from devices.lookups import get_device, get_or_create_source
+from .lookups import get_or_create_algorithm
+from .metrics import STAGE_SECONDS
+from .filters import AlertFilter
 from django.conf import settings
 
 
@@ -18,6 +25,42 @@ class AlgorithmSerializer(serializers.ModelSerializer):
         fields = ("id", "key", "name", "type")
 
 
+class AlertMediaField(serializers.Field):
+    """Медиафайл тревоги: строка base64 в JSON или файл из multipart/binary-загрузки."""
+    default_error_messages = {
+        "invalid": "Ожидается строка base64 или загруженный файл.",
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, (str, UploadedFile)):
+            return data
+        self.fail("invalid")
+
+    def to_representation(self, value):
+        return value.url if value else None
+
+
+def prepare_alert_media(value, extension, sha256=None):
+    """
+    Приводит медиафайл тревоги к файлу с именем `alert_<uuid>.<ext>`.
+    Загруженный файл (уже на диске) не копируется, base64 декодируется в память.
+    Проверяет размер и, если передана, контрольную сумму sha256.
+    """
+    if isinstance(value, UploadedFile):
+        file = value
+        file.name = f"alert_{uuid.uuid4().hex}.{extension}"
+    else:
+        with STAGE_SECONDS.time("ingest", "decode"):
+            file = ContentFile(base64.b64decode(value), name=f"alert_{uuid.uuid4().hex}.{extension}")
+            file.sha256 = hashlib.sha256(file.file.getbuffer()).hexdigest()
+
+    if file.size > settings.ALERT_MEDIA_MAX_SIZE:
+        raise serializers.ValidationError(f"Файл превышает допустимый размер {settings.ALERT_MEDIA_MAX_SIZE} байт.")
+    if sha256 and getattr(file, "sha256", None) and sha256.lower() != file.sha256:
+        raise serializers.ValidationError("Контрольная сумма sha256 не совпадает.")
+    return file
+
+
 class AlertCreateSerializer(serializers.Serializer):
     id = serializers.CharField(write_only=True)  # AIBox `id` → `aibox_alert_id`
     alert_time = serializers.FloatField()
@@ -26,8 +69,10 @@ class AlertCreateSerializer(serializers.Serializer):
     alg = serializers.DictField(write_only=True, required=False, allow_null=True)
     hazard_level = serializers.CharField(default="1", required=False, allow_null=True, allow_blank=True)
 
-    image = serializers.CharField(write_only=True, required=False, allow_null=True)
-    video = serializers.CharField(write_only=True, required=False, allow_null=True)
+    image = AlertMediaField(write_only=True, required=False, allow_null=True)
+    video = AlertMediaField(write_only=True, required=False, allow_null=True)
+    image_sha256 = serializers.CharField(write_only=True, required=False, allow_blank=True)
+    video_sha256 = serializers.CharField(write_only=True, required=False, allow_blank=True)
 
     reserved_data = serializers.JSONField(required=False, allow_null=True)
     company = serializers.StringRelatedField(read_only=True)
@@ -36,8 +81,7 @@ class AlertCreateSerializer(serializers.Serializer):
         """Проверяем, что `id` не пустой"""
         if not value:
             raise serializers.ValidationError("Поле 'id' обязательно.")
-        if Alert.objects.filter(aibox_alert_id=value).exists():
-            raise serializers.ValidationError("Тревога с таким 'id' уже существует.")
+        # Повторы (`aibox_alert_id` уже есть) отсекает уникальный индекс AlertKey при INSERT, см. `ingest_alert`
         return value
 
     def validate_alert_time(self, value):
@@ -48,14 +92,20 @@ class AlertCreateSerializer(serializers.Serializer):
             raise serializers.ValidationError("Некорректный формат alert_time (должен быть timestamp).")
 
     def validate_device(self, value):
-        """Проверяем, что устройство существует, иначе выбрасываем ошибку"""
+        """
+        Проверяем, что устройство существует, иначе выбрасываем ошибку.
+        Async-представления передают уже найденное устройство в context["device"].
+        """
         device_id = value.get("id")
         if not device_id:
             raise serializers.ValidationError("Поле 'device.id' обязательно.")
-        try:
-            return Device.objects.get(aibox_id=device_id)
-        except Device.DoesNotExist:
+        if "device" in self.context:
+            device = self.context["device"]
+        else:
+            device = get_device(device_id)
+        if device is None:
             raise serializers.ValidationError("Указанное устройство (Device) не найдено в базе данных.")
+        return device
 
 
     def validate_alg(self, value):
@@ -70,69 +120,87 @@ class AlertCreateSerializer(serializers.Serializer):
         return value
 
     def validate_image(self, value):
-        """Обрабатываем изображение в формате base64"""
+        """Обрабатываем изображение: base64 или загруженный файл"""
         if value:
             try:
-                image_data = base64.b64decode(value)
-                return ContentFile(image_data, name=f"alert_{uuid.uuid4().hex}.jpg")
+                return prepare_alert_media(value, "jpg", self.initial_data.get("image_sha256"))
+            except serializers.ValidationError:
+                raise
             except Exception as e:
                 raise serializers.ValidationError(f"Ошибка обработки изображения: {str(e)}")
         return None
 
     def validate_video(self, value):
-        """Обрабатываем видео в формате base64"""
+        """Обрабатываем видео: base64 или загруженный файл"""
         if value:
             try:
-                video_data = base64.b64decode(value)
-                return ContentFile(video_data, name=f"alert_{uuid.uuid4().hex}.mp4")
+                return prepare_alert_media(value, "mp4", self.initial_data.get("video_sha256"))
+            except serializers.ValidationError:
+                raise
             except Exception as e:
                 raise serializers.ValidationError(f"Ошибка обработки видео: {str(e)}")
         return None
 
     def create(self, validated_data):
-        """Создаёт Alert, обрабатывая `device`, `source`, `alg`, а также base64-изображения и видео."""
+        """
+        Создаёт Alert, обрабатывая `device`, `source`, `alg`, а также изображения и видео.
+        Выполняется в транзакции вызывающего кода без точки сохранения: если тревога
+        с таким `aibox_alert_id` уже есть, INSERT падает с IntegrityError (см. `ingest_alert`).
+        """
         device = validated_data.pop("device")
-        source_data = validated_data.pop("source")
-        alg_data = validated_data.pop("alg")
-        image = validated_data.pop("image")
+        source_data = validated_data.pop("source", None)
+        alg_data = validated_data.pop("alg", None)
+        image = validated_data.pop("image", None)
         video = validated_data.pop("video", None)
+        validated_data.pop("image_sha256", None)
+        validated_data.pop("video_sha256", None)
         aibox_alert_id = validated_data.pop("id")
 
-        with transaction.atomic():
-            source = None
-            if source_data:
-                source_id = source_data.get("id")
-                source, _ = Source.objects.get_or_create(
-                    source_id=source_id, device=device,
-                    defaults={"ipv4": source_data.get("ipv4", ""), "desc": source_data.get("desc", "")}
-                )
-
-            algorithm = None
-            if alg_data:
-                alg_key = alg_data.get("name")
-                algorithm, _ = Algorithm.objects.get_or_create(
-                    key=alg_key,
-                    defaults={"name": alg_data.get("ch_name", ""), "type": alg_data.get("type", "")}
-                )
-
-            alert = Alert.objects.create(
+        with transaction.atomic(savepoint=False):
+            with STAGE_SECONDS.time("ingest", "lookup"):
+                source = get_or_create_source(device, source_data) if source_data else None
+                algorithm = get_or_create_algorithm(alg_data) if alg_data else None
+
+            # Файлы сохраняются в хранилище в pre_save, поэтому запись тревоги — один INSERT.
+            # Если INSERT откатится, файлы без ссылок удалит `gc_alert_media --scan`
+            alert = Alert(
                 aibox_alert_id=aibox_alert_id,
                 device=device,
                 source=source,
                 alg=algorithm,
                 company=device.company,
+                image=image,
+                video=video,
                 **validated_data
             )
+            with STAGE_SECONDS.time("ingest", "save"):
+                alert.save(force_insert=True)
 
-            if image:
-                alert.image.save(image.name, image, save=True)
-            if video:
-                alert.video.save(video.name, video, save=True)
+            MediaBlob.objects.acquire(alert.get_media_names())
+            AlertRollup.objects.add_alerts([alert])
 
         return alert
 
 
-class AlertSerializer(serializers.ModelSerializer):
+class AlertBulkItemSerializer(AlertCreateSerializer):
+    """
+    Элемент пакетной загрузки тревог. Устройства, источники, алгоритмы и
+    дубликаты разрешаются для всей пачки сразу в `bulk_create_alerts`.
+    """
+
+    def validate_id(self, value):
+        if not value:
+            raise serializers.ValidationError("Поле 'id' обязательно.")
+        return value
+
+    def validate_device(self, value):
+        device_id = value.get("id")
+        if not device_id:
+            raise serializers.ValidationError("Поле 'device.id' обязательно.")
+        return str(device_id)
+
+
+class AlertSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     device = DeviceSerializer(read_only=True)
     source = SourceSerializer(read_only=True)
     alg = AlgorithmSerializer(read_only=True)
@@ -142,7 +210,7 @@ class AlertSerializer(serializers.ModelSerializer):
         model = Alert
         fields = (
             "id", "aibox_alert_id", "alert_time", "device", "source", "alg", "hazard_level", "image", "video",
-            "reserved_data", "company"
+            "image_thumbnail", "image_preview", "hit_count", "last_hit_at", "last_image", "reserved_data", "company"
         )
 
     def get_image(self, obj):
@@ -155,6 +223,139 @@ class AlertSerializer(serializers.ModelSerializer):
             # Если request отсутствует, используем MEDIA_URL
             return f"{settings.MEDIA_URL}{obj.image}"
 
+class AlertListSerializer(serializers.BaseSerializer):
+    """
+    Быстрый сериализатор списка тревог. Принимает строки `values(*get_values(fields))`
+    (один запрос с JOIN, без экземпляров моделей и вложенных сериализаторов на строку),
+    формат ответа — как у AlertSerializer. `fields` ограничивает поля, как DynamicFieldsMixin.
+    """
+    RELATED_VALUES = {
+        "device": ("device_id", "device__aibox_id", "device__name", "device__desc"),
+        "source": ("source_id", "source__source_id", "source__ipv4", "source__desc", "source__device_id"),
+        "alg": ("alg_id", "alg__key", "alg__name", "alg__type"),
+        "company": ("company_id", "company__name", "company__description", "company__created_at"),
+    }
+    MEDIA_FIELDS = Alert.MEDIA_FIELDS
+    DATETIME_FIELDS = ("alert_time", "last_hit_at")
+    # Поля, нужные пагинации (курсор по alert_time, id), выбираются всегда
+    REQUIRED_VALUES = ("id", "alert_time")
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.field_names = [name for name in AlertSerializer.Meta.fields if not fields or name in fields]
+        self.timezone = timezone.get_current_timezone()
+
+    def format_datetime(self, value):
+        """Как DateTimeField.to_representation (ISO 8601), но часовой пояс определяется один раз, а не на каждое поле."""
+        if value is None:
+            return None
+        value = value.astimezone(self.timezone).isoformat()
+        return value[:-6] + "Z" if value.endswith("+00:00") else value
+
+    @classmethod
+    def get_values(cls, fields=None):
+        """Колонки для `values()` под запрошенные поля."""
+        values = list(cls.REQUIRED_VALUES)
+        for name in AlertSerializer.Meta.fields:
+            if fields and name not in fields:
+                continue
+            for value in cls.RELATED_VALUES.get(name, (name,)):
+                if value not in values:
+                    values.append(value)
+        return values
+
+    def media_url(self, name, value):
+        if not value:
+            return None
+        url = Alert._meta.get_field(name).storage.url(value)
+        request = self.context.get("request")
+        return request.build_absolute_uri(url) if request else url
+
+    def to_representation(self, row):
+        data = {}
+        for name in self.field_names:
+            if name in self.DATETIME_FIELDS:
+                data[name] = self.format_datetime(row[name])
+            elif name == "device":
+                data[name] = {
+                    "id": row["device_id"], "aibox_id": row["device__aibox_id"],
+                    "name": row["device__name"], "desc": row["device__desc"],
+                }
+            elif name == "source":
+                data[name] = {
+                    "id": row["source_id"], "source_id": row["source__source_id"], "ipv4": row["source__ipv4"],
+                    "desc": row["source__desc"], "device": row["source__device_id"],
+                }
+            elif name == "alg":
+                data[name] = row["alg_id"] and {
+                    "id": row["alg_id"], "key": row["alg__key"], "name": row["alg__name"], "type": row["alg__type"],
+                }
+            elif name == "company":
+                data[name] = {
+                    "id": row["company_id"], "name": row["company__name"],
+                    "description": row["company__description"],
+                    "created_at": self.format_datetime(row["company__created_at"]),
+                }
+            elif name in self.MEDIA_FIELDS:
+                data[name] = self.media_url(name, row[name])
+            else:
+                data[name] = row[name]
+        return data
+
+
+class AlertMediaUploadSerializer(serializers.Serializer):
+    """Прикрепление медиафайла к уже созданной тревоге (multipart или бинарное тело запроса)."""
+    kind = serializers.ChoiceField(choices=["image", "video"])
+    file = serializers.FileField()
+    sha256 = serializers.CharField(required=False, allow_blank=True)
+
+    def validate(self, attrs):
+        extension = "jpg" if attrs["kind"] == "image" else "mp4"
+        attrs["file"] = prepare_alert_media(attrs["file"], extension, attrs.get("sha256"))
+        return attrs
+
+
 class AlertActionSerializer(serializers.Serializer):
     """Сериализатор для обработки подтверждения или отклонения тревоги"""
     action = serializers.ChoiceField(choices=["confirm", "reject"], required=True)
+
+
+def is_filter_value_set(value):
+    """Задано ли условие фильтра (значение из `form.cleaned_data`; диапазон — slice)."""
+    if isinstance(value, slice):
+        return value.start is not None or value.stop is not None
+    return value not in (None, "", [], ())
+
+
+class AlertBulkActionSerializer(AlertActionSerializer):
+    """
+    Пакетное подтверждение или отклонение тревог: список `ids` или фильтр `filter`
+    (поля AlertFilter: company, device, source, alg, hazard_level, alert_time_after/alert_time_before).
+    """
+    ids = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False, max_length=settings.ALERT_BULK_MAX_ITEMS, required=False
+    )
+    filter = serializers.DictField(required=False)
+
+    def validate_filter(self, value):
+        """
+        Фильтр превращается в queryset тревог; статус задавать нельзя — обрабатываются только ожидающие.
+        Нужно хотя бы одно непустое условие: фильтр из пустых значений выбрал бы все тревоги.
+        """
+        value = {name: item for name, item in value.items() if name != "status"}
+        # Диапазон времени задаётся только через _after/_before: ключ `alert_time` фильтр молча пропустил бы
+        allowed = set(AlertFilter.base_filters) - {"alert_time"} | {"alert_time_after", "alert_time_before"}
+        unknown = set(value) - allowed
+        if unknown:
+            raise serializers.ValidationError(f"Неизвестные поля фильтра: {', '.join(sorted(unknown))}.")
+        filterset = AlertFilter(data=value, queryset=Alert.objects.all())
+        if not filterset.is_valid():
+            raise serializers.ValidationError(filterset.errors)
+        if not any(is_filter_value_set(item) for item in filterset.form.cleaned_data.values()):
+            raise serializers.ValidationError("Укажите хотя бы одно условие фильтра.")
+        return filterset.qs
+
+    def validate(self, attrs):
+        if ("ids" in attrs) == ("filter" in attrs):
+            raise serializers.ValidationError("Укажите либо 'ids', либо 'filter'.")
+        return attrs
@@ -0,0 +1,300 @@
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from devices.models import Device, Source
+from tgbot.services import send_alert_to_bot, send_alerts_summary_to_bot, send_alerts_to_bot
+from users.lookups import get_recipients_map
+from .events import publish_alerts_created, publish_alerts_status
+from .metrics import STAGE_SECONDS, count_alert, get_alert_labels
+from .models import Alert, AlertKey, AlertRollup, Algorithm, MediaBlob
+from .serializers import AlertBulkItemSerializer
+from .suppression import add_hit, find_burst, start_burst
+
+ALERT_RELATED = ("device", "source", "alg", "company")
+
+
+INGEST_CREATED = "created"
+INGEST_DUPLICATE = "duplicate"
+INGEST_COALESCED = "coalesced"
+
+
+def ingest_alert(serializer, request):
+    """
+    Идемпотентный приём одной тревоги AIBox (serializer уже провалидирован).
+    Тревога, учредители и уведомление для бота сохраняются в одной транзакции;
+    повтор с тем же `aibox_alert_id` (с любым `alert_time`) определяется по конфликту
+    уникального индекса AlertKey при INSERT, без предварительной проверки. Повтор
+    срабатывания в окне подавления сливается в первую тревогу серии (см. algorithms/suppression.py),
+    его идентификатор тоже попадает в AlertKey, поэтому повторная отправка слитой тревоги — дубликат.
+    Возвращает (alert, INGEST_CREATED | INGEST_DUPLICATE | INGEST_COALESCED).
+    """
+    data = serializer.validated_data
+    labels = get_alert_labels(data)
+    with STAGE_SECONDS.time("ingest", "suppression"):
+        burst, image_hash = find_burst(data)
+    try:
+        if burst is not None:
+            if data["id"] in burst.seen_ids:
+                existing = Alert.objects.filter(pk=burst.alert_id, alert_time=burst.alert_time).first()
+                if existing is not None:
+                    count_alert(labels, INGEST_DUPLICATE)
+                    return existing, INGEST_DUPLICATE
+            else:
+                alert = add_hit(burst, data, image_hash)
+                if alert is not None:
+                    count_alert(labels, INGEST_COALESCED)
+                    return alert, INGEST_COALESCED
+
+        with STAGE_SECONDS.time("ingest", "transaction"), transaction.atomic():
+            alert = serializer.save()
+
+            add_executive_users([alert])
+
+            with STAGE_SECONDS.time("ingest", "notify"):
+                send_alert_to_bot(alert, request, for_security=True)
+            publish_alerts_created([alert])
+            start_burst(alert, data, image_hash)
+        count_alert(labels, INGEST_CREATED)
+        return alert, INGEST_CREATED
+    except IntegrityError:
+        existing = AlertKey.objects.get_alert(data["id"])
+        if existing is None:
+            raise
+        count_alert(labels, INGEST_DUPLICATE)
+        return existing, INGEST_DUPLICATE
+
+
+def confirm_alert_and_notify(alert, request):
+    """
+    Подтверждает тревогу и ставит уведомление учредителям в очередь бота одной транзакцией,
+    смена статуса публикуется в поток дашборда. Возвращает False, если тревога уже обработана.
+    """
+    with transaction.atomic():
+        with STAGE_SECONDS.time("action", "status"):
+            confirmed = alert.confirm_alert()
+        if not confirmed:
+            return False
+        with STAGE_SECONDS.time("action", "notify"):
+            # Для уведомления бота нужна полная тревога со связанными объектами
+            notified = Alert.objects.select_related(*ALERT_RELATED).get(pk=alert.pk, alert_time=alert.alert_time)
+            send_alert_to_bot(notified, request, for_security=False)
+        publish_alerts_status([alert])
+    return True
+
+
+def reject_alert_and_notify(alert):
+    """Отклоняет тревогу и публикует смену статуса в поток дашборда. Возвращает False, если тревога уже обработана."""
+    with transaction.atomic():
+        with STAGE_SECONDS.time("action", "status"):
+            rejected = alert.reject_alert()
+        if not rejected:
+            return False
+        publish_alerts_status([alert])
+    return True
+
+
+def set_alerts_status(action, ids=None, queryset=None, user=None):
+    """
+    Пакетное подтверждение/отклонение ожидающих тревог (`action` — confirm/reject)
+    по списку `ids` или по `queryset` фильтра (не более ALERT_BULK_ACTION_MAX_ALERTS за вызов).
+    Учредители получают одно сводное уведомление на компанию, а не по уведомлению на тревогу.
+    Для `ids` возвращает {"updated": [...], "conflict": [...], "not_found": [...]},
+    для фильтра — {"updated_count": N, "has_more": есть ли ещё ожидающие тревоги под фильтром}.
+    """
+    status = Alert.STATUS_CONFIRMED if action == "confirm" else Alert.STATUS_REJECTED
+    if ids is not None:
+        ids = list(dict.fromkeys(ids))
+        queryset = Alert.objects.filter(pk__in=ids)
+    with transaction.atomic():
+        with STAGE_SECONDS.time("bulk_action", "status"):
+            alerts = queryset.set_status(
+                status, user, limit=None if ids is not None else settings.ALERT_BULK_ACTION_MAX_ALERTS
+            )
+        if status == Alert.STATUS_CONFIRMED:
+            with STAGE_SECONDS.time("bulk_action", "notify"):
+                send_alerts_summary_to_bot(alerts, status, for_security=False)
+        publish_alerts_status(alerts)
+
+    if ids is None:
+        return {
+            "updated_count": len(alerts),
+            "has_more": queryset.filter(status=Alert.STATUS_PENDING).exists(),
+        }
+    updated = {alert.pk for alert in alerts}
+    existing = set(Alert.objects.filter(pk__in=[pk for pk in ids if pk not in updated]).values_list("id", flat=True))
+    return {
+        "updated": [pk for pk in ids if pk in updated],
+        "conflict": [pk for pk in ids if pk in existing],
+        "not_found": [pk for pk in ids if pk not in updated and pk not in existing],
+    }
+
+
+def _result(index, aibox_alert_id, error_code, message, data=None):
+    return {"index": index, "id": aibox_alert_id, "error_code": error_code, "message": message, "data": data}
+
+
+def _resolve_sources(pending):
+    """Находит источники всей пачки одним запросом, недостающие создаёт одним `bulk_create`."""
+    wanted = {}
+    for _, device, data in pending:
+        source_data = data["source"]
+        key = (device.id, str(source_data["id"]))
+        wanted.setdefault(key, Source(
+            source_id=key[1], device=device,
+            ipv4=source_data.get("ipv4", ""), desc=source_data.get("desc", ""),
+        ))
+
+    def fetch():
+        queryset = Source.objects.filter(
+            device_id__in={key[0] for key in wanted}, source_id__in={key[1] for key in wanted}
+        )
+        return {(source.device_id, source.source_id): source for source in queryset}
+
+    found = fetch()
+    missing = [source for key, source in wanted.items() if key not in found]
+    if missing:
+        Source.objects.bulk_create(missing, ignore_conflicts=True)
+        found = fetch()
+    return found
+
+
+def _resolve_algorithms(pending):
+    """Находит алгоритмы всей пачки по `key`, недостающие создаёт одним `bulk_create`."""
+    wanted = {}
+    for _, _, data in pending:
+        alg_data = data.get("alg")
+        if alg_data:
+            wanted.setdefault(alg_data["name"], Algorithm(
+                key=alg_data["name"], name=alg_data.get("ch_name", ""), type=alg_data.get("type", ""),
+            ))
+    if not wanted:
+        return {}
+
+    found = {algorithm.key: algorithm for algorithm in Algorithm.objects.filter(key__in=wanted)}
+    missing = [algorithm for key, algorithm in wanted.items() if key not in found]
+    if missing:
+        Algorithm.objects.bulk_create(missing, ignore_conflicts=True)
+        found = {algorithm.key: algorithm for algorithm in Algorithm.objects.filter(key__in=wanted)}
+    return found
+
+
+def add_executive_users(alerts):
+    """
+    Привязывает учредителей компаний к новым тревогам одним INSERT в M2M-таблицу
+    (id учредителей — из справочника получателей, без запроса в steady state).
+    """
+    recipients = get_recipients_map({alert.company_id for alert in alerts})
+    through = Alert.executive_users.through
+    rows = [
+        through(alert_id=alert.pk, user_id=user_id)
+        for alert in alerts
+        for user_id in recipients[alert.company_id].executive_ids
+    ]
+    if rows:
+        through.objects.bulk_create(rows, ignore_conflicts=True)
+
+
+def bulk_create_alerts(items, request):
+    """
+    Пакетно создаёт тревоги AIBox. Устройства, источники, алгоритмы и дубликаты
+    разрешаются несколькими запросами на всю пачку, тревоги и их ключи AlertKey
+    вставляются двумя `bulk_create`. Созданной считается только тревога, которой
+    достался ключ; проигравшие гонку с параллельным запросом — дубликаты.
+    Возвращает список результатов в порядке входных элементов.
+    """
+    results = [None] * len(items)
+    valid = {}
+    for index, item in enumerate(items):
+        serializer = AlertBulkItemSerializer(data=item)
+        if not serializer.is_valid():
+            aibox_alert_id = item.get("id") if isinstance(item, dict) else None
+            results[index] = _result(index, aibox_alert_id, -1, "client error", serializer.errors)
+            continue
+        data = serializer.validated_data
+        if data["id"] in valid:
+            results[index] = _result(index, data["id"], 0, "duplicate")
+            continue
+        valid[data["id"]] = (index, data)
+
+    existing = AlertKey.objects.get_owners(valid)
+    devices = {
+        device.aibox_id: device
+        for device in Device.objects.select_related("company").filter(
+            aibox_id__in={data["device"] for _, data in valid.values()}
+        )
+    }
+
+    pending = []
+    for aibox_alert_id, (index, data) in valid.items():
+        if aibox_alert_id in existing:
+            results[index] = _result(index, aibox_alert_id, 0, "duplicate")
+            continue
+        device = devices.get(data["device"])
+        if device is None:
+            results[index] = _result(index, aibox_alert_id, -1, "client error", {
+                "device": ["Указанное устройство (Device) не найдено в базе данных."]
+            })
+            continue
+        if not data.get("source") or data["source"].get("id") is None:
+            results[index] = _result(index, aibox_alert_id, -1, "client error", {
+                "source": ["Поле 'source.id' обязательно."]
+            })
+            continue
+        pending.append((index, device, data))
+
+    if not pending:
+        return results
+
+    with STAGE_SECONDS.time("bulk", "transaction"), transaction.atomic():
+        with STAGE_SECONDS.time("bulk", "lookup"):
+            sources = _resolve_sources(pending)
+            algorithms = _resolve_algorithms(pending)
+
+        alerts = []
+        for _, device, data in pending:
+            alg_data = data.get("alg")
+            alerts.append(Alert(
+                aibox_alert_id=data["id"],
+                alert_time=data["alert_time"],
+                device=device,
+                source=sources[(device.id, str(data["source"]["id"]))],
+                alg=algorithms[alg_data["name"]] if alg_data else None,
+                hazard_level=data.get("hazard_level") or "1",
+                company=device.company,
+                reserved_data=data.get("reserved_data"),
+                image=data.get("image"),
+                video=data.get("video"),
+            ))
+        # Файлы изображений/видео записываются в pre_save во время bulk_create
+        with STAGE_SECONDS.time("bulk", "save"):
+            Alert.objects.bulk_create(alerts)
+            MediaBlob.objects.acquire(name for alert in alerts for name in alert.get_media_names())
+            AlertKey.objects.bulk_create([
+                AlertKey(aibox_alert_id=alert.aibox_alert_id, alert=alert, alert_time=alert.alert_time)
+                for alert in alerts
+            ], ignore_conflicts=True)
+
+        # Ключ, вставленный параллельным запросом после проверки дубликатов, принадлежит чужой
+        # тревоге: наша копия — повтор, она удаляется в этой же транзакции
+        owners = AlertKey.objects.get_owners([alert.aibox_alert_id for alert in alerts])
+        created = [alert for alert in alerts if owners.get(alert.aibox_alert_id) == alert.pk]
+        lost = [alert for alert in alerts if owners.get(alert.aibox_alert_id) != alert.pk]
+        if lost:
+            # Медиафайлы удалённых копий освобождает AlertQuerySet.delete; в агрегатах копии ещё не учтены
+            Alert.objects.filter(pk__in=[alert.pk for alert in lost]).delete(update_rollups=False)
+
+        add_executive_users(created)
+        AlertRollup.objects.add_alerts(created)
+        with STAGE_SECONDS.time("bulk", "notify"):
+            send_alerts_to_bot(created, request, for_security=True)
+        publish_alerts_created(created)
+
+    created_ids = {alert.pk for alert in created}
+    for (index, _, data), alert in zip(pending, alerts):
+        if alert.pk not in created_ids:
+            results[index] = _result(index, alert.aibox_alert_id, 0, "duplicate")
+            continue
+        results[index] = _result(index, alert.aibox_alert_id, 0, "created")
+        alg_data = data.get("alg")
+        count_alert((alert.company_id, alert.device.aibox_id, alg_data["name"] if alg_data else ""), INGEST_CREATED)
+    return results
@@ -0,0 +1,44 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .lookups import algorithm_cache
+from .models import Alert, AlertRollup, Algorithm, MediaBlob
+
+
+@receiver([post_save, post_delete], sender=Algorithm)
+def invalidate_algorithm_cache(sender, **kwargs):
+    algorithm_cache.invalidate()
+
+
+@receiver(pre_delete, sender=Algorithm)
+def detach_algorithm_rollups(sender, instance, **kwargs):
+    AlertRollup.objects.detach_algorithm(instance.pk)
+
+
+@receiver(post_delete, sender=Alert)
+def release_alert_media(sender, instance, origin=None, **kwargs):
+    """
+    Освобождает медиафайлы удалённой тревоги — в том числе при удалении из админки
+    и каскадном удалении устройства, источника или компании. При удалении queryset
+    тревог имена собираются и освобождаются одним вызовом (см. `AlertQuerySet.delete`).
+    """
+    deleted_media = getattr(origin, "deleted_media", None)
+    if deleted_media is not None:
+        deleted_media.extend(instance.get_media_names())
+    else:
+        MediaBlob.objects.release(instance.get_media_names())
+
+
+@receiver(post_delete, sender=Alert)
+def subtract_alert_rollups(sender, instance, origin=None, **kwargs):
+    """
+    Вычитает удалённую тревогу из AlertRollup. При удалении queryset изменения собираются
+    в `rollup_deltas` (см. `AlertQuerySet.delete`). При каскадном удалении устройства, источника
+    или компании их агрегаты удаляются тем же каскадом — вычитать не из чего.
+    """
+    if isinstance(origin, Alert):
+        AlertRollup.objects.apply_deltas(AlertRollup.objects.get_deltas(instance, -1))
+        return
+    rollup_deltas = getattr(origin, "rollup_deltas", None)
+    if rollup_deltas is not None:
+        rollup_deltas.update(AlertRollup.objects.get_deltas(instance, -1))
@@ -0,0 +1,173 @@
+from datetime import timedelta
+
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Trunc
+from django.utils.timezone import get_default_timezone, localtime, now
+
+from .models import Alert, AlertRollup
+
+
+def floor_hour(value):
+    return localtime(value).replace(minute=0, second=0, microsecond=0)
+
+
+def floor_day(value):
+    return floor_hour(value).replace(hour=0)
+
+
+def ceil_hour(value):
+    start = floor_hour(value)
+    return start if start == value else start + timedelta(hours=1)
+
+
+def ceil_day(value):
+    start = floor_day(value)
+    return start if start == value else start + timedelta(days=1)
+
+
+def split_range(start, end):
+    """
+    Делит интервал [start, end) (любая граница может быть None) на части:
+    целые сутки — из суточных агрегатов, целые часы — из часовых,
+    неполные часы по краям — из таблицы тревог.
+    Возвращает (raw, hours, days) — списки пар (начало, конец).
+    """
+    raw, hours, days = [], [], []
+    if start is None and end is None:
+        days.append((None, None))
+        return raw, hours, days
+
+    if start is None:
+        day_end, hour_end = floor_day(end), floor_hour(end)
+        days.append((None, day_end))
+        hours.append((day_end, hour_end))
+        raw.append((hour_end, end))
+    elif end is None:
+        hour_start, day_start = ceil_hour(start), ceil_day(start)
+        raw.append((start, hour_start))
+        hours.append((hour_start, day_start))
+        days.append((day_start, None))
+    else:
+        hour_start, day_start = ceil_hour(start), ceil_day(start)
+        hour_end, day_end = floor_hour(end), floor_day(end)
+        if day_start < day_end:
+            raw.append((start, hour_start))
+            hours.append((hour_start, day_start))
+            days.append((day_start, day_end))
+            hours.append((day_end, hour_end))
+            raw.append((hour_end, end))
+        elif hour_start < hour_end:
+            raw.append((start, hour_start))
+            hours.append((hour_start, hour_end))
+            raw.append((hour_end, end))
+        else:
+            raw.append((start, end))
+
+    def non_empty(ranges):
+        return [(a, b) for a, b in ranges if a is None or b is None or a < b]
+
+    return non_empty(raw), non_empty(hours), non_empty(days)
+
+
+def _range_q(field, ranges, **extra):
+    q = Q()
+    for range_start, range_end in ranges:
+        condition = Q(**extra)
+        if range_start is not None:
+            condition &= Q(**{f"{field}__gte": range_start})
+        if range_end is not None:
+            condition &= Q(**{f"{field}__lt": range_end})
+        q |= condition
+    return q
+
+
+def iter_offsets(tzinfo, start, end):
+    """
+    Пары смещений (`tzinfo`, TIME_ZONE) на [start, end]: в начале интервала и после каждого
+    перехода на летнее/зимнее время внутри него. Интервал проходится по суткам, переход
+    внутри суток ищется делением пополам с точностью до секунды.
+    """
+    default = get_default_timezone()
+
+    def offsets(moment):
+        return moment.astimezone(tzinfo).utcoffset(), moment.astimezone(default).utcoffset()
+
+    moment, current = start, offsets(start)
+    yield current
+    while moment < end:
+        following = min(moment + timedelta(days=1), end)
+        if offsets(following) == current:
+            moment = following
+            continue
+        low, high = moment, following
+        while high - low > timedelta(seconds=1):
+            middle = low + (high - low) / 2
+            if offsets(middle) == current:
+                low = middle
+            else:
+                high = middle
+        moment, current = high, offsets(high)
+        yield current
+
+
+def get_rollup_levels(tzinfo, start=None, end=None):
+    """
+    Какие агрегаты можно использовать для бакетов в часовом поясе `tzinfo` на интервале [start, end)
+    (None — от первой тревоги / до текущего момента): ("hour", "day") — смещение пояса совпадает
+    со смещением TIME_ZONE на всём интервале, ("hour",) — везде отличается на целое число часов,
+    () — только таблица тревог. Переходы на летнее время у поясов бывают в разные дни,
+    поэтому смещения сравниваются во всех переходах внутри интервала, а не в один момент.
+    """
+    levels = (AlertRollup.GRANULARITY_HOUR, AlertRollup.GRANULARITY_DAY)
+    if tzinfo is None or tzinfo == get_default_timezone():
+        return levels
+    if end is None:
+        end = now()
+    if start is None:
+        start = Alert.objects.order_by("alert_time").values_list("alert_time", flat=True).first() or end
+    differences = {offset - default_offset for offset, default_offset in iter_offsets(tzinfo, start, end)}
+    if differences == {timedelta(0)}:
+        return levels
+    if all(difference.total_seconds() % 3600 == 0 for difference in differences):
+        return (AlertRollup.GRANULARITY_HOUR,)
+    return ()
+
+
+def count_alerts(start=None, end=None, group_by=("alg__name", "status"), bucket=None, tzinfo=None, **filters):
+    """
+    Количество тревог в интервале [start, end) по группам `group_by`.
+    Основная часть берётся из `AlertRollup`, неполные часы по краям — из `Alert`
+    (диапазонные условия по `alert_time`, которые используют индекс).
+    Если задан `bucket` (hour/day/week), к группам добавляется начало периода
+    в часовом поясе `tzinfo` (поле "period").
+    Возвращает словарь {кортеж значений group_by: количество}.
+    """
+    raw, hours, days = split_range(start, end)
+    if bucket is not None:
+        levels = get_rollup_levels(tzinfo, start, end)
+        if not levels:
+            raw, hours, days = [(start, end)], [], []
+        elif bucket == "hour" or AlertRollup.GRANULARITY_DAY not in levels:
+            # Суточные агрегаты не делятся на часы и не переносятся в другой пояс
+            hours, days = hours + days, []
+        group_by = ("period",) + tuple(group_by)
+    counts = {}
+
+    def collect(queryset, field, aggregate):
+        if bucket is not None:
+            queryset = queryset.annotate(period=Trunc(field, bucket, tzinfo=tzinfo))
+        for row in queryset.values(*group_by).annotate(total=aggregate).order_by():
+            key = tuple(row[name] for name in group_by)
+            counts[key] = counts.get(key, 0) + row["total"]
+
+    if hours or days:
+        rollup_q = (
+            _range_q("bucket", hours, granularity=AlertRollup.GRANULARITY_HOUR)
+            | _range_q("bucket", days, granularity=AlertRollup.GRANULARITY_DAY)
+        )
+        collect(AlertRollup.objects.filter(rollup_q, **filters), "bucket", Sum("count"))
+
+    if raw:
+        collect(Alert.objects.filter(_range_q("alert_time", raw), **filters), "alert_time", Count("id"))
+
+    return {key: total for key, total in counts.items() if total}
@@ -0,0 +1,68 @@
+import hashlib
+import os
+import re
+
+from django.core.files.storage import FileSystemStorage
+
+from .metrics import STAGE_SECONDS
+
+BLOB_NAME_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def get_content_hash(content):
+    """sha256 содержимого: готовый атрибут `sha256` (загрузка/base64) или потоковый подсчёт."""
+    checksum = getattr(content, "sha256", None)
+    if checksum:
+        return checksum
+    checksum = hashlib.sha256()
+    if hasattr(content, "seek"):
+        content.seek(0)
+    for chunk in content.chunks():
+        checksum.update(chunk)
+    if hasattr(content, "seek"):
+        content.seek(0)
+    return checksum.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Файловое хранилище с адресацией по содержимому: файл сохраняется как
+    `<каталог upload_to>/<ab>/<cd>/<sha256>.<ext>`, одинаковые байты записываются
+    один раз. Ссылки на файлы учитывает `MediaBlob`, удаляет неиспользуемые
+    `python manage.py gc_alert_media`.
+    """
+
+    def __init__(self, **kwargs):
+        # Параллельная запись одного и того же блоба даёт те же байты — перезапись безопасна
+        kwargs.setdefault("allow_overwrite", True)
+        super().__init__(**kwargs)
+
+    def blob_name(self, name, content):
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        checksum = get_content_hash(content)
+        return os.path.join(directory, checksum[:2], checksum[2:4], f"{checksum}{extension}")
+
+    def _save(self, name, content):
+        # models импортирует этот модуль (storage полей), поэтому импорт — при вызове
+        from .models import MediaBlob
+
+        name = self.blob_name(name, content)
+        # Запись MediaBlob обновляется и блокируется до конца транзакции приёма, поэтому
+        # `collect_garbage` не удалит найденный файл до `acquire`. Если записи нет (файл
+        # только что удалён сборщиком или не учтён), файл записывается заново
+        if MediaBlob.objects.touch(name) and self.exists(name):
+            # Такой файл уже есть — повторная запись не нужна
+            return name
+        with STAGE_SECONDS.time("media", "write"):
+            return super()._save(name, content)
+
+    def is_blob(self, name):
+        return bool(BLOB_NAME_RE.match(os.path.splitext(os.path.basename(name))[0]))
+
+
+alert_media_storage = ContentAddressedStorage()
+
+
+def get_alert_media_storage():
+    return alert_media_storage
@@ -0,0 +1,150 @@
+"""
+Подавление повторов тревог при приёме. Повтор — тревога того же устройства, источника
+и алгоритма, пришедшая не позже чем через окно подавления после предыдущего срабатывания
+серии (окно скользящее). Повтор не создаёт новую тревогу и уведомление: в первой тревоге
+серии увеличивается `hit_count`, обновляются `last_hit_at` и последний кадр (`last_image`).
+
+Серии хранятся в памяти процесса (LRU-индекс), поэтому при нескольких воркерах каждый
+сливает повторы отдельно. Идентификатор слитого повтора записывается в AlertKey на первую
+тревогу серии: повторная отправка того же `aibox_alert_id` после перезапуска, вытеснения
+серии из индекса или на другой воркер определяется как дубликат, а не как новая тревога. Если задан ALERT_SUPPRESSION_HASH_DISTANCE, кадры сравниваются
+по dHash: кадр, отличающийся от последнего кадра серии сильнее порога, начинает новую тревогу.
+"""
+import logging
+from collections import deque
+
+from django.conf import settings
+from django.db import transaction
+from PIL import Image, UnidentifiedImageError
+
+from visionaibox.cache import TTLCache
+from .events import publish_alerts_hit
+from .lookups import get_or_create_algorithm
+from .models import Alert, AlertKey, MediaBlob
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних `aibox_alert_id` серии помнить, чтобы повтор отправки определялся без обращения к AlertKey
+SEEN_IDS = 64
+# Записи индекса живут не дольше суток; устаревшие по окну отсекаются при проверке
+burst_index = TTLCache(maxsize=settings.ALERT_SUPPRESSION_INDEX_SIZE, ttl=24 * 3600)
+
+
+class Burst:
+    """Серия повторов: первая тревога (pk и ключ секции), время и dHash последнего срабатывания."""
+    __slots__ = ("alert_id", "alert_time", "last_time", "image_hash", "seen_ids")
+
+    def __init__(self, alert, timestamp, image_hash):
+        self.alert_id = alert.pk
+        self.alert_time = alert.alert_time
+        self.last_time = timestamp
+        self.image_hash = image_hash
+        self.seen_ids = deque([alert.aibox_alert_id], maxlen=SEEN_IDS)
+
+
+def get_image_hash(file):
+    """
+    dHash изображения (64 бита): кадр уменьшается до 9×8 в оттенках серого, биты —
+    сравнение соседних по горизонтали пикселей. Для нечитаемого изображения — None.
+    """
+    try:
+        file.seek(0)
+        with Image.open(file) as image:
+            image.draft("L", (64, 64))
+            pixels = list(image.convert("L").resize((9, 8), Image.Resampling.BILINEAR).getdata())
+    except (UnidentifiedImageError, OSError) as e:
+        logger.warning("Не удалось вычислить dHash изображения тревоги: %s", e)
+        return None
+    finally:
+        file.seek(0)
+    value = 0
+    for row in range(8):
+        for column in range(8):
+            value = value << 1 | (pixels[row * 9 + column] > pixels[row * 9 + column + 1])
+    return value
+
+
+def get_burst_key(data):
+    source = data.get("source") or {}
+    alg = data.get("alg") or {}
+    return data["device"].id, str(source.get("id")), alg.get("name")
+
+
+def get_suppression_window(data):
+    alg = data.get("alg")
+    if alg and alg.get("name"):
+        window = get_or_create_algorithm(alg).suppression_window
+        if window is not None:
+            return window
+    return settings.ALERT_SUPPRESSION_WINDOW
+
+
+def is_same_scene(burst, image_hash):
+    distance = settings.ALERT_SUPPRESSION_HASH_DISTANCE
+    if distance is None or burst.image_hash is None or image_hash is None:
+        return True
+    return (burst.image_hash ^ image_hash).bit_count() <= distance
+
+
+def find_burst(data):
+    """
+    Серия, в которую нужно слить тревогу (validated_data AlertCreateSerializer), или None.
+    Возвращает (burst, image_hash); dHash считается, только если кадры сравниваются.
+    """
+    window = get_suppression_window(data)
+    if not window:
+        return None, None
+    image = data.get("image")
+    image_hash = get_image_hash(image) if image and settings.ALERT_SUPPRESSION_HASH_DISTANCE is not None else None
+    burst = burst_index.get(get_burst_key(data))
+    if burst is None or abs(data["alert_time"].timestamp() - burst.last_time) > window:
+        return None, image_hash
+    if data["id"] not in burst.seen_ids and not is_same_scene(burst, image_hash):
+        return None, image_hash
+    return burst, image_hash
+
+
+def start_burst(alert, data, image_hash):
+    """Регистрирует новую тревогу как начало серии (после фиксации транзакции)."""
+    if not get_suppression_window(data):
+        return
+    burst = Burst(alert, data["alert_time"].timestamp(), image_hash)
+    key = get_burst_key(data)
+    transaction.on_commit(lambda: burst_index.set(key, burst))
+
+
+def add_hit(burst, data, image_hash):
+    """
+    Сливает повтор в первую тревогу серии: hit_count + 1, last_hit_at и последний кадр.
+    Возвращает тревогу или None, если её уже нет (например, удалена по политике хранения).
+    Если `aibox_alert_id` уже принят, бросает IntegrityError (повтор отправки, см. ingest_alert).
+    """
+    with transaction.atomic():
+        alert = (
+            Alert.objects.select_for_update()
+            .only("alert_time", "company", "hit_count", "last_hit_at", "last_image")
+            .filter(pk=burst.alert_id, alert_time=burst.alert_time)
+            .first()
+        )
+        if alert is None:
+            burst_index.delete(get_burst_key(data))
+            return None
+        AlertKey.objects.create(aibox_alert_id=data["id"], alert=alert, alert_time=alert.alert_time)
+        old_image = alert.last_image.name
+        values = {"hit_count": alert.hit_count + 1, "last_hit_at": data["alert_time"]}
+        image = data.get("image")
+        if image:
+            alert.last_image.save(image.name, image, save=False)
+            values["last_image"] = alert.last_image.name
+            MediaBlob.objects.acquire([alert.last_image.name])
+            if old_image:
+                MediaBlob.objects.release([old_image])
+        Alert.objects.filter(pk=alert.pk, alert_time=alert.alert_time).update(**values)
+        alert.hit_count, alert.last_hit_at = values["hit_count"], values["last_hit_at"]
+        publish_alerts_hit([alert])
+
+    burst.last_time = data["alert_time"].timestamp()
+    burst.seen_ids.append(data["id"])
+    if image_hash is not None:
+        burst.image_hash = image_hash
+    return alert
@@ -1,3 +1,1584 @@
-from django.test import TestCase
+import asyncio
+import base64
+import gzip
+import hashlib
+import io
+import json
+import os
+import random
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+from unittest import mock, skipUnless
+from zoneinfo import ZoneInfo
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Trunc
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils.timezone import now
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+
+from companies.models import Company
+from devices.lookups import device_cache, source_cache
+from devices.models import Device, Source
+from users.lookups import recipient_cache
+from users.models import User
+from tgbot.models import BotNotification
+from visionaibox.metrics import enable_query_counting
+from visionaibox.middleware import HTTP_REQUEST_QUERIES, HTTP_REQUESTS
+from visionaibox.tests import SharedReferenceCacheMixin, get_sample
+from .lookups import algorithm_cache
+from .metrics import ALERTS, STAGE_SECONDS
+from .models import Alert, AlertKey, AlertRetentionPolicy, AlertRollup, Algorithm, MediaBlob
+from . import previews
+from .partitions import (
+    add_months, create_partition, default_partition_name, detach_partition, get_dependent_tables, is_partitioned,
+    list_partitions, month_start, partition_name,
+)
+from .events import broker
+from .pagination import AlertCursorPagination
+from .retention import apply_retention
+from .serializers import AlertSerializer
+from .stats import count_alerts, get_rollup_levels, split_range
+from .storage import alert_media_storage
+from .suppression import burst_index, get_image_hash
+from .throttling import _outbox_depth, company_limiter, device_limiter, get_alert_devices, inflight
+
+ALERTS_URL = "/api/algorithms/v1/alerts/"
+ALERTS_ASYNC_URL = "/api/algorithms/v2/alerts/"
+
+
+class AlertTestMixin:
+    """
+    Компания с устройством AIBox `aibox_id` и камерой «1», отправка тревог в формате AIBox.
+    Кэши справочников общие для процесса, а данные каждого теста откатываются — сбрасываем их перед тестом.
+    """
+    aibox_id = "aibox-test"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name="Company")
+        cls.device = Device.objects.create(company=cls.company, aibox_id=cls.aibox_id, name="AIBox")
+        cls.source = Source.objects.create(device=cls.device, source_id="1", ipv4="10.0.0.1")
+
+    def setUp(self):
+        super().setUp()
+        for cache in (device_cache, source_cache, algorithm_cache, recipient_cache):
+            cache.invalidate()
+
+    def alert_body(self, aibox_alert_id, alert_time=None, aibox_id=None, **fields):
+        return {
+            "id": aibox_alert_id, "alert_time": (alert_time or now()).timestamp(),
+            "device": {"id": aibox_id or self.aibox_id}, "source": {"id": "1"}, **fields,
+        }
+
+    def push(self, aibox_alert_id, alert_time=None, url=ALERTS_URL, client=None, **fields):
+        return (client or self.client).post(url, self.alert_body(aibox_alert_id, alert_time, **fields),
+                                            content_type="application/json")
+
+
+class MediaStorageTestMixin:
+    """Медиафайлы тестов пишутся во временный MEDIA_ROOT."""
+
+    def setUp(self):
+        super().setUp()
+        media_root = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+
+    def save_media(self, content, name="alerts/images/alert.jpg"):
+        return alert_media_storage.save(name, ContentFile(content))
+
+
+@skipUnless(connection.vendor == "postgresql", "Планы запросов проверяются только на PostgreSQL")
+class AlertQueryPlanTests(AlertTestMixin, TestCase):
+    """Запросы приёма тревог и статистики должны использовать индексы, а не полный просмотр таблиц."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.algorithm = Algorithm.objects.create(key="fire", name="Огонь", type="detect")
+        cls.alert = Alert.objects.create(
+            aibox_alert_id="alert-1", alert_time=now(), device=cls.device, source=cls.source,
+            alg=cls.algorithm, company=cls.company,
+        )
+        AlertRollup.objects.add_alerts([cls.alert])
+
+    def setUp(self):
+        super().setUp()
+        # На маленьких таблицах планировщик выбирает Seq Scan; запрещаем его,
+        # чтобы проверить, что для запроса вообще есть подходящий индекс
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def assertUsesIndex(self, queryset, table):
+        plan = queryset.explain()
+        self.assertNotIn(f"Seq Scan on {table}", plan)
+        self.assertIn("Index", plan)
+
+    def test_device_lookup(self):
+        self.assertUsesIndex(Device.objects.filter(aibox_id=self.aibox_id), "devices_device")
+
+    def test_source_lookup(self):
+        self.assertUsesIndex(Source.objects.filter(device=self.device, source_id="1"), "devices_source")
+
+    def test_duplicate_alert_lookup(self):
+        self.assertUsesIndex(AlertKey.objects.filter(aibox_alert_id="alert-1"), "algorithms_alertkey")
+
+    def test_rollup_increment_lookup(self):
+        key = AlertRollup.objects.get_deltas(self.alert).popitem()[0]
+        lookup = dict(zip(AlertRollup.objects.KEY_FIELDS, key))
+        self.assertUsesIndex(AlertRollup.objects.filter(**lookup), "algorithms_alertrollup")
+
+    def test_stats_time_range(self):
+        queryset = (
+            Alert.objects.filter(alert_time__gte=now() - timedelta(minutes=30), alert_time__lt=now())
+            .values("alg__name", "status").annotate(total=Count("id")).order_by()
+        )
+        self.assertUsesIndex(queryset, "algorithms_alert")
+
+    def test_stats_rollup_range(self):
+        queryset = (
+            AlertRollup.objects.filter(granularity=AlertRollup.GRANULARITY_DAY, bucket__gte=now() - timedelta(days=30))
+            .values("alg__name", "status").annotate(total=Sum("count")).order_by()
+        )
+        self.assertUsesIndex(queryset, "algorithms_alertrollup")
+
+    def test_list_first_page(self):
+        queryset = Alert.objects.filter(company=self.company).order_by("-alert_time", "-id")[:50]
+        self.assertUsesIndex(queryset, "algorithms_alert")
+
+    def test_list_next_page(self):
+        alert_time = now()
+        queryset = (
+            Alert.objects.filter(company=self.company, alert_time__lte=alert_time)
+            .exclude(alert_time=alert_time, id__gte=self.alert.pk).order_by("-alert_time", "-id")[:50]
+        )
+        self.assertUsesIndex(queryset, "algorithms_alert")
+
+    def test_pending_alerts(self):
+        queryset = Alert.objects.filter(company=self.company, status=Alert.STATUS_PENDING).order_by(F("alert_time").desc())[:50]
+        self.assertUsesIndex(queryset, "algorithms_alert")
+
+    def test_previews_queue(self):
+        queryset = Alert.objects.filter(previews_generated_at__isnull=True, image__gt="").order_by("id")[:50]
+        self.assertUsesIndex(queryset, "algorithms_alert")
+
+
+class AlertQueryCountTests(AlertTestMixin, TestCase):
+    """
+    Число SQL-запросов основных эндпоинтов в установившемся режиме (справочники в кэше).
+    Рост числа запросов — регрессия; задержки измеряет `python manage.py benchmark_api`.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.algorithm = Algorithm.objects.create(key="fire", name="Огонь", type="detect")
+        cls.executive = User.objects.create(company=cls.company, telegram_id=1001, is_executive=True)
+        cls.security = User.objects.create(company=cls.company, telegram_id=1002, is_security=True)
+        cls.alerts = [
+            Alert.objects.create(
+                aibox_alert_id=f"alert-{index}", alert_time=now() - timedelta(minutes=index), device=cls.device,
+                source=cls.source, alg=cls.algorithm, company=cls.company,
+            )
+            for index in range(3)
+        ]
+        AlertRollup.objects.add_alerts(cls.alerts)
+
+    def test_ingest(self):
+        self.push("push-0", alg={"name": "fire"})
+        with self.assertNumQueries(7):
+            self.assertEqual(self.push("push-1", alg={"name": "fire"}).status_code, 201)
+
+    def test_ingest_async(self):
+        self.push("push-0", url=ALERTS_ASYNC_URL, alg={"name": "fire"})
+        with self.assertNumQueries(7):
+            self.assertEqual(self.push("push-1", url=ALERTS_ASYNC_URL, alg={"name": "fire"}).status_code, 201)
+
+    def test_list(self):
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/algorithms/v1/alerts/?page_size=50")
+        self.assertEqual(len(response.json()["results"]), 3)
+
+    def test_send_action(self):
+        with self.assertNumQueries(9):
+            response = self.client.post(
+                f"/api/algorithms/v1/alerts/{self.alerts[0].pk}/send-action/", {"action": "confirm"},
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_stats(self):
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get("/api/algorithms/alert-stats/?period=month").status_code, 200)
+
+    def test_telegram_link(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(f"/api/users/v1/get_telegram_link/{self.executive.pk}/")
+        self.assertEqual(response.status_code, 200)
+
+    def test_register_telegram(self):
+        User.objects.filter(pk=self.executive.pk).update(telegram_token="token")
+        with self.assertNumQueries(3):
+            response = self.client.post("/api/users/v1/register_telegram/", {"telegram_id": 2001, "token": "token"},
+                                        content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+
+
+class AlertListPaginationTests(AlertTestMixin, TestCase):
+    """Курсорная пагинация списка: страницы без пропусков и повторов, в том числе при одинаковом alert_time."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other_source = Source.objects.create(device=cls.device, source_id="2", ipv4="10.0.0.2")
+        started = now().replace(microsecond=0) - timedelta(hours=1)
+        # Три тревоги с одним временем попадают на границу страниц по 2
+        minutes = (0, 1, 1, 1, 2, 3, 3)
+        cls.alerts = [
+            Alert.objects.create(
+                aibox_alert_id=f"page-{index}", alert_time=started - timedelta(minutes=minute), device=cls.device,
+                source=cls.source if index % 2 else cls.other_source,
+                status=Alert.STATUS_CONFIRMED if index % 3 == 0 else Alert.STATUS_PENDING,
+            )
+            for index, minute in enumerate(minutes)
+        ]
+
+    def expected(self, alerts=None):
+        alerts = sorted(alerts or self.alerts, key=lambda alert: (alert.alert_time, alert.pk), reverse=True)
+        return [alert.pk for alert in alerts]
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def follow(self, data, link):
+        """Страницы (списки id), начиная с `data` и дальше по ссылке `next` или `previous`."""
+        pages = [[row["id"] for row in data["results"]]]
+        while data[link]:
+            data = self.get(data[link])
+            pages.append([row["id"] for row in data["results"]])
+        return pages, data
+
+    def test_next_and_previous(self):
+        pages, last = self.follow(self.get(f"{ALERTS_URL}?page_size=2"), "next")
+        self.assertEqual([len(page) for page in pages], [2, 2, 2, 1])
+        self.assertEqual(sum(pages, []), self.expected())
+        self.assertIsNone(last["next"])
+        previous, first = self.follow(last, "previous")
+        self.assertEqual(previous, pages[::-1])
+        self.assertIsNone(first["previous"])
+
+    def test_stable_when_alerts_arrive(self):
+        first = self.get(f"{ALERTS_URL}?page_size=3")
+        self.assertEqual([row["id"] for row in first["results"]], self.expected()[:3])
+        # Пока дашборд листал список, пришли новая тревога и тревога с тем же временем, что у последней на странице
+        boundary = Alert.objects.get(pk=first["results"][-1]["id"])
+        for aibox_alert_id, alert_time in (("page-new", now()), ("page-tie", boundary.alert_time)):
+            Alert.objects.create(aibox_alert_id=aibox_alert_id, alert_time=alert_time, device=self.device,
+                                 source=self.source)
+        pages, _ = self.follow(self.get(first["next"]), "next")
+        self.assertEqual(sum(pages, []), self.expected()[3:])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(f"{ALERTS_URL}?cursor={base64.b64encode(b'p=yesterday').decode()}")
+        self.assertEqual(response.status_code, 404)
+
+    def test_filters_with_cursor(self):
+        query = f"status={Alert.STATUS_PENDING}&source={self.source.pk}&page_size=1"
+        first = self.get(f"{ALERTS_URL}?{query}")
+        self.assertIn(f"source={self.source.pk}", first["next"])
+        pages, _ = self.follow(first, "next")
+        self.assertEqual(sum(pages, []), self.expected([
+            alert for alert in self.alerts if alert.status == Alert.STATUS_PENDING and alert.source == self.source
+        ]))
+
+    def test_sparse_fields_with_cursor(self):
+        first = self.get(f"{ALERTS_URL}?fields=id,hit_count&page_size=3")
+        self.assertEqual(set(first["results"][0]), {"id", "hit_count"})
+        pages, _ = self.follow(first, "next")
+        self.assertEqual(sum(pages, []), self.expected())
+
+    def test_page_size_limits(self):
+        with mock.patch.object(AlertCursorPagination, "page_size", 2), \
+                mock.patch.object(AlertCursorPagination, "max_page_size", 3):
+            for query, size in (("", 2), ("?page_size=abc", 2), ("?page_size=0", 2), ("?page_size=1", 1),
+                                ("?page_size=100", 3)):
+                with self.subTest(query=query):
+                    self.assertEqual(len(self.get(f"{ALERTS_URL}{query}")["results"]), size)
+
+
+class AlertListSerializerTests(AlertTestMixin, MediaStorageTestMixin, TestCase):
+    """Список из values() (AlertListSerializer) совпадает с AlertSerializer поле в поле."""
+
+    def setUp(self):
+        super().setUp()
+        Device.objects.filter(pk=self.device.pk).update(desc="Вход «А»")
+        algorithm = Algorithm.objects.create(key="fire", name="Огонь", type="detect")
+        media = {
+            field: self.save_media(f"{field}".encode(), f"alerts/{field}/frame.jpg") for field in Alert.MEDIA_FIELDS
+        }
+        # Со всеми связями и файлами, время с микросекундами
+        Alert.objects.create(
+            aibox_alert_id="full", alert_time=datetime(2024, 3, 1, 12, 30, 15, 123456, tzinfo=timezone.utc),
+            device=self.device, source=self.source, alg=algorithm, company=self.company, hazard_level="3",
+            hit_count=4, last_hit_at=datetime(2024, 3, 1, 12, 31, tzinfo=timezone.utc),
+            reserved_data={"boxes": [[1, 2, 3, 4]], "label": "огонь"}, **media,
+        )
+        # Без алгоритма, файлов и дополнительных данных
+        Alert.objects.create(aibox_alert_id="bare", alert_time=datetime(2024, 3, 1, tzinfo=timezone.utc),
+                             device=self.device, source=self.source, company=self.company)
+
+    def assertMatchesAlertSerializer(self, fields=None):
+        query = f"?fields={','.join(fields)}" if fields else ""
+        response = self.client.get(f"{ALERTS_URL}{query}")
+        self.assertEqual(response.status_code, 200)
+        expected = AlertSerializer(Alert.objects.order_by("-alert_time", "-id"), many=True, fields=fields,
+                                   context={"request": RequestFactory().get("/")}).data
+        self.assertEqual(response.json()["results"], json.loads(JSONRenderer().render(expected)))
+
+    def test_all_fields(self):
+        self.assertMatchesAlertSerializer()
+        results = self.client.get(ALERTS_URL).json()["results"]
+        # Проверка не вырождена: у первой тревоги заполнены все связи и файлы, у второй — пустые
+        self.assertTrue(all(results[0][field] for field in AlertSerializer.Meta.fields))
+        self.assertEqual([results[1][field] for field in ("alg", "image", "last_hit_at", "reserved_data")],
+                         [None] * 4)
+
+    @override_settings(TIME_ZONE="Asia/Bishkek")
+    def test_local_time_zone(self):
+        self.assertMatchesAlertSerializer()
+
+    def test_sparse_fields(self):
+        for fields in (["id"], ["alert_time", "alg", "image"], ["device", "source", "company", "last_image"]):
+            with self.subTest(fields=fields):
+                self.assertMatchesAlertSerializer(fields)
+
+
+class AlertReplayTests(AlertTestMixin, TestCase):
+    """Повтор тревоги AIBox с тем же `id` (с любым `alert_time`) не создаёт вторую тревогу и уведомление."""
+
+    def replay(self, alert_time, url=ALERTS_URL):
+        return self.push("replay-1", alert_time, url, alg={"name": "fire"})
+
+    def assertReceivedOnce(self):
+        self.assertEqual(Alert.objects.filter(aibox_alert_id="replay-1").count(), 1)
+        self.assertEqual(BotNotification.objects.filter(alert__aibox_alert_id="replay-1").count(), 1)
+
+    def test_replay_same_time(self):
+        alert_time = now()
+        self.assertEqual(self.replay(alert_time).status_code, 201)
+        response = self.replay(alert_time)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["message"], "alert already received")
+        self.assertReceivedOnce()
+
+    def test_replay_with_other_time(self):
+        self.assertEqual(self.replay(now()).status_code, 201)
+        # Повтор после перезапуска AIBox может прийти с другим временем — в том числе в другой секции
+        response = self.replay(now() - timedelta(days=40))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["message"], "alert already received")
+        self.assertReceivedOnce()
+
+    def test_replay_with_other_time_async(self):
+        self.assertEqual(self.replay(now(), ALERTS_ASYNC_URL).status_code, 201)
+        response = self.replay(now() + timedelta(hours=1), ALERTS_ASYNC_URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertReceivedOnce()
+
+    def test_orm_create_is_unique(self):
+        Alert.objects.create(aibox_alert_id="orm-1", alert_time=now(), device=self.device, source=self.source)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Alert.objects.create(
+                aibox_alert_id="orm-1", alert_time=now() - timedelta(days=1), device=self.device, source=self.source
+            )
+        self.assertEqual(Alert.objects.filter(aibox_alert_id="orm-1").count(), 1)
+
+
+class AlertConcurrentReplayTests(AlertTestMixin, TransactionTestCase):
+    """Одновременные повторы одной тревоги (ретраи AIBox) дают одну тревогу, остальные — ответ о дубликате, а не 500."""
+    workers = 4
+
+    def setUp(self):
+        super().setUp()
+        # TransactionTestCase не вызывает setUpTestData, а таблицы очищает после каждого теста
+        self.setUpTestData()
+
+    def push_concurrently(self, url):
+        barrier = threading.Barrier(self.workers)
+        responses = []
+
+        def push(index):
+            try:
+                barrier.wait()
+                response = self.push("race-1", now() - timedelta(seconds=index), url, client=Client(),
+                                     alg={"name": "fire"})
+                responses.append((response.status_code, response.json()["message"]))
+            finally:
+                close_old_connections()
+
+        threads = [threading.Thread(target=push, args=(index,)) for index in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sorted(responses)
+
+    def assertReceivedOnce(self, responses):
+        self.assertEqual(responses, [(200, "alert already received")] * (self.workers - 1)
+                         + [(201, "alert push successful")])
+        self.assertEqual(Alert.objects.filter(aibox_alert_id="race-1").count(), 1)
+        self.assertEqual(AlertKey.objects.filter(aibox_alert_id="race-1").count(), 1)
+        self.assertEqual(BotNotification.objects.count(), 1)
+        self.assertEqual(AlertRollup.objects.filter(granularity=AlertRollup.GRANULARITY_HOUR)
+                         .aggregate(total=Sum("count"))["total"], 1)
+
+    def test_concurrent_replays(self):
+        self.assertReceivedOnce(self.push_concurrently(ALERTS_URL))
+
+    def test_concurrent_replays_async(self):
+        self.assertReceivedOnce(self.push_concurrently(ALERTS_ASYNC_URL))
+
+
+class AlertPartitionTests(AlertTestMixin, MediaStorageTestMixin, TestCase):
+    """Помесячные секции таблицы тревог (algorithms/partitions.py)."""
+    table = Alert._meta.db_table
+
+    def test_month_helpers(self):
+        # Границы секций — в UTC: 1 апреля 02:00 по Бишкеку — ещё март
+        self.assertEqual(month_start(datetime(2024, 4, 1, 2, tzinfo=ZoneInfo("Asia/Bishkek"))),
+                         datetime(2024, 3, 1, tzinfo=timezone.utc))
+        self.assertEqual(add_months(datetime(2024, 11, 1, tzinfo=timezone.utc), 3),
+                         datetime(2025, 2, 1, tzinfo=timezone.utc))
+        self.assertEqual(add_months(datetime(2024, 1, 1, tzinfo=timezone.utc), -13),
+                         datetime(2022, 12, 1, tzinfo=timezone.utc))
+        self.assertEqual(partition_name(self.table, datetime(2024, 3, 1)), f"{self.table}_p2024_03")
+
+    def count_rows(self, cursor, table):
+        cursor.execute(f'SELECT count(*) FROM "{table}"')
+        return cursor.fetchone()[0]
+
+    @skipUnless(connection.vendor == "postgresql", "Секционирование есть только в PostgreSQL")
+    def test_current_month_partition(self):
+        with connection.cursor() as cursor:
+            self.assertTrue(is_partitioned(cursor, self.table))
+            partitions = {name: (start, end) for name, start, end in list_partitions(cursor, self.table)}
+        current = month_start(now())
+        self.assertEqual(partitions[partition_name(self.table, current)], (current, add_months(current, 1)))
+        self.assertEqual(partitions[default_partition_name(self.table)], (None, None))
+
+    @skipUnless(connection.vendor == "postgresql", "Секционирование есть только в PostgreSQL")
+    def test_create_and_detach_partition(self):
+        alert_time = now().replace(year=now().year + 20)
+        alert = Alert.objects.create(aibox_alert_id="far-1", alert_time=alert_time, device=self.device,
+                                     source=self.source)
+        month = month_start(alert_time)
+        name = partition_name(self.table, month)
+        with connection.cursor() as cursor:
+            # Секции на этот месяц нет — строка лежит в DEFAULT и переносится при создании секции
+            self.assertEqual(self.count_rows(cursor, default_partition_name(self.table)), 1)
+            self.assertTrue(create_partition(cursor, self.table, month))
+            self.assertFalse(create_partition(cursor, self.table, month))
+            self.assertEqual(self.count_rows(cursor, default_partition_name(self.table)), 0)
+            self.assertEqual(self.count_rows(cursor, name), 1)
+        self.assertEqual(AlertKey.objects.get_alert("far-1"), alert)
+
+        with connection.cursor() as cursor:
+            # Отложенные проверки внешних ключей вставленных в тесте строк мешают DROP TABLE в той же транзакции
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+            detach_partition(cursor, self.table, name, get_dependent_tables(Alert), drop=True)
+        self.assertFalse(Alert.objects.filter(pk=alert.pk).exists())
+        # Ключ тревоги удаляется вместе с секцией, id можно принять снова
+        self.assertFalse(AlertKey.objects.filter(aibox_alert_id="far-1").exists())
+
+    def detach_old_partition(self, drop):
+        """Отсоединяет командой секцию с одной тревогой 30-летней давности, возвращает число ссылок на её файл."""
+        alert_time = now().replace(year=now().year - 30)
+        name = self.save_media(b"partition")
+        alert = Alert.objects.create(aibox_alert_id="old-1", alert_time=alert_time, device=self.device,
+                                     source=self.source, image=name)
+        MediaBlob.objects.acquire([name])
+        partition = partition_name(self.table, month_start(alert_time))
+        with connection.cursor() as cursor:
+            create_partition(cursor, self.table, month_start(alert_time))
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        call_command("manage_alert_partitions", keep_months=12 * 25, drop=drop, stdout=io.StringIO())
+        self.assertFalse(Alert.objects.filter(pk=alert.pk).exists())
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [partition])
+            self.assertEqual(cursor.fetchone()[0], not drop)
+        return MediaBlob.objects.get(name=name).refcount
+
+    @skipUnless(connection.vendor == "postgresql", "Секционирование есть только в PostgreSQL")
+    def test_detach_keeps_media(self):
+        # Отсоединённая секция всё ещё ссылается на файл — сборщик мусора не должен его удалить
+        self.assertEqual(self.detach_old_partition(drop=False), 1)
+
+    @skipUnless(connection.vendor == "postgresql", "Секционирование есть только в PostgreSQL")
+    def test_drop_releases_media(self):
+        self.assertEqual(self.detach_old_partition(drop=True), 0)
+
+
+class AlertBulkIngestTests(AlertTestMixin, TestCase):
+    """Пакетный приём: созданными считаются только тревоги, получившие ключ AlertKey."""
+
+    def bulk(self, ids, alert_time=None):
+        alert_time = alert_time or now()
+        response = self.client.post("/api/algorithms/v1/alerts/bulk/", [
+            self.alert_body(aibox_alert_id, alert_time) for aibox_alert_id in ids
+        ], content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        return [item["message"] for item in response.json()["data"]]
+
+    def assertCounts(self, alerts):
+        self.assertEqual(Alert.objects.filter(device=self.device).count(), alerts)
+        self.assertEqual(BotNotification.objects.filter(alert__device=self.device).count(), alerts)
+        rollups = AlertRollup.objects.filter(device=self.device, granularity=AlertRollup.GRANULARITY_HOUR)
+        self.assertEqual(rollups.aggregate(total=Sum("count"))["total"] or 0, alerts)
+
+    def test_duplicates_within_batch(self):
+        self.assertEqual(self.bulk(["a", "a", "b"]), ["created", "duplicate", "created"])
+        self.assertCounts(2)
+
+    def test_duplicates_across_batches(self):
+        self.assertEqual(self.bulk(["a", "b"]), ["created", "created"])
+        self.assertEqual(self.bulk(["b", "c"], now() - timedelta(days=3)), ["duplicate", "created"])
+        self.assertCounts(3)
+
+    def test_concurrent_duplicate(self):
+        existing = Alert.objects.create(aibox_alert_id="a", alert_time=now(), device=self.device, source=self.source)
+        get_owners = AlertKey.objects.get_owners
+        checks = []
+
+        def racing_get_owners(aibox_alert_ids):
+            # Параллельный запрос вставил тревогу «a» уже после проверки дубликатов этой пачкой
+            checks.append(aibox_alert_ids)
+            return {} if len(checks) == 1 else get_owners(aibox_alert_ids)
+
+        with mock.patch.object(AlertKey.objects, "get_owners", side_effect=racing_get_owners):
+            self.assertEqual(self.bulk(["a", "b"]), ["duplicate", "created"])
+        self.assertEqual(list(Alert.objects.filter(aibox_alert_id="a")), [existing])
+        self.assertFalse(BotNotification.objects.filter(alert=existing).exists())
+        self.assertEqual(Alert.objects.filter(device=self.device).count(), 2)
+
+
+class MediaBlobGarbageTests(MediaStorageTestMixin, TestCase):
+    """Сборка мусора хранилища по содержимому не должна удалять файл, который переиспользует приём."""
+    grace = 3600
+
+    def make_unused(self, content):
+        name = self.save_media(content)
+        MediaBlob.objects.acquire([name])
+        MediaBlob.objects.release([name])
+        MediaBlob.objects.filter(name=name).update(updated_at=now() - timedelta(seconds=self.grace * 2))
+        return name
+
+    def test_unused_file_collected(self):
+        name = self.make_unused(b"unused")
+        self.assertEqual(MediaBlob.objects.collect_garbage(self.grace), 1)
+        self.assertFalse(alert_media_storage.exists(name))
+        self.assertFalse(MediaBlob.objects.filter(name=name).exists())
+
+    def test_reused_file_survives(self):
+        name = self.make_unused(b"reused")
+        # Приём нашёл файл, но ещё не вызвал acquire
+        self.assertEqual(self.save_media(b"reused"), name)
+        self.assertEqual(MediaBlob.objects.collect_garbage(self.grace), 0)
+        self.assertTrue(alert_media_storage.exists(name))
+
+    def test_missing_file_rewritten(self):
+        name = self.make_unused(b"missing")
+        alert_media_storage.delete(name)
+        self.assertEqual(self.save_media(b"missing"), name)
+        self.assertTrue(alert_media_storage.exists(name))
+
+
+class AlertMediaReleaseTests(AlertTestMixin, MediaStorageTestMixin, TestCase):
+    """Удаление тревоги любым путём освобождает ссылки на её медиафайлы."""
+
+    def create_alert(self, aibox_alert_id, content):
+        name = self.save_media(content)
+        alert = Alert.objects.create(aibox_alert_id=aibox_alert_id, alert_time=now(), device=self.device,
+                                     source=self.source, image=name)
+        MediaBlob.objects.acquire(alert.get_media_names())
+        return alert
+
+    def refcounts(self, alerts):
+        names = [alert.image.name for alert in alerts]
+        return dict(MediaBlob.objects.filter(name__in=names).values_list("name", "refcount"))
+
+    def test_delete_alert(self):
+        alert = self.create_alert("a", b"image")
+        alert.delete()
+        self.assertEqual(self.refcounts([alert]), {alert.image.name: 0})
+
+    def test_delete_queryset(self):
+        alerts = [self.create_alert("a", b"shared"), self.create_alert("b", b"shared"), self.create_alert("c", b"own")]
+        Alert.objects.filter(pk__in=[alerts[0].pk, alerts[2].pk]).delete()
+        self.assertEqual(self.refcounts(alerts), {alerts[0].image.name: 1, alerts[2].image.name: 0})
+
+    def test_device_cascade(self):
+        alerts = [self.create_alert("a", b"shared"), self.create_alert("b", b"shared"), self.create_alert("c", b"own")]
+        self.device.delete()
+        self.assertEqual(self.refcounts(alerts), {alerts[0].image.name: 0, alerts[2].image.name: 0})
+        self.assertFalse(AlertKey.objects.filter(aibox_alert_id__in=["a", "b", "c"]).exists())
+
+
+class AlertMediaUploadTests(AlertTestMixin, MediaStorageTestMixin, TestCase):
+    """Приём медиафайлов тревоги: base64 в JSON, multipart, загрузка файла к тревоге; размер и sha256."""
+    urls = (ALERTS_URL, ALERTS_ASYNC_URL)
+
+    def test_large_base64_body(self):
+        # Тело больше DATA_UPLOAD_MAX_MEMORY_SIZE (2,5 МБ) принимают обе версии API
+        video = os.urandom(2 * 1024 * 1024)
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.push(f"large-{url}", url=url, video=base64.b64encode(video).decode())
+                self.assertEqual(response.status_code, 201)
+                alert = Alert.objects.get(aibox_alert_id=f"large-{url}")
+                self.assertEqual(alert.video.read(), video)
+
+    @override_settings(ALERT_MEDIA_MAX_SIZE=1024)
+    def test_base64_over_media_limit(self):
+        for size in (1025, 8 * 1024):
+            for url in self.urls:
+                with self.subTest(size=size, url=url):
+                    response = self.push(f"too-large-{size}", url=url,
+                                         video=base64.b64encode(os.urandom(size)).decode())
+                    self.assertEqual(response.status_code, 400)
+                    self.assertEqual(response.json()["error_code"], -1)
+        self.assertFalse(Alert.objects.exists())
+
+    def push_multipart(self, aibox_alert_id, url, content, **fields):
+        return self.client.post(url, {
+            "alert": json.dumps(self.alert_body(aibox_alert_id)),
+            "image": SimpleUploadedFile("frame.jpg", content, content_type="image/jpeg"),
+            **fields,
+        })
+
+    def assertClientError(self, response, field):
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual((response.json()["error_code"], response.json()["message"]), (-1, "client error"))
+        self.assertIn(field, response.json()["data"])
+
+    def test_multipart(self):
+        image = make_image()
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.push_multipart(f"multipart-{url}", url, image,
+                                               image_sha256=hashlib.sha256(image).hexdigest().upper())
+                self.assertEqual(response.status_code, 201)
+                alert = Alert.objects.get(aibox_alert_id=f"multipart-{url}")
+                self.assertEqual(alert.image.read(), image)
+        # Одинаковые кадры хранятся одним файлом с двумя ссылками
+        self.assertEqual(list(MediaBlob.objects.values_list("refcount", flat=True)), [2])
+
+    def test_sha256_mismatch(self):
+        image = make_image()
+        for url in self.urls:
+            with self.subTest(url=url, upload="multipart"):
+                self.assertClientError(self.push_multipart("bad-sha", url, image, image_sha256="0" * 64), "image")
+            with self.subTest(url=url, upload="base64"):
+                response = self.push("bad-sha", url=url, image=base64.b64encode(image).decode(), image_sha256="0" * 64)
+                self.assertClientError(response, "image")
+        self.assertFalse(Alert.objects.exists())
+        self.assertFalse(MediaBlob.objects.filter(refcount__gt=0).exists())
+
+    @override_settings(ALERT_MEDIA_MAX_SIZE=1024)
+    def test_multipart_over_media_limit(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertClientError(self.push_multipart("too-large", url, os.urandom(1025)), "non_field_errors")
+        self.assertFalse(Alert.objects.exists())
+
+    def attach_url(self, alert, kind="image"):
+        return f"{ALERTS_URL}{alert.pk}/media/{kind}/"
+
+    def test_attach_media(self):
+        alert = Alert.objects.create(aibox_alert_id="attach-1", alert_time=now(), device=self.device,
+                                     source=self.source)
+        image, video = make_image(), os.urandom(4096)
+        # Бинарное тело с контрольной суммой в заголовке
+        response = self.client.post(self.attach_url(alert), image, content_type="image/jpeg",
+                                    headers={"X-Content-SHA256": hashlib.sha256(image).hexdigest()})
+        self.assertEqual(response.status_code, 201)
+        alert.refresh_from_db()
+        self.assertTrue(response.json()["data"]["image"].endswith(alert.image.url))
+        self.assertEqual(alert.image.read(), image)
+        # Multipart-поле `file` с контрольной суммой в поле `sha256`
+        response = self.client.post(self.attach_url(alert, "video"), {
+            "file": SimpleUploadedFile("clip.mp4", video), "sha256": hashlib.sha256(video).hexdigest(),
+        })
+        self.assertEqual(response.status_code, 201)
+        alert.refresh_from_db()
+        self.assertEqual(alert.video.read(), video)
+        self.assertEqual(dict(MediaBlob.objects.values_list("name", "refcount")),
+                         {alert.image.name: 1, alert.video.name: 1})
+
+        response = self.client.post(self.attach_url(alert), image, content_type="image/jpeg")
+        self.assertEqual(response.status_code, 409)
+        self.assertIn("image", response.json()["data"])
+
+    def test_attach_media_rejected(self):
+        alert = Alert.objects.create(aibox_alert_id="attach-1", alert_time=now(), device=self.device,
+                                     source=self.source)
+        response = self.client.post(self.attach_url(alert), make_image(), content_type="image/jpeg",
+                                    headers={"X-Content-SHA256": "0" * 64})
+        self.assertClientError(response, "non_field_errors")
+        with self.settings(ALERT_MEDIA_MAX_SIZE=1024):
+            self.assertClientError(self.client.post(self.attach_url(alert), os.urandom(1025),
+                                                    content_type="image/jpeg"), "file")
+            self.assertClientError(self.client.post(self.attach_url(alert), {
+                "file": SimpleUploadedFile("frame.jpg", os.urandom(1025)),
+            }), "file")
+        alert.refresh_from_db()
+        self.assertFalse(alert.image)
+        self.assertFalse(MediaBlob.objects.exists())
+
+
+def make_image(mirror=False, quality=75):
+    """JPEG с горизонтальным градиентом; зеркальный кадр даёт противоположный dHash."""
+    image = Image.linear_gradient("L").rotate(90 if mirror else -90).resize((64, 64))
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+@override_settings(ALERT_SUPPRESSION_WINDOW=60, ALERT_SUPPRESSION_HASH_DISTANCE=None)
+class AlertSuppressionTests(AlertTestMixin, MediaStorageTestMixin, TestCase):
+    """Повторы срабатывания в окне подавления сливаются в первую тревогу серии."""
+
+    def setUp(self):
+        super().setUp()
+        burst_index.clear()
+        self.started = now() - timedelta(hours=1)
+
+    def hit(self, aibox_alert_id, offset, image=None):
+        fields = {"image": base64.b64encode(image).decode()} if image is not None else {}
+        # Серия регистрируется в индексе после фиксации транзакции
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.push(aibox_alert_id, self.started + timedelta(seconds=offset), alg={"name": "fire"},
+                                 **fields)
+        self.assertIn(response.status_code, (200, 201))
+        return response.json()["message"]
+
+    def alerts(self):
+        return Alert.objects.filter(device=self.device).order_by("alert_time")
+
+    def test_hit_updates_first_alert(self):
+        self.assertEqual(self.hit("a", 0, make_image()), "alert push successful")
+        self.assertEqual(self.hit("b", 10, make_image(quality=50)), "alert coalesced")
+        self.assertEqual(self.hit("c", 20, make_image(quality=30)), "alert coalesced")
+        alert = self.alerts().get()
+        self.assertEqual(alert.hit_count, 3)
+        self.assertEqual(alert.last_hit_at, self.started + timedelta(seconds=20))
+        self.assertEqual(BotNotification.objects.filter(alert__device=self.device).count(), 1)
+        refcounts = dict(MediaBlob.objects.values_list("name", "refcount"))
+        # Первый кадр остаётся у тревоги, последний заменил предыдущий, а тот освобождён
+        self.assertEqual(refcounts.pop(alert.image.name), 1)
+        self.assertEqual(refcounts.pop(alert.last_image.name), 1)
+        self.assertEqual(list(refcounts.values()), [0])
+
+    def test_window_edge(self):
+        self.hit("a", 0)
+        self.assertEqual(self.hit("b", 60), "alert coalesced")
+        # Окно скользящее: отсчитывается от последнего срабатывания серии
+        self.assertEqual(self.hit("c", 121), "alert push successful")
+        self.assertEqual([alert.hit_count for alert in self.alerts()], [2, 1])
+
+    def test_hash_distance_edge(self):
+        first, mirrored = make_image(), make_image(mirror=True)
+        distance = (get_image_hash(io.BytesIO(first)) ^ get_image_hash(io.BytesIO(mirrored))).bit_count()
+        self.assertGreater(distance, 0)
+        with self.settings(ALERT_SUPPRESSION_HASH_DISTANCE=distance - 1):
+            self.hit("a", 0, first)
+            self.assertEqual(self.hit("b", 10, mirrored), "alert push successful")
+        with self.settings(ALERT_SUPPRESSION_HASH_DISTANCE=distance):
+            self.assertEqual(self.hit("c", 20, first), "alert coalesced")
+        self.assertEqual([alert.hit_count for alert in self.alerts()], [1, 2])
+
+    def test_replayed_hit_is_duplicate(self):
+        self.hit("a", 0)
+        self.hit("b", 10)
+        self.assertEqual(self.hit("b", 10), "alert already received")
+        # Индекс серий теряется при перезапуске, вытеснении или на другом воркере — повтор узнаётся по AlertKey
+        burst_index.clear()
+        self.assertEqual(self.hit("b", 10), "alert already received")
+        self.assertEqual(self.hit("b", 15), "alert already received")
+        alert = self.alerts().get()
+        self.assertEqual(alert.hit_count, 2)
+        self.assertEqual(AlertKey.objects.get(aibox_alert_id="b").alert_id, alert.pk)
+
+
+class AlertBulkActionTests(AlertTestMixin, TestCase):
+    """Пакетное подтверждение/отклонение: по списку id и по фильтру (без пустых фильтров, порциями не больше лимита)."""
+    url = "/api/algorithms/v1/alerts/bulk-action/"
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other = Device.objects.create(company=cls.company, aibox_id="aibox-other", name="AIBox")
+        cls.other_source = Source.objects.create(device=cls.other, source_id="1", ipv4="10.0.0.2")
+        for index in range(3):
+            Alert.objects.create(aibox_alert_id=f"action-{index}", alert_time=now(), device=cls.device,
+                                 source=cls.source)
+        Alert.objects.create(aibox_alert_id="action-other", alert_time=now(), device=cls.other,
+                             source=cls.other_source)
+
+    def post(self, body):
+        return self.client.post(self.url, body, content_type="application/json")
+
+    def test_empty_filter_rejected(self):
+        for alert_filter in ({}, {"status": "pending"}, {"device": ""}, {"hazard_level": ""},
+                             {"alert_time_after": ""}, {"alert_time_after": "", "alert_time_before": ""}):
+            with self.subTest(alert_filter=alert_filter):
+                response = self.post({"action": "reject", "filter": alert_filter})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()["error_code"], -1)
+                self.assertIn("filter", response.json()["data"])
+        self.assertEqual(Alert.objects.filter(status=Alert.STATUS_PENDING).count(), 4)
+
+    def test_alert_time_key_rejected(self):
+        response = self.post({"action": "reject", "filter": {"alert_time": "x"}})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("alert_time", str(response.json()["data"]["filter"]))
+        self.assertEqual(Alert.objects.filter(status=Alert.STATUS_PENDING).count(), 4)
+
+    @override_settings(ALERT_BULK_ACTION_MAX_ALERTS=2)
+    def test_filter_limit_and_has_more(self):
+        body = {"action": "reject", "filter": {"device": self.device.pk}}
+        self.assertEqual(self.post(body).json()["data"], {"updated_count": 2, "has_more": True})
+        self.assertEqual(self.post(body).json()["data"], {"updated_count": 1, "has_more": False})
+        self.assertEqual(self.post(body).json()["data"], {"updated_count": 0, "has_more": False})
+        self.assertEqual(Alert.objects.filter(device=self.device, status=Alert.STATUS_REJECTED).count(), 3)
+        self.assertEqual(Alert.objects.get(device=self.other).status, Alert.STATUS_PENDING)
+
+    def test_ids(self):
+        first, second, third = Alert.objects.filter(device=self.device).order_by("id")
+        self.assertTrue(second.reject_alert())
+        missing = third.pk + 1000
+        response = self.post({"action": "confirm", "ids": [first.pk, second.pk, missing, first.pk]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["data"], {"updated": [first.pk], "conflict": [second.pk], "not_found": [missing]})
+        self.assertEqual(Alert.objects.get(pk=first.pk).status, Alert.STATUS_CONFIRMED)
+        self.assertEqual(Alert.objects.get(pk=second.pk).status, Alert.STATUS_REJECTED)
+        self.assertEqual(Alert.objects.get(pk=third.pk).status, Alert.STATUS_PENDING)
+        # Учредители получают одно сводное уведомление, а не уведомление на тревогу
+        summary = BotNotification.objects.get()
+        self.assertIsNone(summary.alert_id)
+        self.assertFalse(summary.for_security)
+        # Повтор пакета ничего не меняет
+        response = self.post({"action": "confirm", "ids": [first.pk]})
+        self.assertEqual(response.json()["data"], {"updated": [], "conflict": [first.pk], "not_found": []})
+        self.assertEqual(BotNotification.objects.count(), 1)
+
+    @override_settings(ALERT_BULK_ACTION_MAX_ALERTS=10)
+    def test_filter_by_time_range(self):
+        alert = Alert.objects.filter(device=self.device).first()
+        Alert.objects.filter(pk=alert.pk).update(alert_time=now() - timedelta(days=2))
+        body = {"action": "reject", "filter": {"alert_time_before": (now() - timedelta(days=1)).isoformat()}}
+        self.assertEqual(self.post(body).json()["data"], {"updated_count": 1, "has_more": False})
+        self.assertEqual(list(Alert.objects.filter(status=Alert.STATUS_REJECTED).values_list("id", flat=True)),
+                         [alert.pk])
+
+
+class AlertStreamTests(AlertTestMixin, TestCase):
+    """Поток событий дашборда: только для вошедших пользователей и всегда по одной компании."""
+    url = "/api/algorithms/v2/alerts/stream/"
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other = Company.objects.create(name="Other")
+        cls.user = User.objects.create_user(email="user@example.com", password="x", company=cls.company)
+        cls.staff = User.objects.create_user(email="staff@example.com", password="x", is_staff=True)
+        cls.outsider = User.objects.create_user(email="outsider@example.com", password="x")
+
+    async def subscribe(self, user, query=""):
+        """Открывает поток и возвращает компанию его подписки (или ответ с ошибкой)."""
+        if user is not None:
+            await self.async_client.aforce_login(user)
+        response = await self.async_client.get(self.url + query)
+        if not response.streaming:
+            return response
+        existing = set(broker._subscriptions)
+        # Подписка создаётся при чтении первого события
+        await anext(aiter(response.streaming_content))
+        subscriptions = set(broker._subscriptions) - existing
+        for subscription in subscriptions:
+            broker.unsubscribe(subscription)
+        return {subscription.company_id for subscription in subscriptions}
+
+    async def test_anonymous_rejected(self):
+        response = await self.subscribe(None, "?company=1")
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()["error_code"], -1)
+
+    async def test_user_scoped_to_own_company(self):
+        self.assertEqual(await self.subscribe(self.user), {self.company.pk})
+        self.assertEqual(await self.subscribe(self.user, f"?company={self.company.pk}"), {self.company.pk})
+        response = await self.subscribe(self.user, f"?company={self.other.pk}")
+        self.assertEqual(response.status_code, 403)
+
+    async def test_user_without_company(self):
+        response = await self.subscribe(self.outsider, f"?company={self.company.pk}")
+        self.assertEqual(response.status_code, 403)
+
+    async def test_staff_must_choose_company(self):
+        response = await self.subscribe(self.staff)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("company", response.json()["data"])
+        self.assertEqual(await self.subscribe(self.staff, f"?company={self.other.pk}"), {self.other.pk})
+
+    async def listen(self, user, query=""):
+        """Открывает поток и возвращает его итератор (после строки `retry`) вместе с подпиской."""
+        await self.async_client.aforce_login(user)
+        response = await self.async_client.get(self.url + query)
+        stream = aiter(response.streaming_content)
+        existing = set(broker._subscriptions)
+        self.assertEqual(await anext(stream), b"retry: 3000\n\n")
+        (subscription,) = set(broker._subscriptions) - existing
+        self.addCleanup(broker.unsubscribe, subscription)
+        return stream, subscription
+
+    async def read_event(self, stream):
+        event, data = (await asyncio.wait_for(anext(stream), 5)).decode().strip().split("\n")
+        return event.removeprefix("event: "), json.loads(data.removeprefix("data: "))
+
+    def commit(self, request, *args, **kwargs):
+        """Запрос к API с выполнением on_commit: события публикуются только после фиксации."""
+        with self.captureOnCommitCallbacks(execute=True):
+            return request(*args, **kwargs)
+
+    async def test_events_delivered_to_company(self):
+        other_device = await Device.objects.acreate(company=self.other, aibox_id="aibox-other", name="Other")
+        await Source.objects.acreate(device=other_device, source_id="1", ipv4="10.0.0.2")
+        stream, subscription = await self.listen(self.user)
+        other_stream, other_subscription = await self.listen(self.staff, f"?company={self.other.pk}")
+
+        response = await sync_to_async(self.commit)(self.push, "stream-1", alg={"name": "fire"})
+        self.assertEqual(response.status_code, 201)
+        alert = await Alert.objects.aget(aibox_alert_id="stream-1")
+        event, data = await self.read_event(stream)
+        self.assertEqual(event, "alert.created")
+        self.assertEqual(
+            {key: data[key] for key in ("type", "id", "aibox_alert_id", "company", "device", "alg", "status")},
+            {"type": "alert.created", "id": alert.pk, "aibox_alert_id": "stream-1", "company": self.company.pk,
+             "device": self.device.pk, "alg": "fire", "status": alert.status},
+        )
+        # Повтор той же тревоги — не новое событие
+        await sync_to_async(self.commit)(self.push, "stream-1", alg={"name": "fire"})
+
+        response = await sync_to_async(self.commit)(
+            self.client.post, f"/api/algorithms/v1/alerts/{alert.pk}/send-action/", {"action": "confirm"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        await alert.arefresh_from_db()
+        event, data = await self.read_event(stream)
+        self.assertEqual(event, "alert.status")
+        self.assertEqual((data["id"], data["status"], data["company"]), (alert.pk, alert.status, self.company.pk))
+        self.assertIsNotNone(data["confirmed_at"])
+        self.assertTrue(subscription.queue.empty())
+        # Другой компании события не достаются, а её собственные приходят только ей
+        self.assertTrue(other_subscription.queue.empty())
+        await sync_to_async(self.commit)(self.push, "stream-2", aibox_id="aibox-other")
+        event, data = await self.read_event(other_stream)
+        self.assertEqual((event, data["aibox_alert_id"], data["company"]), ("alert.created", "stream-2", self.other.pk))
+        self.assertTrue(subscription.queue.empty())
+
+    async def test_events_after_commit_only(self):
+        stream, subscription = await self.listen(self.user)
+        # Транзакция теста не фиксируется, on_commit не выполняется — события нет
+        self.assertEqual((await sync_to_async(self.push)("stream-1")).status_code, 201)
+        await asyncio.sleep(0)
+        self.assertTrue(subscription.queue.empty())
+
+
+@override_settings(TIME_ZONE="UTC")
+class AlertRollupLevelsTests(AlertTestMixin, TestCase):
+    """Агрегаты для другого пояса используются, только если разница смещений годится на всём интервале."""
+    london = ZoneInfo("Europe/London")
+
+    def utc(self, *args):
+        return datetime(*args, tzinfo=timezone.utc)
+
+    def test_levels(self):
+        hour_and_day = (AlertRollup.GRANULARITY_HOUR, AlertRollup.GRANULARITY_DAY)
+        self.assertEqual(get_rollup_levels(None), hour_and_day)
+        self.assertEqual(get_rollup_levels(ZoneInfo("UTC")), hour_and_day)
+        # Зимой Лондон совпадает с UTC, летом — на час впереди
+        self.assertEqual(get_rollup_levels(self.london, self.utc(2024, 1, 1), self.utc(2024, 2, 1)), hour_and_day)
+        self.assertEqual(get_rollup_levels(self.london, self.utc(2024, 6, 1), self.utc(2024, 7, 1)),
+                         (AlertRollup.GRANULARITY_HOUR,))
+        self.assertEqual(get_rollup_levels(self.london, self.utc(2024, 1, 1), self.utc(2024, 12, 1)),
+                         (AlertRollup.GRANULARITY_HOUR,))
+        # Переход внутри интервала, концы которого — зимнее время
+        self.assertEqual(get_rollup_levels(self.london, self.utc(2024, 3, 30), self.utc(2024, 3, 31, 1, 30)),
+                         (AlertRollup.GRANULARITY_HOUR,))
+        self.assertEqual(get_rollup_levels(ZoneInfo("Asia/Kolkata"), self.utc(2024, 1, 1), self.utc(2024, 2, 1)), ())
+
+    @override_settings(TIME_ZONE="Europe/Berlin")
+    def test_levels_with_two_transitions(self):
+        # Лондон и Берлин переходят в один момент (01:00 UTC), Нью-Йорк — на три недели раньше
+        self.assertEqual(get_rollup_levels(self.london, self.utc(2024, 1, 1), self.utc(2024, 12, 1)),
+                         (AlertRollup.GRANULARITY_HOUR,))
+        self.assertEqual(get_rollup_levels(ZoneInfo("Europe/Paris"), self.utc(2024, 1, 1), self.utc(2024, 12, 1)),
+                         (AlertRollup.GRANULARITY_HOUR, AlertRollup.GRANULARITY_DAY))
+        self.assertEqual(get_rollup_levels(ZoneInfo("America/New_York"), self.utc(2024, 1, 1), self.utc(2024, 12, 1)),
+                         (AlertRollup.GRANULARITY_HOUR,))
+
+    def test_histogram_across_transition(self):
+        start = self.utc(2024, 3, 29)
+        for index in range(0, 4 * 24, 5):
+            Alert.objects.create(aibox_alert_id=f"dst-{index}", alert_time=start + timedelta(hours=index, minutes=7),
+                                 device=self.device, source=self.source)
+        AlertRollup.objects.rebuild()
+        end = self.utc(2024, 4, 2)
+        for bucket in ("hour", "day"):
+            with self.subTest(bucket=bucket):
+                expected = {
+                    (row["period"],): row["total"]
+                    for row in Alert.objects.annotate(period=Trunc("alert_time", bucket, tzinfo=self.london))
+                    .values("period").annotate(total=Count("id")).order_by()
+                }
+                counts = count_alerts(start, end, group_by=(), bucket=bucket, tzinfo=self.london)
+                self.assertEqual(counts, expected)
+
+
+class AlertPreviewTests(AlertTestMixin, MediaStorageTestMixin, TestCase):
+    """Превью создаются вне транзакции: тревоги забираются арендой, результат сохраняется, если изображение то же."""
+
+    def setUp(self):
+        super().setUp()
+        name = self.save_media(make_image())
+        self.alert = Alert.objects.create(aibox_alert_id="preview-1", alert_time=now(), device=self.device,
+                                          source=self.source, image=name)
+        MediaBlob.objects.acquire([name])
+
+    def refresh(self):
+        return Alert.objects.get(pk=self.alert.pk)
+
+    def test_previews_saved(self):
+        self.assertEqual(previews.process_previews(), 1)
+        alert = self.refresh()
+        self.assertIsNotNone(alert.previews_generated_at)
+        self.assertIsNone(alert.previews_claimed_until)
+        names = [alert.image_thumbnail.name, alert.image_preview.name]
+        self.assertTrue(all(names))
+        self.assertEqual(set(MediaBlob.objects.filter(name__in=names).values_list("refcount", flat=True)), {1})
+        self.assertEqual(previews.process_previews(), 0)
+
+    def test_claimed_alert_skipped(self):
+        Alert.objects.filter(pk=self.alert.pk).update(previews_claimed_until=now() + timedelta(minutes=5))
+        self.assertEqual(previews.process_previews(), 0)
+        # Аренда упавшего воркера истекла — тревогу забирает другой
+        Alert.objects.filter(pk=self.alert.pk).update(previews_claimed_until=now() - timedelta(seconds=1))
+        self.assertEqual(previews.process_previews(), 1)
+        self.assertTrue(self.refresh().image_preview)
+
+    def test_image_changed_while_processing(self):
+        generate = previews.generate_alert_previews
+        other = self.save_media(make_image(mirror=True))
+
+        def generate_and_replace(alert):
+            result = generate(alert)
+            Alert.objects.filter(pk=alert.pk).update(image=other)
+            return result
+
+        with mock.patch.object(previews, "generate_alert_previews", generate_and_replace):
+            self.assertEqual(previews.process_previews(), 1)
+        alert = self.refresh()
+        self.assertIsNone(alert.previews_generated_at)
+        self.assertIsNone(alert.previews_claimed_until)
+        self.assertFalse(alert.image_preview)
+        self.assertEqual(set(MediaBlob.objects.filter(name__startswith="alerts/previews/").values_list(
+            "refcount", flat=True)), {0})
+        # Новое изображение обрабатывается следующим проходом
+        self.assertEqual(previews.process_previews(), 1)
+        self.assertTrue(self.refresh().image_preview)
+
+
+class AlertRollupTests(AlertTestMixin, TestCase):
+    """Агрегаты тревог: одна строка на ключ и те же числа, что и COUNT по таблице тревог."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.sources = [cls.source, Source.objects.create(device=cls.device, source_id="2", ipv4="10.0.0.2")]
+        cls.algs = [None, Algorithm.objects.create(key="fire", name="fire")]
+        cls.started = now().replace(minute=0, second=0, microsecond=0) - timedelta(days=3)
+        rnd = random.Random(5)
+        alerts = [
+            Alert.objects.create(
+                aibox_alert_id=f"rollup-{index}", device=cls.device, source=rnd.choice(cls.sources),
+                alg=rnd.choice(cls.algs), alert_time=cls.started + timedelta(seconds=rnd.randrange(3 * 24 * 3600)),
+            )
+            for index in range(200)
+        ]
+        AlertRollup.objects.add_alerts(alerts)
+        Alert.objects.filter(pk__in=[alert.pk for alert in alerts[::3]]).set_status(Alert.STATUS_CONFIRMED)
+        Alert.objects.filter(pk__in=[alert.pk for alert in alerts[1::5]]).set_status(Alert.STATUS_REJECTED)
+
+    def raw_counts(self, start=None, end=None):
+        queryset = Alert.objects.filter(device=self.device)
+        if start is not None:
+            queryset = queryset.filter(alert_time__gte=start)
+        if end is not None:
+            queryset = queryset.filter(alert_time__lt=end)
+        return {(row["alg__name"], row["status"]): row["total"]
+                for row in queryset.values("alg__name", "status").annotate(total=Count("id")).order_by()}
+
+    def test_one_row_per_key(self):
+        keys = AlertRollup.objects.values(*AlertRollup.objects.KEY_FIELDS).annotate(rows=Count("id"))
+        self.assertFalse(keys.filter(rows__gt=1).exists())
+        self.assertFalse(AlertRollup.objects.filter(count__lt=0).exists())
+
+    def test_apply_deltas_upsert(self):
+        bucket = self.started - timedelta(days=1)
+        key = (AlertRollup.GRANULARITY_HOUR, bucket, self.company.pk, self.device.pk, self.sources[0].pk, None,
+               Alert.STATUS_PENDING)
+        AlertRollup.objects.apply_deltas({key: 2})
+        AlertRollup.objects.apply_deltas({key: 3, key[:-1] + (Alert.STATUS_CONFIRMED,): 1})
+        AlertRollup.objects.apply_deltas({key: -1})
+        rows = dict(AlertRollup.objects.filter(bucket=bucket).values_list("status", "count"))
+        self.assertEqual(rows, {Alert.STATUS_PENDING: 4, Alert.STATUS_CONFIRMED: 1})
+
+    def assertRollupsMatchCount(self):
+        for granularity, trunc in ((AlertRollup.GRANULARITY_HOUR, "hour"), (AlertRollup.GRANULARITY_DAY, "day")):
+            with self.subTest(granularity=granularity):
+                expected = {
+                    (row["bucket"], row["source"], row["alg"], row["status"]): row["total"]
+                    for row in Alert.objects.annotate(bucket=Trunc("alert_time", trunc))
+                    .values("bucket", "source", "alg", "status").annotate(total=Count("id")).order_by()
+                }
+                rollups = {
+                    (row.bucket, row.source_id, row.alg_id, row.status): row.count
+                    for row in AlertRollup.objects.filter(granularity=granularity).exclude(count=0)
+                }
+                self.assertEqual(rollups, expected)
+
+    def test_rollups_match_count(self):
+        self.assertRollupsMatchCount()
+
+    def test_delete_subtracts(self):
+        alerts = list(Alert.objects.order_by("id"))
+        alerts[0].delete()
+        Alert.objects.filter(pk__in=[alert.pk for alert in alerts[1:40]]).delete()
+        self.assertRollupsMatchCount()
+        self.test_one_row_per_key()
+
+    def test_admin_delete_subtracts(self):
+        self.client.force_login(User.objects.create_superuser(email="admin@example.com", password="x"))
+        alerts = list(Alert.objects.order_by("id")[:10])
+        response = self.client.post(f"/admin/algorithms/alert/{alerts[0].pk}/delete/", {"post": "yes"})
+        self.assertEqual(response.status_code, 302)
+        response = self.client.post("/admin/algorithms/alert/", {
+            "action": "delete_selected", "_selected_action": [alert.pk for alert in alerts[1:]], "post": "yes",
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Alert.objects.count(), 190)
+        self.assertRollupsMatchCount()
+
+    def test_delete_without_rollups(self):
+        # Так удаляет очистка по сроку хранения: статистика за удалённый период остаётся
+        total = AlertRollup.objects.filter(granularity=AlertRollup.GRANULARITY_DAY).aggregate(total=Sum("count"))
+        Alert.objects.filter(source=self.sources[0]).delete(update_rollups=False)
+        self.assertEqual(
+            AlertRollup.objects.filter(granularity=AlertRollup.GRANULARITY_DAY).aggregate(total=Sum("count")), total,
+        )
+
+    def test_source_delete_cascades(self):
+        source_id = self.sources[1].pk
+        self.sources[1].delete()
+        self.assertFalse(AlertRollup.objects.filter(source_id=source_id).exists())
+        self.assertRollupsMatchCount()
+
+    def test_algorithm_delete_moves_to_no_algorithm(self):
+        # Строки без алгоритма с теми же бакетами уже есть: счётчики складываются, а не дублируют ключ
+        self.assertTrue(AlertRollup.objects.filter(alg=None).exists())
+        self.algs[1].delete()
+        self.assertFalse(Alert.objects.filter(alg__isnull=False).exists())
+        self.assertRollupsMatchCount()
+        self.test_one_row_per_key()
+
+    def test_count_alerts_matches_count(self):
+        rnd = random.Random(7)
+        ranges = [(None, None), (self.started + timedelta(hours=5), None), (None, self.started + timedelta(days=2))]
+        for _ in range(20):
+            start = self.started + timedelta(seconds=rnd.randrange(-3600, 3 * 24 * 3600))
+            ranges.append((start, start + timedelta(seconds=rnd.randrange(60, 2 * 24 * 3600))))
+        for start, end in ranges:
+            with self.subTest(start=start, end=end):
+                self.assertEqual(count_alerts(start, end, device=self.device), self.raw_counts(start, end))
+                # Части split_range без пропусков и перекрытий покрывают [start, end)
+                parts = sorted((part for ranges in split_range(start, end) for part in ranges),
+                               key=lambda part: (part[0] is not None, part[0]))
+                self.assertEqual(parts[0][0], start)
+                self.assertEqual(parts[-1][1], end)
+                for (_, previous_end), (next_start, _) in zip(parts, parts[1:]):
+                    self.assertEqual(previous_end, next_start)
+
+
+class AlertActionTests(AlertTestMixin, TestCase):
+    """Подтверждение/отклонение одной тревоги — условный UPDATE: повторное действие получает 409."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.alert = Alert.objects.create(aibox_alert_id="single-1", alert_time=now(), device=cls.device,
+                                         source=cls.source, reserved_data={"boxes": [1]})
+        AlertRollup.objects.add_alerts([cls.alert])
+
+    def send(self, action, version="v1"):
+        return self.client.post(f"/api/algorithms/{version}/alerts/{self.alert.pk}/send-action/", {"action": action},
+                                content_type="application/json")
+
+    def rollup_counts(self):
+        return dict(AlertRollup.objects.filter(granularity=AlertRollup.GRANULARITY_HOUR)
+                    .values_list("status", "count"))
+
+    def assertConflict(self, response):
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["error_code"], -1)
+        self.assertIn("status", response.json()["data"])
+
+    def test_double_confirm(self):
+        for version in ("v1", "v2"):
+            with self.subTest(version=version):
+                Alert.objects.filter(pk=self.alert.pk).update(status=Alert.STATUS_PENDING, confirmed_at=None)
+                AlertRollup.objects.all().delete()
+                AlertRollup.objects.add_alerts([self.alert])
+                BotNotification.objects.all().delete()
+                self.assertEqual(self.send("confirm", version).status_code, 200)
+                self.assertConflict(self.send("confirm", version))
+                self.assertConflict(self.send("reject", version))
+                alert = Alert.objects.get(pk=self.alert.pk)
+                self.assertEqual(alert.status, Alert.STATUS_CONFIRMED)
+                self.assertIsNotNone(alert.confirmed_at)
+                self.assertEqual(alert.reserved_data, {"boxes": [1]})
+                self.assertEqual(BotNotification.objects.filter(for_security=False).count(), 1)
+                self.assertEqual(self.rollup_counts(), {Alert.STATUS_PENDING: 0, Alert.STATUS_CONFIRMED: 1})
+
+    def test_double_reject(self):
+        self.assertEqual(self.send("reject").status_code, 200)
+        self.assertConflict(self.send("reject"))
+        self.assertConflict(self.send("confirm"))
+        self.assertEqual(Alert.objects.get(pk=self.alert.pk).status, Alert.STATUS_REJECTED)
+        self.assertFalse(BotNotification.objects.exists())
+        self.assertEqual(self.rollup_counts(), {Alert.STATUS_PENDING: 0, Alert.STATUS_REJECTED: 1})
+
+
+@override_settings(ALERT_RETENTION_DAYS=None, ALERT_MEDIA_RETENTION_DAYS=None)
+class AlertRetentionTests(AlertTestMixin, MediaStorageTestMixin, TestCase):
+    """Политики хранения удаляют только тревоги старше срока компании и освобождают их медиафайлы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other = Company.objects.create(name="Other")
+        cls.other_device = Device.objects.create(company=cls.other, aibox_id="aibox-other", name="AIBox")
+        cls.other_source = Source.objects.create(device=cls.other_device, source_id="1", ipv4="10.0.0.2")
+
+    def setUp(self):
+        super().setUp()
+        self.archive_root = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(ALERT_ARCHIVE_ROOT=self.archive_root))
+
+    def create_alert(self, aibox_alert_id, days, content=None, device=None):
+        device = device or self.device
+        image = self.save_media(content) if content else ""
+        alert = Alert.objects.create(aibox_alert_id=aibox_alert_id, alert_time=now() - timedelta(days=days),
+                                     device=device, source=device.source_set.get(), image=image)
+        MediaBlob.objects.acquire(alert.get_media_names())
+        AlertRollup.objects.add_alerts([alert])
+        return alert
+
+    def refcount(self, alert):
+        return MediaBlob.objects.get(name=alert.image.name).refcount
+
+    def read_archive(self):
+        rows = []
+        for directory, _, files in os.walk(self.archive_root):
+            for filename in files:
+                self.assertTrue(filename.endswith(".ndjson.gz"))
+                with gzip.open(os.path.join(directory, filename), "rt", encoding="utf-8") as file:
+                    rows.extend(json.loads(line) for line in file)
+        return sorted(row["aibox_alert_id"] for row in rows)
+
+    def test_alerts_past_policy_deleted(self):
+        AlertRetentionPolicy.objects.create(company=self.company, retention_days=30)
+        old = self.create_alert("old", 40, b"old")
+        expired = self.create_alert("expired", 31, b"shared")
+        kept = self.create_alert("kept", 29, b"shared")
+        self.create_alert("new", 0)
+        other = self.create_alert("other", 40, b"other", device=self.other_device)
+
+        self.assertEqual(apply_retention(batch_size=1), {self.company.pk: (2, 0)})
+        self.assertEqual(sorted(Alert.objects.values_list("aibox_alert_id", flat=True)), ["kept", "new", "other"])
+        self.assertEqual(self.read_archive(), ["expired", "old"])
+        self.assertEqual(self.refcount(old), 0)
+        self.assertEqual(self.refcount(kept), 1)
+        self.assertEqual(self.refcount(other), 1)
+        self.assertEqual(expired.image.name, kept.image.name)
+        self.assertFalse(AlertKey.objects.filter(aibox_alert_id__in=["old", "expired"]).exists())
+        # Статистика за удалённый период остаётся в агрегатах
+        self.assertEqual(AlertRollup.objects.filter(granularity=AlertRollup.GRANULARITY_DAY, company=self.company)
+                         .aggregate(total=Sum("count"))["total"], 4)
+        self.assertEqual(apply_retention(), {})
+
+    @override_settings(ALERT_RETENTION_DAYS=30)
+    def test_default_policy_and_batches(self):
+        # Явная политика без срока отменяет ALERT_RETENTION_DAYS
+        AlertRetentionPolicy.objects.create(company=self.other, retention_days=None)
+        for index in range(3):
+            self.create_alert(f"old-{index}", 40 + index)
+        self.create_alert("other", 40, device=self.other_device)
+
+        self.assertEqual(apply_retention(batch_size=1, max_batches=2), {self.company.pk: (2, 0)})
+        # Первыми удаляются самые старые тревоги
+        self.assertEqual(sorted(Alert.objects.values_list("aibox_alert_id", flat=True)), ["old-0", "other"])
+        self.assertEqual(apply_retention(), {self.company.pk: (1, 0)})
+        self.assertEqual(self.read_archive(), ["old-0", "old-1", "old-2"])
+        self.assertTrue(Alert.objects.filter(aibox_alert_id="other").exists())
+
+    def test_without_archive(self):
+        AlertRetentionPolicy.objects.create(company=self.company, retention_days=1, archive=False)
+        self.create_alert("old", 2)
+        self.assertEqual(apply_retention(), {self.company.pk: (1, 0)})
+        self.assertEqual(self.read_archive(), [])
+
+    def test_media_past_policy_released(self):
+        AlertRetentionPolicy.objects.create(company=self.company, retention_days=None, media_retention_days=7)
+        old = self.create_alert("old", 10, b"old")
+        recent = self.create_alert("recent", 3, b"recent")
+
+        self.assertEqual(apply_retention(), {self.company.pk: (0, 1)})
+        self.assertEqual(Alert.objects.get(pk=old.pk).image.name, "")
+        self.assertEqual(Alert.objects.get(pk=recent.pk).image.name, recent.image.name)
+        self.assertEqual(self.refcount(old), 0)
+        self.assertEqual(self.refcount(recent), 1)
+        self.assertEqual(Alert.objects.count(), 2)
+
+
+@override_settings(ALERT_RATE_LIMIT_DEVICE=0.01, ALERT_RATE_LIMIT_DEVICE_BURST=2, ALERT_RATE_LIMIT_COMPANY=0,
+                   ALERT_SHED_MAX_INFLIGHT=0, ALERT_SHED_MAX_OUTBOX=0, ALERT_SHED_RETRY_AFTER=7,
+                   RATE_LIMIT_CACHE_ALIAS=None)
+class AlertThrottlingTests(AlertTestMixin, TestCase):
+    """Ограничение частоты приёма (429) и сброс нагрузки (503) с подсказкой Retry-After в формате AIBox."""
+    urls = (ALERTS_URL, ALERTS_ASYNC_URL)
+    aibox_id = "aibox-noisy"
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        device = Device.objects.create(company=cls.company, aibox_id="aibox-quiet", name="AIBox")
+        Source.objects.create(device=device, source_id="1", ipv4="10.0.0.2")
+
+    def setUp(self):
+        super().setUp()
+        # Корзины и глубина outbox хранятся в памяти процесса
+        for limiter in (device_limiter, company_limiter):
+            limiter.local.clear()
+        _outbox_depth.clear()
+        self.sent = 0
+
+    def push_next(self, url, aibox_id=None):
+        self.sent += 1
+        return self.push(f"throttle-{self.sent}", url=url, aibox_id=aibox_id)
+
+    def assertThrottled(self, response, status_code, message, retry_after=None):
+        self.assertEqual(response.status_code, status_code)
+        body = response.json()
+        self.assertEqual((body["error_code"], body["message"]), (-1, message))
+        self.assertEqual(int(response["Retry-After"]), body["data"]["retry_after"])
+        self.assertGreaterEqual(body["data"]["retry_after"], 1)
+        if retry_after is not None:
+            self.assertEqual(body["data"]["retry_after"], retry_after)
+
+    def test_device_rate_limit(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                device_limiter.local.clear()
+                self.assertEqual(self.push_next(url).status_code, 201)
+                self.assertEqual(self.push_next(url).status_code, 201)
+                self.assertThrottled(self.push_next(url), 429, "too many requests")
+                # Другое устройство той же компании не страдает
+                self.assertEqual(self.push_next(url, "aibox-quiet").status_code, 201)
+        self.assertEqual(Alert.objects.filter(device__aibox_id="aibox-noisy").count(), 4)
+
+    @override_settings(ALERT_RATE_LIMIT_DEVICE=0, ALERT_RATE_LIMIT_COMPANY=0.01, ALERT_RATE_LIMIT_COMPANY_BURST=2)
+    def test_company_rate_limit(self):
+        url = self.urls[0]
+        self.assertEqual(self.push_next(url, "aibox-noisy").status_code, 201)
+        self.assertEqual(self.push_next(url, "aibox-quiet").status_code, 201)
+        self.assertThrottled(self.push_next(url, "aibox-quiet"), 429, "too many requests")
+
+    @override_settings(ALERT_RATE_LIMIT_COMPANY=0.01, ALERT_RATE_LIMIT_COMPANY_BURST=1)
+    def test_company_reject_keeps_device_tokens(self):
+        url = self.urls[0]
+        self.assertEqual(self.push_next(url).status_code, 201)
+        for _ in range(3):
+            self.assertThrottled(self.push_next(url), 429, "too many requests")
+        # Отказы по компании не списали токены устройства: второй токен корзины ещё на месте
+        with self.settings(ALERT_RATE_LIMIT_COMPANY=0):
+            self.assertEqual(self.push_next(url).status_code, 201)
+            self.assertThrottled(self.push_next(url), 429, "too many requests")
+
+    @override_settings(ALERT_RATE_LIMIT_DEVICE=0)
+    def test_unknown_device_miss_cached(self):
+        alerts = [self.alert_body("unknown", aibox_id="aibox-unknown")]
+        with self.assertNumQueries(1):
+            self.assertEqual(get_alert_devices(alerts), [("aibox-unknown", None)])
+        with self.assertNumQueries(0):
+            self.assertEqual(get_alert_devices(alerts), [("aibox-unknown", None)])
+            self.assertEqual(self.push_next(self.urls[0], "aibox-unknown").status_code, 400)
+        # Регистрация устройства сбрасывает закэшированный промах
+        device = Device.objects.create(company=self.company, aibox_id="aibox-unknown", name="AIBox")
+        self.assertEqual(get_alert_devices(alerts), [("aibox-unknown", device)])
+
+    def test_bulk_spends_token_per_alert(self):
+        response = self.client.post("/api/algorithms/v1/alerts/bulk/", [
+            self.alert_body(f"throttle-bulk-{index}") for index in range(3)
+        ], content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        # Пачка больше burst принята при полной корзине и увела её в долг
+        self.assertThrottled(self.push_next(self.urls[0]), 429, "too many requests")
+
+    @override_settings(ALERT_RATE_LIMIT_DEVICE=0, ALERT_SHED_MAX_OUTBOX=1)
+    def test_shed_on_outbox_depth(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                _outbox_depth.clear()
+                BotNotification.objects.all().delete()
+                self.assertEqual(self.push_next(url).status_code, 201)
+                self.assertEqual(self.push_next(url).status_code, 201)
+                _outbox_depth.clear()
+                self.assertThrottled(self.push_next(url), 503, "server overloaded", retry_after=7)
+        self.assertEqual(Alert.objects.count(), 4)
+
+    @override_settings(ALERT_RATE_LIMIT_DEVICE=0, ALERT_SHED_MAX_INFLIGHT=1)
+    def test_shed_on_inflight(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.push_next(url).status_code, 201)
+                # Ещё один запрос приёма уже обрабатывается процессом
+                with inflight.track():
+                    self.assertThrottled(self.push_next(url), 503, "server overloaded", retry_after=7)
+        self.assertEqual(inflight.value, 0)
+
+    @override_settings(CACHES={"ratelimit": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+                       RATE_LIMIT_CACHE_ALIAS="ratelimit")
+    def test_shared_backend(self):
+        self.assertEqual(device_limiter.consume("aibox-shared"), 0)
+        self.assertEqual(device_limiter.consume("aibox-shared"), 0)
+        self.assertGreater(device_limiter.consume("aibox-shared"), 0)
+        self.assertEqual(device_limiter.consume("aibox-other"), 0)
+
+
+@override_settings(METRICS_ENABLED=True)
+class AlertMetricsTests(AlertTestMixin, TestCase):
+    """Приём тревоги записывает этапы в STAGE_SECONDS, итог в ALERTS и запрос в метриках middleware."""
+
+    STAGES = ("parse", "validate", "decode", "lookup", "suppression", "transaction", "notify", "save")
+
+    def setUp(self):
+        super().setUp()
+        # Соединение тестовой БД открыто до загрузки middleware (на сервере — после), счётчик ставится явно
+        enable_query_counting()
+
+    def assertRecorded(self, response, outcome, stages):
+        view = response.resolver_match.view_name
+        self.assertEqual(get_sample(HTTP_REQUESTS, view, "POST", response.status_code),
+                         self.requests[response.status_code] + 1)
+        self.assertGreater(dict(HTTP_REQUEST_QUERIES.snapshot())[(view, "POST")][1], self.queries)
+        self.assertEqual(get_sample(ALERTS, self.company.pk, self.aibox_id, "fire", outcome),
+                         self.outcomes[outcome] + 1)
+        for stage in stages:
+            self.assertEqual(get_sample(STAGE_SECONDS, "ingest", stage), self.stages[stage] + 1, stage)
+
+    def snapshot(self, view):
+        self.requests = {status: get_sample(HTTP_REQUESTS, view, "POST", status) for status in (200, 201)}
+        # Сумма гистограммы — всего SQL-запросов представления
+        self.queries = dict(HTTP_REQUEST_QUERIES.snapshot()).get((view, "POST"), [[], 0])[1]
+        self.outcomes = {outcome: get_sample(ALERTS, self.company.pk, self.aibox_id, "fire", outcome)
+                         for outcome in ("created", "duplicate")}
+        self.stages = {stage: get_sample(STAGE_SECONDS, "ingest", stage) for stage in self.STAGES}
+
+    async def apush(self, aibox_alert_id, alert_time):
+        return await self.async_client.post(ALERTS_ASYNC_URL, self.alert_body(aibox_alert_id, alert_time,
+                                                                              alg={"name": "fire"}),
+                                            content_type="application/json")
+
+    def test_ingest(self):
+        alert_time = now()
+        # Первая тревога прогревает кэши справочников и даёт имя представления
+        view = self.push("metrics-1", alert_time, alg={"name": "fire"}).resolver_match.view_name
+        self.snapshot(view)
+        response = self.push("metrics-2", alert_time, alg={"name": "fire"})
+        self.assertEqual(response.status_code, 201)
+        self.assertRecorded(response, "created", ("validate", "suppression", "transaction", "notify"))
+        self.snapshot(view)
+        response = self.push("metrics-2", alert_time, alg={"name": "fire"})
+        # Повтор определяется конфликтом INSERT — транзакция тоже наблюдается, уведомление — нет
+        self.assertRecorded(response, "duplicate", ("validate", "suppression", "transaction"))
+        self.assertEqual(get_sample(STAGE_SECONDS, "ingest", "notify"), self.stages["notify"])
+
+    async def test_async_ingest(self):
+        # v2 проходит асинхронную ветку middleware, запросы из sync_to_async тоже учитываются
+        alert_time = now()
+        self.snapshot((await self.apush("metrics-3", alert_time)).resolver_match.view_name)
+        response = await self.apush("metrics-4", alert_time)
+        self.assertEqual(response.status_code, 201)
+        self.assertRecorded(response, "created", ("parse", "validate", "suppression", "transaction", "notify"))
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled(self):
+        stages = {stage: get_sample(STAGE_SECONDS, "ingest", stage) for stage in self.STAGES}
+        created = get_sample(ALERTS, self.company.pk, self.aibox_id, "fire", "created")
+        self.assertEqual(self.push("metrics-5", alg={"name": "fire"}).status_code, 201)
+        self.assertEqual({stage: get_sample(STAGE_SECONDS, "ingest", stage) for stage in self.STAGES}, stages)
+        self.assertEqual(get_sample(ALERTS, self.company.pk, self.aibox_id, "fire", "created"), created)
+
+
+class AlertReferenceCacheTests(SharedReferenceCacheMixin, AlertTestMixin, TestCase):
+    """Приём тревог видит изменения справочников: алгоритмы и получатели сбрасываются сигналами."""
+
+    def test_algorithm_save_and_delete(self):
+        self.assertEqual(self.push("cache-1", alg={"name": "fire", "ch_name": "Огонь"}).status_code, 201)
+        algorithm = Algorithm.objects.get(key="fire")
+        self.assertCached(algorithm_cache, "fire", algorithm)
+        algorithm.name = "Пожар"
+        algorithm.save()
+        self.assertNotCached(algorithm_cache, "fire")
+        self.push("cache-2", alg={"name": "fire"})
+        self.assertEqual(algorithm_cache.get("fire").name, "Пожар")
+        algorithm.delete()
+        self.assertNotCached(algorithm_cache, "fire")
+        self.assertEqual(self.push("cache-3", alg={"name": "fire"}).status_code, 201)
+        self.assertNotEqual(Alert.objects.get(aibox_alert_id="cache-3").alg_id, algorithm.pk)
+
+    def test_new_executive_attached(self):
+        self.assertEqual(self.push("cache-1").status_code, 201)
+        self.assertFalse(Alert.objects.get(aibox_alert_id="cache-1").executive_users.exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            executive = User.objects.create(company=self.company, telegram_id=1001, is_executive=True)
+        self.push("cache-2")
+        self.assertEqual(list(Alert.objects.get(aibox_alert_id="cache-2").executive_users.all()), [executive])
+
+    def test_new_security_notified(self):
+        self.push("cache-1")
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.create(company=self.company, telegram_id=1002, is_security=True)
+        self.push("cache-2")
+        recipients = [notification.payload["users_telegram_id"]
+                      for notification in BotNotification.objects.order_by("id")]
+        self.assertEqual(recipients, [[], [1002]])
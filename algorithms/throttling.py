@@ -0,0 +1,147 @@
+"""
+Защита приёма тревог AIBox от перегрузки:
+- ограничение частоты (token bucket) по устройству (`device.aibox_id`) и по компании;
+- сброс нагрузки: пока процесс обрабатывает больше ALERT_SHED_MAX_INFLIGHT запросов приёма
+  или в outbox бота больше ALERT_SHED_MAX_OUTBOX неотправленных уведомлений, новые тревоги
+  не принимаются.
+Отказ — ответ в формате AIBox с подсказкой `retry_after` (и заголовком Retry-After).
+"""
+import math
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from devices.lookups import get_device
+from tgbot.models import BotNotification
+from visionaibox.cache import TTLCache
+from visionaibox.ratelimit import TokenBucketLimiter
+
+device_limiter = TokenBucketLimiter(
+    "alerts:device",
+    rate=lambda: settings.ALERT_RATE_LIMIT_DEVICE,
+    burst=lambda: settings.ALERT_RATE_LIMIT_DEVICE_BURST,
+)
+company_limiter = TokenBucketLimiter(
+    "alerts:company",
+    rate=lambda: settings.ALERT_RATE_LIMIT_COMPANY,
+    burst=lambda: settings.ALERT_RATE_LIMIT_COMPANY_BURST,
+)
+
+RATE_LIMITED = "too many requests"
+OVERLOADED = "server overloaded"
+
+
+class InflightCounter:
+    """Число запросов приёма, обрабатываемых процессом прямо сейчас."""
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def track(self):
+        with self._lock:
+            self.value += 1
+        try:
+            yield self.value
+        finally:
+            with self._lock:
+                self.value -= 1
+
+
+inflight = InflightCounter()
+# Глубина outbox перечитывается из БД не чаще раза в ALERT_SHED_CHECK_INTERVAL секунд
+_outbox_depth = TTLCache(maxsize=1, ttl=settings.ALERT_SHED_CHECK_INTERVAL)
+
+
+def pending_notifications():
+    # Считаем не дальше порога: COUNT по индексу (status, next_attempt_at) с LIMIT
+    return BotNotification.objects.filter(status=BotNotification.STATUS_PENDING)[:settings.ALERT_SHED_MAX_OUTBOX + 1]
+
+
+def get_outbox_depth():
+    depth = _outbox_depth.get("pending")
+    if depth is None:
+        depth = pending_notifications().count()
+        _outbox_depth.set("pending", depth)
+    return depth
+
+
+async def aget_outbox_depth():
+    """Асинхронный вариант `get_outbox_depth` (async ORM)."""
+    depth = _outbox_depth.get("pending")
+    if depth is None:
+        depth = await pending_notifications().acount()
+        _outbox_depth.set("pending", depth)
+    return depth
+
+
+def is_overloaded(running, outbox_depth=None):
+    """Нужно ли сбрасывать нагрузку: `running` — текущее число запросов приёма (вместе с этим)."""
+    if settings.ALERT_SHED_MAX_INFLIGHT and running > settings.ALERT_SHED_MAX_INFLIGHT:
+        return True
+    return bool(settings.ALERT_SHED_MAX_OUTBOX and outbox_depth is not None
+                and outbox_depth > settings.ALERT_SHED_MAX_OUTBOX)
+
+
+def check_shedding(running):
+    """0, если запрос можно принять, иначе — через сколько секунд повторить."""
+    outbox_depth = get_outbox_depth() if settings.ALERT_SHED_MAX_OUTBOX else None
+    return settings.ALERT_SHED_RETRY_AFTER if is_overloaded(running, outbox_depth) else 0
+
+
+async def acheck_shedding(running):
+    """Асинхронный вариант `check_shedding`."""
+    outbox_depth = await aget_outbox_depth() if settings.ALERT_SHED_MAX_OUTBOX else None
+    return settings.ALERT_SHED_RETRY_AFTER if is_overloaded(running, outbox_depth) else 0
+
+
+def get_alert_device_id(data):
+    """`device.id` из тела тревоги AIBox до валидации (None, если его нет)."""
+    device = data.get("device") if isinstance(data, dict) else None
+    return device.get("id") if isinstance(device, dict) else None
+
+
+def get_alert_devices(items):
+    """[(aibox_id, device или None), ...] для тревог с указанным `device.id`."""
+    devices, resolved = [], {}
+    for item in items:
+        aibox_id = get_alert_device_id(item)
+        if not aibox_id:
+            continue
+        if aibox_id not in resolved:
+            resolved[aibox_id] = get_device(aibox_id)
+        devices.append((aibox_id, resolved[aibox_id]))
+    return devices
+
+
+def check_rate_limit(devices):
+    """
+    Списывает токены за тревоги устройств (`devices` — [(aibox_id, device или None), ...],
+    по элементу на тревогу). 0, если все лимиты соблюдены, иначе — через сколько секунд повторить.
+    Токены списываются, только если запрос пропускают все корзины: при отказе уже списанные
+    возвращаются, и отклонённый запрос не расходует лимиты устройств и компании.
+    Неизвестные устройства ограничиваются только по `aibox_id`.
+    """
+    per_device = Counter(str(aibox_id) for aibox_id, _ in devices)
+    per_company = Counter(device.company_id for _, device in devices if device is not None and device.company_id)
+    spent = []
+    for limiter, counts in ((device_limiter, per_device), (company_limiter, per_company)):
+        for key, count in counts.items():
+            retry_after = limiter.consume(key, count)
+            if retry_after:
+                for spent_limiter, spent_key, spent_count in spent:
+                    spent_limiter.refund(spent_key, spent_count)
+                return retry_after
+            spent.append((limiter, key, count))
+    return 0
+
+
+def throttled_body(message, retry_after):
+    return {
+        "error_code": -1,
+        "message": message,
+        "data": {"retry_after": math.ceil(retry_after)},
+    }
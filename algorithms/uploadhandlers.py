@@ -0,0 +1,31 @@
+import hashlib
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.http.multipartparser import MultiPartParserError
+
+
+class AlertMediaUploadHandler(TemporaryFileUploadHandler):
+    """
+    Потоково пишет медиафайл тревоги во временный файл (без копии в памяти),
+    попутно считает sha256 и ограничивает размер ALERT_MEDIA_MAX_SIZE.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.checksum = hashlib.sha256()
+        self.size = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        if self.size > settings.ALERT_MEDIA_MAX_SIZE:
+            raise MultiPartParserError(
+                f"Файл '{self.file_name}' превышает допустимый размер {settings.ALERT_MEDIA_MAX_SIZE} байт."
+            )
+        self.checksum.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.sha256 = self.checksum.hexdigest()
+        return file
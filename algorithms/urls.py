@@ -1,12 +1,19 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import AlertViewSet
-from .views import alert_stats
+from .views import alert_stats, alert_histogram
+from .views import alert_push_async, alert_action_async, alert_stream
 # Создаем router и регистрируем ViewSet
 router = DefaultRouter()
 router.register(r'alerts', AlertViewSet, basename='alert')
 
 urlpatterns = [
     path('v1/', include(router.urls)),  # Включаем все маршруты из router
+    # Асинхронные версии приёма тревог и действий (при запуске под ASGI)
+    path("v2/alerts/", alert_push_async, name="alert-push-async"),
+    path("v2/alerts/<int:pk>/send-action/", alert_action_async, name="alert-action-async"),
+    # Поток новых тревог и смены статусов для дашборда (Server-Sent Events)
+    path("v2/alerts/stream/", alert_stream, name="alert-stream"),
     path("alert-stats/", alert_stats, name="alert-stats"),
+    path("alert-histogram/", alert_histogram, name="alert-histogram"),
 ]
@@ -4,37 +4,149 @@ from django.shortcuts import render
 from rest_framework import viewsets, status, mixins
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import MultiPartParser
+from django.conf import settings
+from django.core.exceptions import RequestDataTooBig
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.http.multipartparser import MultiPartParserError
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from asgiref.sync import sync_to_async
 from django.utils.timezone import now, timedelta
-from tgbot.services import send_alert_to_bot
-from visionaibox.mixins import ActionSerializerClassMixin
-from .models import Alert
-from .serializers import AlertSerializer, AlertCreateSerializer, AlertActionSerializer
-from users.models import User
+from django_filters.rest_framework import DjangoFilterBackend
+from devices.lookups import aget_device
+from .events import broker
+from visionaibox.fastjson import JSONParser, dumps, loads
+from visionaibox.mixins import ActionSerializerClassMixin, SparseFieldsetMixin
+from .filters import AlertFilter
+from .metrics import STAGE_SECONDS
+from .models import Alert, MediaBlob
+from .pagination import AlertCursorPagination
+from .parsers import NDJSONParser, AlertMediaUploadParser
+from .services import (
+    INGEST_COALESCED, INGEST_CREATED, INGEST_DUPLICATE, bulk_create_alerts, confirm_alert_and_notify, ingest_alert,
+    reject_alert_and_notify, set_alerts_status,
+)
+from .stats import count_alerts
+from .throttling import (
+    OVERLOADED, RATE_LIMITED, acheck_shedding, check_rate_limit, check_shedding, get_alert_device_id, get_alert_devices,
+    inflight, throttled_body,
+)
+from .serializers import (
+    AlertSerializer, AlertCreateSerializer, AlertActionSerializer, AlertBulkActionSerializer, AlertListSerializer,
+    AlertMediaUploadSerializer,
+)
+from .uploadhandlers import AlertMediaUploadHandler
 from rest_framework.decorators import api_view
-from django.db.models import Count, Q
 from datetime import datetime, timedelta
-from django.utils.timezone import now
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from django.utils.timezone import now, make_aware
+import asyncio
+import math
+
+
+def get_multipart_alert_data(fields, files):
+    """Тревога из multipart: JSON-поле `alert`, файлы `image`/`video` и их `*_sha256`."""
+    try:
+        data = loads(fields.get("alert") or "{}")
+    except ValueError:
+        raise ParseError("Поле 'alert' должно содержать JSON.")
+    for field in ("image", "video"):
+        if field in files:
+            data[field] = files[field]
+        if fields.get(f"{field}_sha256"):
+            data[f"{field}_sha256"] = fields[f"{field}_sha256"]
+    return data
+
+
+INGEST_MESSAGES = {
+    INGEST_DUPLICATE: "alert already received",
+    INGEST_COALESCED: "alert coalesced",
+}
+
+ALREADY_PROCESSED = {
+    "error_code": -1,
+    "message": "client error",
+    "data": {"status": ["Тревога уже обработана."]}
+}
+
 
 class AlertViewSet(ActionSerializerClassMixin,
+                   SparseFieldsetMixin,
                    mixins.CreateModelMixin,
                    mixins.ListModelMixin,
                    viewsets.GenericViewSet):
-    queryset = Alert.objects.all().prefetch_related("device", "source", "alg", "company")
+    queryset = Alert.objects.select_related("device", "source", "alg", "company")
     serializer_class = AlertSerializer
+    pagination_class = AlertCursorPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = AlertFilter
 
     action_serializer_class = {
         "create": AlertCreateSerializer,
+        "list": AlertListSerializer,
     }
 
-    def create(self, request, *args, **kwargs):
-        serializer = self.get_serializer(data=request.data)
-        if serializer.is_valid():
-            alert = serializer.save()
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == "list":
+            # Список читается через values() только нужных колонок, см. AlertListSerializer
+            return queryset.values(*AlertListSerializer.get_values(self.get_requested_fields()))
+        if self.action == "send_action":
+            # Для смены статуса достаточно нескольких колонок, полную тревогу для бота загружает сервис
+            return Alert.objects.only(*Alert.STATUS_FIELDS)
+        return queryset
 
-            executives = User.objects.filter(company=alert.company, is_executive=True)
-            alert.executive_users.set(executives)
+    def initialize_request(self, request, *args, **kwargs):
+        # Файлы пишутся потоково во временные файлы, а не в память
+        request.upload_handlers = [AlertMediaUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
 
-            send_alert_to_bot(alert, request, for_security=True)
+    def get_alert_data(self, request):
+        """
+        Данные тревоги из JSON-тела (медиа в base64) или из multipart-запроса:
+        JSON-поле `alert` и файлы `image`/`video` (+ необязательные `image_sha256`/`video_sha256`).
+        """
+        if not request.content_type.startswith("multipart/form-data"):
+            return request.data
+        return get_multipart_alert_data(request.data, request.FILES)
+
+    def create(self, request, *args, **kwargs):
+        with inflight.track() as running:
+            retry_after = check_shedding(running)
+            if retry_after:
+                return throttled_response(OVERLOADED, retry_after, status.HTTP_503_SERVICE_UNAVAILABLE)
+            try:
+                with STAGE_SECONDS.time("ingest", "parse"):
+                    data = self.get_alert_data(request)
+            except ParseError as e:
+                # Ошибка разбора тела (в том числе превышение ALERT_MEDIA_MAX_SIZE при загрузке) — в формате AIBox
+                return Response({
+                    "error_code": -1,
+                    "message": "client error",
+                    "data": {"non_field_errors": [str(e.detail)]}
+                }, status=status.HTTP_400_BAD_REQUEST)
+            retry_after = check_rate_limit(get_alert_devices([data]))
+            if retry_after:
+                return throttled_response(RATE_LIMITED, retry_after, status.HTTP_429_TOO_MANY_REQUESTS)
+            return self.ingest(data, request)
+
+    def ingest(self, data, request):
+        serializer = self.get_serializer(data=data)
+        with STAGE_SECONDS.time("ingest", "validate"):
+            valid = serializer.is_valid()
+        if valid:
+            alert, outcome = ingest_alert(serializer, request)
+            if outcome != INGEST_CREATED:
+                # Повтор уже принятой тревоги или подавленное повторное срабатывание:
+                # AIBox получает успешный ответ и не ретраит
+                return Response({
+                    "error_code": 0,
+                    "message": INGEST_MESSAGES[outcome],
+                    "data": None
+                }, status=status.HTTP_200_OK)
             return Response({
                 "error_code": 0,
                 "message": "alert push successful",
@@ -47,6 +159,88 @@ class AlertViewSet(ActionSerializerClassMixin,
                 "data": serializer.errors
             }, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=["post"], url_path="bulk", parser_classes=[JSONParser, NDJSONParser])
+    def bulk_push(self, request):
+        """Пакетная загрузка тревог AIBox: JSON-массив или NDJSON, результат по каждому элементу."""
+        items = request.data
+        if not isinstance(items, list):
+            return Response({
+                "error_code": -1,
+                "message": "client error",
+                "data": {"non_field_errors": ["Ожидается массив тревог (JSON array или NDJSON)."]}
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > settings.ALERT_BULK_MAX_ITEMS:
+            return Response({
+                "error_code": -1,
+                "message": "client error",
+                "data": {"non_field_errors": [f"Не более {settings.ALERT_BULK_MAX_ITEMS} тревог за запрос."]}
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        with inflight.track() as running:
+            retry_after = check_shedding(running)
+            if retry_after:
+                return throttled_response(OVERLOADED, retry_after, status.HTTP_503_SERVICE_UNAVAILABLE)
+            # Пачка расходует по токену на тревогу
+            retry_after = check_rate_limit(get_alert_devices(items))
+            if retry_after:
+                return throttled_response(RATE_LIMITED, retry_after, status.HTTP_429_TOO_MANY_REQUESTS)
+            results = bulk_create_alerts(items, request)
+        return Response({
+            "error_code": 0,
+            "message": "alert bulk push processed",
+            "data": results
+        }, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=["post"], url_path=r"media/(?P<kind>image|video)",
+            parser_classes=[MultiPartParser, AlertMediaUploadParser])
+    def attach_media(self, request, pk=None, kind=None):
+        """
+        Потоковая загрузка изображения или видео к уже созданной тревоге:
+        multipart-поле `file` или бинарное тело запроса, sha256 — поле `sha256` или заголовок X-Content-SHA256.
+        """
+        alert = self.get_object()
+        try:
+            data = {
+                "kind": kind,
+                "file": request.FILES.get("file"),
+                "sha256": request.data.get("sha256") or request.headers.get("X-Content-SHA256", ""),
+            }
+        except ParseError as e:
+            return Response({
+                "error_code": -1,
+                "message": "client error",
+                "data": {"file": [str(e.detail)]}
+            }, status=status.HTTP_400_BAD_REQUEST)
+        serializer = AlertMediaUploadSerializer(data=data)
+        if not serializer.is_valid():
+            return Response({
+                "error_code": -1,
+                "message": "client error",
+                "data": serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        media = getattr(alert, kind)
+        if media:
+            return Response({
+                "error_code": -1,
+                "message": "client error",
+                "data": {kind: ["Медиафайл уже прикреплён к тревоге."]}
+            }, status=status.HTTP_409_CONFLICT)
+
+        file = serializer.validated_data["file"]
+        try:
+            with transaction.atomic():
+                media.save(file.name, file, save=False)
+                alert.save(update_fields=[kind])
+                MediaBlob.objects.acquire([media.name])
+        finally:
+            # Для бинарного тела DRF не передаёт файл в HttpRequest, закрываем сами
+            file.close()
+        return Response({
+            "error_code": 0,
+            "message": "media upload successful",
+            "data": {kind: request.build_absolute_uri(media.url)}
+        }, status=status.HTTP_201_CREATED)
 
     @action(detail=True, methods=["post"], url_path="send-action")
     def send_action(self, request, pk=None):
@@ -58,10 +252,8 @@ class AlertViewSet(ActionSerializerClassMixin,
         action = serializer.validated_data["action"]
 
         if action == "confirm":
-            alert.confirm_alert()
-
-            
-            send_alert_to_bot(alert, request, for_security=False)
+            if not confirm_alert_and_notify(alert, request):
+                return Response(ALREADY_PROCESSED, status=status.HTTP_409_CONFLICT)
 
             executive_users = alert.executive_users.filter(telegram_id__isnull=False).values_list("telegram_id", flat=True)
 
@@ -71,62 +263,318 @@ class AlertViewSet(ActionSerializerClassMixin,
             }, status=status.HTTP_200_OK)
 
         elif action == "reject":
-            alert.reject_alert()
-            alert.save()
+            if not reject_alert_and_notify(alert):
+                return Response(ALREADY_PROCESSED, status=status.HTTP_409_CONFLICT)
             return Response({"message": "Тревога отклонена"}, status=status.HTTP_200_OK)
 
         return Response({"error": "Неверное действие"}, status=status.HTTP_400_BAD_REQUEST)
 
-@api_view(["GET"])
-def alert_stats(request):
+    @action(detail=False, methods=["post"], url_path="bulk-action")
+    def bulk_action(self, request):
+        """
+        Пакетное подтверждение/отклонение ожидающих тревог одним запросом:
+        {"action": "confirm" | "reject", "ids": [...]} или {"action": ..., "filter": {"device": 1, "alert_time_after": ...}}.
+        """
+        serializer = AlertBulkActionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({
+                "error_code": -1,
+                "message": "client error",
+                "data": serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        data = serializer.validated_data
+        result = set_alerts_status(data["action"], ids=data.get("ids"), queryset=data.get("filter"))
+        return Response({
+            "error_code": 0,
+            "message": "alert bulk action processed",
+            "data": result
+        }, status=status.HTTP_200_OK)
+
+def get_stats_range(request, tzinfo=None):
+    """
+    Интервал [start, end) статистики из `start_date`/`end_date` (YYYY-MM-DD, включительно)
+    или `period` (day/week/month/all). При неверном формате дат — ValueError.
+    """
     period = request.GET.get("period", "all")
     start_date_str = request.GET.get("start_date")
     end_date_str = request.GET.get("end_date")
 
-    alerts = Alert.objects.all()
-
     if start_date_str and end_date_str:
-        try:
-            start_date = datetime.strptime(start_date_str, "%Y-%m-%d")
-            end_date = datetime.strptime(end_date_str, "%Y-%m-%d")
-            alerts = alerts.filter(
-                alert_time__date__gte=start_date.date(),
-                alert_time__date__lte=end_date.date()
-            )
-        except ValueError:
-            return Response({"error": "Invalid date format. Use YYYY-MM-DD."}, status=400)
+        start_date = datetime.strptime(start_date_str, "%Y-%m-%d")
+        end_date = datetime.strptime(end_date_str, "%Y-%m-%d")
+        # Диапазон по самому `alert_time` (а не `alert_time__date`), конец — начало следующего дня
+        return make_aware(start_date, tzinfo), make_aware(end_date + timedelta(days=1), tzinfo)
     elif period == "day":
-        start_time = now() - timedelta(days=1)
-        alerts = alerts.filter(alert_time__gte=start_time)
+        return now() - timedelta(days=1), None
     elif period == "week":
-        start_time = now() - timedelta(days=7)
-        alerts = alerts.filter(alert_time__gte=start_time)
+        return now() - timedelta(days=7), None
     elif period == "month":
-        start_time = now() - timedelta(days=30)
-        alerts = alerts.filter(alert_time__gte=start_time)
-
-    total_alerts = alerts.count()
-    confirmed_alerts = alerts.filter(status="confirmed").count()
-
-    algorithm_data = (
-        alerts
-        .values("alg__name")
-        .annotate(
-            total=Count("id"),
-            confirmed=Count("id", filter=Q(status="confirmed"))
-        )
-        .order_by("-total")
-    )
+        return now() - timedelta(days=30), None
+    return None, None
+
+
+@api_view(["GET"])
+def alert_stats(request):
+    try:
+        start_time, end_time = get_stats_range(request)
+    except ValueError:
+        return Response({"error": "Invalid date format. Use YYYY-MM-DD."}, status=400)
+
+    counts = count_alerts(start_time, end_time)
+
+    algorithms = {}
+    for (alg_name, alert_status), total in counts.items():
+        item = algorithms.setdefault(alg_name, {"name": alg_name, "total": 0, "confirmed": 0})
+        item["total"] += total
+        if alert_status == Alert.STATUS_CONFIRMED:
+            item["confirmed"] += total
 
     return Response({
-        "total_alerts": total_alerts,
-        "confirmed_alerts": confirmed_alerts,
-        "algorithms": [
-            {
-                "name": item["alg__name"],
-                "total": item["total"],
-                "confirmed": item["confirmed"]
-            }
-            for item in algorithm_data
+        "total_alerts": sum(item["total"] for item in algorithms.values()),
+        "confirmed_alerts": sum(item["confirmed"] for item in algorithms.values()),
+        "algorithms": sorted(algorithms.values(), key=lambda item: -item["total"])
+    })
+
+
+HISTOGRAM_BUCKETS = ("hour", "day", "week")
+
+
+@api_view(["GET"])
+def alert_histogram(request):
+    """
+    Количество тревог по периодам (`bucket`: hour/day/week) с разбивкой по статусам и алгоритмам.
+    Параметры: `tz` (IANA, по умолчанию TIME_ZONE), `company`, `device`, `source`,
+    интервал — как в `alert_stats` (`period` или `start_date`/`end_date`).
+    """
+    bucket = request.GET.get("bucket", "day")
+    if bucket not in HISTOGRAM_BUCKETS:
+        return Response({"error": "Invalid bucket. Use hour, day or week."}, status=400)
+
+    tz_name = request.GET.get("tz")
+    try:
+        tzinfo = ZoneInfo(tz_name) if tz_name else None
+    except (ZoneInfoNotFoundError, ValueError):
+        return Response({"error": "Unknown time zone."}, status=400)
+
+    filters = {}
+    for name in ("company", "device", "source"):
+        value = request.GET.get(name)
+        if value:
+            if not value.isdigit():
+                return Response({"error": f"Invalid {name} id."}, status=400)
+            filters[f"{name}_id"] = int(value)
+
+    try:
+        start_time, end_time = get_stats_range(request, tzinfo)
+    except ValueError:
+        return Response({"error": "Invalid date format. Use YYYY-MM-DD."}, status=400)
+
+    counts = count_alerts(start_time, end_time, bucket=bucket, tzinfo=tzinfo, **filters)
+
+    statuses = [choice for choice, _ in Alert.STATUS_CHOICES]
+    series = {}
+    for (period_start, alg_name, alert_status), total in counts.items():
+        item = series.setdefault(period_start, {
+            "period": period_start, "total": 0, "statuses": dict.fromkeys(statuses, 0), "algorithms": {}
+        })
+        algorithm = item["algorithms"].setdefault(alg_name, {"name": alg_name, "total": 0, **dict.fromkeys(statuses, 0)})
+        item["total"] += total
+        item["statuses"][alert_status] = item["statuses"].get(alert_status, 0) + total
+        algorithm["total"] += total
+        algorithm[alert_status] = algorithm.get(alert_status, 0) + total
+
+    return Response({
+        "bucket": bucket,
+        "tz": tz_name or settings.TIME_ZONE,
+        "series": [
+            {**item, "algorithms": sorted(item["algorithms"].values(), key=lambda alg: -alg["total"])}
+            for _, item in sorted(series.items())
+        ]
+    })
+
+
+# Асинхронные (ASGI) представления приёма тревог и действий над ними.
+# DRF не поддерживает async-обработчики, поэтому это обычные представления Django:
+# чтение идёт через async ORM, а запись с транзакцией (async ORM транзакции не
+# поддерживает) выполняется одним переходом в sync_to_async.
+
+def json_response(data, status=status.HTTP_200_OK):
+    return HttpResponse(dumps(data), status=status, content_type="application/json")
+
+
+def throttled_response(message, retry_after, status):
+    """Отказ из-за ограничения частоты или перегрузки: формат AIBox и заголовок Retry-After."""
+    return Response(throttled_body(message, retry_after), status=status,
+                    headers={"Retry-After": str(math.ceil(retry_after))})
+
+
+def throttled_json_response(message, retry_after, status):
+    response = json_response(throttled_body(message, retry_after), status=status)
+    response["Retry-After"] = str(math.ceil(retry_after))
+    return response
+
+
+def client_error(data, status=status.HTTP_400_BAD_REQUEST):
+    return json_response({"error_code": -1, "message": "client error", "data": data}, status=status)
+
+
+def get_alert_body_max_size():
+    """Предел JSON-тела тревоги: изображение и видео в base64 по ALERT_MEDIA_MAX_SIZE и 1 МБ на остальные поля."""
+    return 2 * 4 * math.ceil(settings.ALERT_MEDIA_MAX_SIZE / 3) + 1024 * 1024
+
+
+def read_alert_request(request):
+    """
+    Данные тревоги из HttpRequest: JSON-тело или multipart (файлы пишутся во временные файлы).
+    JSON читается из потока, а не через `request.body`: как и в DRF (v1), тело с base64-медиа
+    ограничено размером медиафайлов, а не DATA_UPLOAD_MAX_MEMORY_SIZE.
+    """
+    if request.content_type == "multipart/form-data":
+        request.upload_handlers = [AlertMediaUploadHandler(request)]
+        try:
+            return get_multipart_alert_data(request.POST, request.FILES)
+        except (MultiPartParserError, RequestDataTooBig) as e:
+            # Превышение ALERT_MEDIA_MAX_SIZE (см. AlertMediaUploadHandler) или DATA_UPLOAD_MAX_MEMORY_SIZE
+            # для полей формы, кроме файлов
+            raise ParseError(str(e))
+    max_size = get_alert_body_max_size()
+    body = request.read(max_size + 1)
+    if len(body) > max_size:
+        raise ParseError(f"Тело запроса превышает допустимый размер {max_size} байт.")
+    try:
+        return loads(body or b"{}")
+    except ValueError:
+        raise ParseError("Тело запроса должно содержать JSON.")
+
+
+@csrf_exempt
+@require_POST
+async def alert_push_async(request):
+    """Асинхронный приём одной тревоги AIBox, формат запроса и ответа — как у `AlertViewSet.create`."""
+    with inflight.track() as running:
+        retry_after = await acheck_shedding(running)
+        if retry_after:
+            return throttled_json_response(OVERLOADED, retry_after, status.HTTP_503_SERVICE_UNAVAILABLE)
+        return await push_alert(request)
+
+
+async def push_alert(request):
+    try:
+        # Разбор multipart и base64 — файловые операции и CPU, уводим их из цикла событий
+        with STAGE_SECONDS.time("ingest", "parse"):
+            data = await sync_to_async(read_alert_request, thread_sensitive=False)(request)
+    except ParseError as e:
+        return client_error({"non_field_errors": [str(e.detail)]})
+    if not isinstance(data, dict):
+        return client_error({"non_field_errors": ["Ожидается JSON-объект тревоги."]})
+
+    # Устройство ищем заранее через async ORM, чтобы валидация не обращалась к БД
+    aibox_id = get_alert_device_id(data)
+    device = await aget_device(aibox_id) if aibox_id else None
+    if aibox_id:
+        retry_after = check_rate_limit([(aibox_id, device)])
+        if retry_after:
+            return throttled_json_response(RATE_LIMITED, retry_after, status.HTTP_429_TOO_MANY_REQUESTS)
+    serializer = AlertCreateSerializer(data=data, context={"request": request, "device": device})
+    with STAGE_SECONDS.time("ingest", "validate"):
+        valid = await sync_to_async(serializer.is_valid, thread_sensitive=False)()
+    if not valid:
+        return client_error(serializer.errors)
+
+    alert, outcome = await sync_to_async(ingest_alert)(serializer, request)
+    if outcome != INGEST_CREATED:
+        return json_response({"error_code": 0, "message": INGEST_MESSAGES[outcome], "data": None})
+    return json_response({"error_code": 0, "message": "alert push successful", "data": None},
+                         status=status.HTTP_201_CREATED)
+
+
+@csrf_exempt
+@require_POST
+async def alert_action_async(request, pk):
+    """Асинхронное подтверждение/отклонение тревоги, как `AlertViewSet.send_action`."""
+    try:
+        alert = await Alert.objects.only(*Alert.STATUS_FIELDS).aget(pk=pk)
+    except Alert.DoesNotExist:
+        return json_response({"detail": "No Alert matches the given query."}, status=status.HTTP_404_NOT_FOUND)
+
+    try:
+        payload = loads(request.body or b"{}")
+    except ValueError:
+        return json_response({"detail": "JSON parse error."}, status=status.HTTP_400_BAD_REQUEST)
+    serializer = AlertActionSerializer(data=payload)
+    if not serializer.is_valid():
+        return json_response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    if serializer.validated_data["action"] == "confirm":
+        if not await sync_to_async(confirm_alert_and_notify)(alert, request):
+            return json_response(ALREADY_PROCESSED, status=status.HTTP_409_CONFLICT)
+        executive_users = [
+            telegram_id async for telegram_id in
+            alert.executive_users.filter(telegram_id__isnull=False).values_list("telegram_id", flat=True)
         ]
-    })
\ No newline at end of file
+        return json_response({"message": "Тревога подтверждена", "executive_users": executive_users})
+
+    if not await sync_to_async(reject_alert_and_notify)(alert):
+        return json_response(ALREADY_PROCESSED, status=status.HTTP_409_CONFLICT)
+    return json_response({"message": "Тревога отклонена"})
+
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {dumps(data).decode()}\n\n"
+
+
+@require_GET
+async def alert_stream(request):
+    """
+    Поток Server-Sent Events для дашборда вместо опроса списка тревог:
+    `alert.created` — новая тревога, `alert.status` — подтверждение/отклонение.
+    Поток доступен только вошедшему пользователю и всегда ограничен одной компанией:
+    компанией пользователя, а для администратора без компании — параметром `company`.
+    Раз в ALERT_STREAM_HEARTBEAT секунд отправляется комментарий-пинг; `reset` означает,
+    что часть событий потеряна (клиент не успевал их читать) и список нужно перечитать.
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return json_response({"error_code": -1, "message": "authentication required", "data": None},
+                             status=status.HTTP_401_UNAUTHORIZED)
+    company = request.GET.get("company")
+    if company and not company.isdigit():
+        return client_error({"company": ["Ожидается id компании."]})
+    company_id = int(company) if company else None
+    if user.company_id is not None:
+        if company_id is not None and company_id != user.company_id:
+            return json_response({"error_code": -1, "message": "forbidden", "data": None},
+                                 status=status.HTTP_403_FORBIDDEN)
+        company_id = user.company_id
+    elif not user.is_staff:
+        return json_response({"error_code": -1, "message": "forbidden", "data": None},
+                             status=status.HTTP_403_FORBIDDEN)
+    elif company_id is None:
+        # Поток всех компаний не отдаём даже администратору
+        return client_error({"company": ["Укажите id компании."]})
+
+    async def stream():
+        subscription = broker.subscribe(company_id)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                if subscription.lagging:
+                    while not subscription.queue.empty():
+                        subscription.queue.get_nowait()
+                    subscription.lagging = False
+                    yield format_sse("reset", {})
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), settings.ALERT_STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield format_sse(event["type"], event)
+        finally:
+            broker.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Отключаем буферизацию ответа в nginx
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,47 @@
+from django.db import transaction
+
+from visionaibox.cache import ReferenceCache
+from .models import Device, Source
+
+device_cache = ReferenceCache("device")
+source_cache = ReferenceCache("source")
+
+
+def get_device(aibox_id):
+    """
+    Устройство (вместе с компанией) по `aibox_id` из кэша или БД; None, если не найдено.
+    Промахи тоже кэшируются: незарегистрированный AIBox не обращается к БД на каждую тревогу,
+    а регистрация устройства сбрасывает кэш (см. devices/signals.py).
+    """
+    return device_cache.get_or_load(
+        str(aibox_id),
+        lambda: Device.objects.select_related("company").filter(aibox_id=aibox_id).first(),
+        cache_misses=True,
+    )
+
+
+async def aget_device(aibox_id):
+    """Асинхронный вариант `get_device` для ASGI-представлений (async ORM)."""
+    return await device_cache.aget_or_load(
+        str(aibox_id),
+        lambda: Device.objects.select_related("company").filter(aibox_id=aibox_id).afirst(),
+        cache_misses=True,
+    )
+
+
+def get_or_create_source(device, source_data):
+    """Источник (камера) устройства из кэша или БД, создаётся при первом появлении."""
+    source_id = source_data.get("id")
+    key = (device.id, str(source_id))
+    source = source_cache.get(key)
+    if source is None:
+        source, created = Source.objects.get_or_create(
+            source_id=source_id, device=device,
+            defaults={"ipv4": source_data.get("ipv4", ""), "desc": source_data.get("desc", "")}
+        )
+        if created:
+            # Новую запись кэшируем только после коммита, чтобы не сохранить откатанную
+            transaction.on_commit(lambda: source_cache.set(key, source))
+        else:
+            source_cache.set(key, source)
+    return source
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.5 on 2026-10-18 14:55
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicate_sources(apps, schema_editor):
+    """Объединяет дубли источников (device, source_id), созданные гонкой get_or_create."""
+    Source = apps.get_model("devices", "Source")
+    Alert = apps.get_model("algorithms", "Alert")
+    AlertRollup = apps.get_model("algorithms", "AlertRollup")
+    duplicates = (
+        Source.objects.values("device_id", "source_id")
+        .annotate(keep_id=Min("id"), total=Count("id"))
+        .filter(total__gt=1)
+    )
+    for row in duplicates:
+        extra_ids = list(
+            Source.objects.filter(device_id=row["device_id"], source_id=row["source_id"])
+            .exclude(id=row["keep_id"]).values_list("id", flat=True)
+        )
+        Alert.objects.filter(source_id__in=extra_ids).update(source_id=row["keep_id"])
+        AlertRollup.objects.filter(source_id__in=extra_ids).update(source_id=row["keep_id"])
+        Source.objects.filter(id__in=extra_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0002_rename_description_device_desc_and_more'),
+        ('algorithms', '0006_alertrollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_sources, migrations.RunPython.noop),
+    ]
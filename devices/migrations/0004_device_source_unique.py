@@ -0,0 +1,63 @@
+# Generated by Django 5.1.5 on 2026-10-18 14:55
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_devices(apps, schema_editor):
+    """
+    Объединяет дубли устройств с одним `aibox_id`, созданные гонкой get_or_create:
+    остаётся устройство с наименьшим id, к нему переносятся источники, тревоги и агрегаты.
+    Источник, чей `source_id` у оставшегося устройства уже есть, объединяется с ним, как в 0003.
+    """
+    Device = apps.get_model("devices", "Device")
+    Source = apps.get_model("devices", "Source")
+    Alert = apps.get_model("algorithms", "Alert")
+    AlertRollup = apps.get_model("algorithms", "AlertRollup")
+    duplicates = (
+        Device.objects.values("aibox_id")
+        .annotate(keep_id=Min("id"), total=Count("id"))
+        .filter(total__gt=1)
+    )
+    for row in duplicates:
+        keep_id = row["keep_id"]
+        extra_ids = list(
+            Device.objects.filter(aibox_id=row["aibox_id"]).exclude(id=keep_id).values_list("id", flat=True)
+        )
+        kept_sources = dict(Source.objects.filter(device_id=keep_id).values_list("source_id", "id"))
+        for source_id, source_pk in Source.objects.filter(device_id__in=extra_ids).order_by("id").values_list(
+            "source_id", "id"
+        ):
+            if source_id in kept_sources:
+                Alert.objects.filter(source_id=source_pk).update(source_id=kept_sources[source_id])
+                AlertRollup.objects.filter(source_id=source_pk).update(source_id=kept_sources[source_id])
+                Source.objects.filter(id=source_pk).delete()
+            else:
+                Source.objects.filter(id=source_pk).update(device_id=keep_id)
+                kept_sources[source_id] = source_pk
+        Alert.objects.filter(device_id__in=extra_ids).update(device_id=keep_id)
+        AlertRollup.objects.filter(device_id__in=extra_ids).update(device_id=keep_id)
+        Device.objects.filter(id__in=extra_ids).delete()
+    if duplicates and schema_editor.connection.vendor == "postgresql":
+        # Отложенные проверки внешних ключей должны сработать до ALTER TABLE в этой же транзакции
+        schema_editor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0003_merge_duplicate_sources'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_devices, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='device',
+            name='aibox_id',
+            field=models.CharField(max_length=100, unique=True),
+        ),
+        migrations.AddConstraint(
+            model_name='source',
+            constraint=models.UniqueConstraint(fields=('device', 'source_id'), name='source_device_source_id_uniq'),
+        ),
+    ]
@@ -4,7 +4,7 @@ from companies.models import Company
 # Create your models here.
 class Device(models.Model):
     company = models.ForeignKey(Company, on_delete=models.CASCADE)
-    aibox_id = models.CharField(max_length=100)
+    aibox_id = models.CharField(max_length=100, unique=True)
     name = models.CharField(max_length=255)
     desc= models.TextField(blank=True)
 
@@ -19,5 +19,10 @@ class Source(models.Model):
     desc = models.TextField(blank=True)
     device = models.ForeignKey(Device, on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["device", "source_id"], name="source_device_source_id_uniq"),
+        ]
+
     def __str__(self):
         return self.source_id
\ No newline at end of file
@@ -0,0 +1,26 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from companies.models import Company
+from .lookups import device_cache, source_cache
+from .models import Device, Source
+
+
+@receiver([post_save, post_delete], sender=Device)
+def invalidate_device_cache(sender, **kwargs):
+    device_cache.invalidate()
+    source_cache.invalidate()
+    # Ещё раз после коммита: до него параллельный запрос мог закэшировать промах по новому устройству
+    transaction.on_commit(device_cache.invalidate)
+
+
+@receiver([post_save, post_delete], sender=Source)
+def invalidate_source_cache(sender, **kwargs):
+    source_cache.invalidate()
+
+
+@receiver(post_save, sender=Company)
+def invalidate_company_devices_cache(sender, **kwargs):
+    # Устройства кэшируются вместе с компанией
+    device_cache.invalidate()
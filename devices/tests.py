@@ -1,3 +1,72 @@
 from django.test import TestCase
 
-# Create your tests here.
+from companies.models import Company
+from visionaibox.tests import SharedReferenceCacheMixin
+from .lookups import aget_device, device_cache, get_device, get_or_create_source, source_cache
+from .models import Device, Source
+
+
+class DeviceCacheTests(SharedReferenceCacheMixin, TestCase):
+    """Изменение устройства, источника или компании сбрасывает локальный и общий кэш справочников."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name="Test company")
+        cls.device = Device.objects.create(company=cls.company, aibox_id="aibox-cache", name="Box")
+        cls.source = Source.objects.create(source_id="1", ipv4="10.0.0.1", device=cls.device)
+
+    def setUp(self):
+        super().setUp()
+        device_cache.invalidate()
+        source_cache.invalidate()
+        self.source_key = (self.device.pk, "1")
+
+    def test_device_save(self):
+        self.assertEqual(get_device("aibox-cache").name, "Box")
+        self.assertCached(device_cache, "aibox-cache", self.device)
+        self.device.name = "Renamed"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.device.save()
+        self.assertNotCached(device_cache, "aibox-cache")
+        self.assertEqual(get_device("aibox-cache").name, "Renamed")
+
+    def test_device_delete(self):
+        get_device("aibox-cache")
+        get_or_create_source(self.device, {"id": "1"})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.device.delete()
+        self.assertNotCached(device_cache, "aibox-cache")
+        self.assertNotCached(source_cache, self.source_key)
+        self.assertIsNone(get_device("aibox-cache"))
+
+    def test_new_device_after_cached_miss(self):
+        self.assertIsNone(get_device("aibox-new"))
+        with self.assertNumQueries(0):
+            self.assertIsNone(get_device("aibox-new"))
+        with self.captureOnCommitCallbacks(execute=True):
+            device = Device.objects.create(company=self.company, aibox_id="aibox-new", name="New box")
+        self.assertEqual(get_device("aibox-new"), device)
+
+    async def test_async_device(self):
+        self.assertEqual(await aget_device("aibox-cache"), self.device)
+        self.assertCached(device_cache, "aibox-cache", self.device)
+        self.assertIsNone(await aget_device("aibox-new"))
+
+    def test_company_save(self):
+        get_device("aibox-cache")
+        self.company.name = "Renamed company"
+        self.company.save()
+        self.assertNotCached(device_cache, "aibox-cache")
+        self.assertEqual(get_device("aibox-cache").company.name, "Renamed company")
+
+    def test_source_save_and_delete(self):
+        self.assertEqual(get_or_create_source(self.device, {"id": "1"}), self.source)
+        self.assertCached(source_cache, self.source_key, self.source)
+        self.source.desc = "Entrance"
+        self.source.save()
+        self.assertNotCached(source_cache, self.source_key)
+        self.assertEqual(get_or_create_source(self.device, {"id": "1"}).desc, "Entrance")
+        self.source.delete()
+        self.assertNotCached(source_cache, self.source_key)
+        # Удалённый источник создаётся заново при следующей тревоге
+        self.assertNotEqual(get_or_create_source(self.device, {"id": "1", "ipv4": "10.0.0.1"}).pk, self.source.pk)
@@ -1,3 +1,10 @@
 from django.contrib import admin
+from .models import BotNotification
 
-# Register your models here.
+
+@admin.register(BotNotification)
+class BotNotificationAdmin(admin.ModelAdmin):
+    list_display = ("id", "alert", "for_security", "status", "attempts", "next_attempt_at", "sent_at")
+    list_filter = ("status", "for_security")
+    search_fields = ("alert__aibox_alert_id",)
+    raw_id_fields = ("alert",)
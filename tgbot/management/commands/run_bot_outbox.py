@@ -0,0 +1,74 @@
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from tgbot.services import aprocess_outbox, get_async_client, process_outbox
+from visionaibox.metrics import CONTENT_TYPE, REGISTRY
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = REGISTRY.render()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port):
+    """Отдаёт метрики процесса на `:<port>/` из фонового потока."""
+    if not settings.METRICS_ENABLED:
+        raise CommandError("--metrics-port требует METRICS_ENABLED=True.")
+    server = ThreadingHTTPServer(("", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+
+
+class Command(BaseCommand):
+    help = "Воркер, отправляющий уведомления о тревогах из очереди (outbox) в бота"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=settings.BOT_OUTBOX_BATCH_SIZE,
+                            help="Размер пачки уведомлений")
+        parser.add_argument("--interval", type=float, default=settings.BOT_OUTBOX_POLL_INTERVAL,
+                            help="Пауза между опросами пустой очереди, сек.")
+        parser.add_argument("--once", action="store_true", help="Обработать очередь один раз и выйти")
+        parser.add_argument("--async", action="store_true", dest="use_async",
+                            help="Отправлять через асинхронный HTTP-клиент (httpx) вместо пула потоков")
+        parser.add_argument("--metrics-port", type=int, default=None,
+                            help="Порт HTTP-сервера с метриками воркера для Prometheus (нужен METRICS_ENABLED)")
+
+    def handle(self, *args, **options):
+        if options["metrics_port"]:
+            start_metrics_server(options["metrics_port"])
+        if options["use_async"]:
+            asyncio.run(self.run_async(options))
+            return
+
+        batch_size = options["batch_size"]
+        while True:
+            processed = process_outbox(batch_size=batch_size)
+            if processed:
+                self.stdout.write(f"Обработано уведомлений: {processed}")
+                continue
+            if options["once"]:
+                break
+            time.sleep(options["interval"])
+
+    async def run_async(self, options):
+        async with get_async_client() as client:
+            while True:
+                processed = await aprocess_outbox(batch_size=options["batch_size"], client=client)
+                if processed:
+                    self.stdout.write(f"Обработано уведомлений: {processed}")
+                    continue
+                if options["once"]:
+                    break
+                await asyncio.sleep(options["interval"])
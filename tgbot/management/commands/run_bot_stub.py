@@ -0,0 +1,83 @@
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+
+class BotStubHandler(BaseHTTPRequestHandler):
+    """Ответ как у бота: `{"error_code": 0}` на POST с уведомлением о тревоге."""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if server.latency:
+            time.sleep(random.expovariate(1 / server.latency))
+        if random.random() < server.error_rate:
+            status, result, response = 500, "error", {"error_code": -1, "message": "stub error"}
+        else:
+            try:
+                payload = json.loads(body)
+            except ValueError:
+                status, result, response = 400, "invalid", {"error_code": -1, "message": "invalid json"}
+            else:
+                kind = "summary" if payload.get("type") == "alerts_summary" else (
+                    "security" if payload.get("for_security") else "executive"
+                )
+                status, result, response = 200, kind, {"error_code": 0, "message": "ok"}
+        with server.lock:
+            server.counts[result] += 1
+        data = json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Заглушка бота для нагрузочных прогонов: принимает уведомления воркера `run_bot_outbox` "
+        "(BOT_ALERT_URL) с заданной задержкой и долей ошибок, печатает, сколько получено"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8001)
+        parser.add_argument("--latency", type=float, default=0.0, help="Средняя задержка ответа, сек. (экспоненциальная)")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 500")
+        parser.add_argument("--report-interval", type=float, default=10.0, help="Период отчёта, сек.")
+
+    def handle(self, *args, **options):
+        server = ThreadingHTTPServer((options["host"], options["port"]), BotStubHandler)
+        server.daemon_threads = True
+        server.latency = options["latency"]
+        server.error_rate = options["error_rate"]
+        server.counts = Counter()
+        server.lock = threading.Lock()
+        threading.Thread(target=server.serve_forever, name="bot-stub", daemon=True).start()
+        self.stdout.write(f"Заглушка бота слушает http://{options['host']}:{options['port']}/")
+
+        started, previous = time.perf_counter(), 0
+        try:
+            while True:
+                time.sleep(options["report_interval"])
+                with server.lock:
+                    counts = dict(server.counts)
+                total = sum(counts.values())
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"{elapsed:.0f} с: получено {total} ({(total - previous) / options['report_interval']:.1f}/с), {counts}"
+                )
+                previous = total
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.shutdown()
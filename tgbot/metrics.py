@@ -0,0 +1,14 @@
+from visionaibox.metrics import Counter, Histogram
+
+BOT_REQUEST_SECONDS = Histogram(
+    "visionaibox_bot_request_seconds", "Время HTTP-запроса к боту", ("result",),
+)
+BOT_DELIVERIES = Counter(
+    "visionaibox_bot_deliveries_total",
+    "Попытки доставки уведомлений боту: sent — доставлено, retry — будет повтор, failed — попытки исчерпаны",
+    ("result",),
+)
+BOT_DELIVERY_DELAY_SECONDS = Histogram(
+    "visionaibox_bot_delivery_delay_seconds", "Время от постановки уведомления в outbox до доставки",
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600),
+)
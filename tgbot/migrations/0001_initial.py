@@ -0,0 +1,37 @@
+# Generated by Django 5.1.5 on 2026-10-18 14:47
+
+import django.core.serializers.json
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('algorithms', '0004_remove_alert_image_url'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BotNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('for_security', models.BooleanField(default=True, help_text='Уведомление для СБ (иначе для учредителей)')),
+                ('destination', models.CharField(help_text='URL бота, на который отправляется уведомление', max_length=500)),
+                ('payload', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, help_text='Тело запроса к боту')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает отправки'), ('sent', 'Отправлено'), ('failed', 'Ошибка')], default='pending', help_text='Статус доставки', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0, help_text='Количество попыток отправки')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, help_text='Время следующей попытки')),
+                ('last_error', models.TextField(blank=True, help_text='Последняя ошибка доставки')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, help_text='Время успешной доставки', null=True)),
+                ('alert', models.ForeignKey(help_text='Тревога, о которой уведомляем', on_delete=django.db.models.deletion.CASCADE, related_name='bot_notifications', to='algorithms.alert')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='tgbot_notif_status_next_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.5 on 2026-10-18 15:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('algorithms', '0011_alert_unique_with_time'),
+        ('tgbot', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='botnotification',
+            name='alert',
+            field=models.ForeignKey(db_constraint=False, help_text='Тревога, о которой уведомляем', on_delete=django.db.models.deletion.CASCADE, related_name='bot_notifications', to='algorithms.alert'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.5 on 2026-10-18 15:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('algorithms', '0012_alert_partitioning'),
+        ('tgbot', '0002_botnotification_alert_no_db_constraint'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='botnotification',
+            name='alert',
+            field=models.ForeignKey(blank=True, db_constraint=False, help_text='Тревога, о которой уведомляем (пусто — сводка по нескольким тревогам)', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='bot_notifications', to='algorithms.alert'),
+        ),
+    ]
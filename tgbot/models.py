@@ -1,3 +1,38 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.utils.timezone import now
 
-# Create your models here.
+
+class BotNotification(models.Model):
+    """Исходящее уведомление для бота (outbox), доставляется воркером `run_bot_outbox`."""
+    STATUS_PENDING = "pending"
+    STATUS_SENT = "sent"
+    STATUS_FAILED = "failed"
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Ожидает отправки"),
+        (STATUS_SENT, "Отправлено"),
+        (STATUS_FAILED, "Ошибка"),
+    ]
+    # Таблица тревог секционирована, внешний ключ на неё в БД невозможен (каскад выполняет Django)
+    alert = models.ForeignKey("algorithms.Alert", on_delete=models.CASCADE, related_name="bot_notifications",
+                              db_constraint=False, null=True, blank=True,
+                              help_text="Тревога, о которой уведомляем (пусто — сводка по нескольким тревогам)")
+    for_security = models.BooleanField(default=True, help_text="Уведомление для СБ (иначе для учредителей)")
+    destination = models.CharField(max_length=500, help_text="URL бота, на который отправляется уведомление")
+    payload = models.JSONField(encoder=DjangoJSONEncoder, help_text="Тело запроса к боту")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING,
+                              help_text="Статус доставки")
+    attempts = models.PositiveIntegerField(default=0, help_text="Количество попыток отправки")
+    next_attempt_at = models.DateTimeField(default=now, help_text="Время следующей попытки")
+    last_error = models.TextField(blank=True, help_text="Последняя ошибка доставки")
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True, help_text="Время успешной доставки")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"], name="tgbot_notif_status_next_idx"),
+        ]
+
+    def __str__(self):
+        return f"Уведомление {self.id} ({self.status})"
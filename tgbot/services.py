@@ -1,40 +1,379 @@
+import asyncio
 import logging
+import math
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from urllib.parse import urljoin
 
+import httpx
 import requests
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from algorithms.serializers import AlertSerializer  
+from django.db import transaction
+from django.utils.timezone import now
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-BOT_URL = settings.BOT_ALERT_URL  
+from algorithms.models import Algorithm
+from algorithms.serializers import AlertSerializer
+from devices.models import Device
+from users.lookups import get_recipients, get_recipients_map
+from .metrics import BOT_DELIVERIES, BOT_DELIVERY_DELAY_SECONDS, BOT_REQUEST_SECONDS
+from .models import BotNotification
+
+BOT_URL = settings.BOT_ALERT_URL
 logger = logging.getLogger(__name__)
 
+# Повторы установки соединения на уровне транспорта (запрос ещё не отправлен, дубля не будет)
+TRANSPORT_RETRIES = 2
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def build_bot_payload(alert, request, users_telegram_id, for_security):
+    """Формирует тело запроса к боту через `AlertSerializer`."""
+    serialized_alert = AlertSerializer(alert, context={"request": request}).data
+    serialized_alert["users_telegram_id"] = users_telegram_id
+    serialized_alert["for_security"] = for_security
+    return serialized_alert
+
+
+def get_telegram_ids(recipients, for_security):
+    """Telegram ID службы безопасности или учредителей из справочника получателей."""
+    ids = recipients.security_telegram_ids if for_security else recipients.executive_telegram_ids
+    return list(ids)
+
+
 def send_alert_to_bot(alert, request, for_security=True):
     """
-    Отправляет информацию о новом alert в бота по HTTP POST-запросу,
-    используя `AlertSerializer` для преобразования данных.
+    Ставит уведомление о тревоге в очередь (outbox) для бота.
+    Данные формируются через `AlertSerializer` сразу, а отправку выполняет
+    воркер `run_bot_outbox`, поэтому вызов не блокирует запрос.
+    Вызывать внутри той же транзакции, в которой создаётся/меняется тревога.
     """
     if not BOT_URL:
-        print("BOT_URL не задан в settings.")
         logger.error("BOT_URL не задан в settings.")
-        return
-    if for_security:
-        users = alert.device.company.users.filter(is_security=True)
-    else:
-        users = alert.device.company.users.filter(is_executive=True)
-    users_telegram_id = [user.telegram_id for user in users if user.telegram_id]
-    # Сериализуем Alert через `AlertSerializer`
-    serialized_alert = AlertSerializer(alert, context={"request": request}).data
-    serialized_alert["users_telegram_id"] = users_telegram_id
-    serialized_alert["for_security"] = for_security
+        return None
+    recipients = get_recipients(alert.company_id)
+    users_telegram_id = get_telegram_ids(recipients, for_security)
+
+    return BotNotification.objects.create(
+        alert=alert,
+        for_security=for_security,
+        destination=BOT_URL,
+        payload=build_bot_payload(alert, request, users_telegram_id, for_security),
+    )
+
+
+def send_alerts_to_bot(alerts, request, for_security=True):
+    """
+    Пакетный вариант `send_alert_to_bot`: получатели берутся из справочника
+    (недостающие компании — одним запросом), уведомления создаются одним `bulk_create`.
+    """
+    if not alerts:
+        return []
+    if not BOT_URL:
+        logger.error("BOT_URL не задан в settings.")
+        return []
+    recipients = get_recipients_map({alert.company_id for alert in alerts})
+
+    return BotNotification.objects.bulk_create([
+        BotNotification(
+            alert=alert,
+            for_security=for_security,
+            destination=BOT_URL,
+            payload=build_bot_payload(
+                alert, request, get_telegram_ids(recipients[alert.company_id], for_security), for_security
+            ),
+        )
+        for alert in alerts
+    ])
+
+
+def build_summary_payload(company_id, alerts, status, users_telegram_id, for_security, devices, algorithms):
+    """Тело сводного уведомления: количество тревог, период и разбивка по устройствам и алгоритмам."""
+    by_device = Counter(alert.device_id for alert in alerts)
+    by_alg = Counter(alert.alg_id for alert in alerts)
+    return {
+        "type": "alerts_summary",
+        "company": company_id,
+        "status": status,
+        "count": len(alerts),
+        "first_alert_time": min(alert.alert_time for alert in alerts),
+        "last_alert_time": max(alert.alert_time for alert in alerts),
+        "devices": [
+            {"id": device_id, **devices.get(device_id, {}), "count": count}
+            for device_id, count in by_device.most_common()
+        ],
+        "algorithms": [
+            {"id": alg_id, **algorithms.get(alg_id, {}), "count": count}
+            for alg_id, count in by_alg.most_common()
+        ],
+        "users_telegram_id": users_telegram_id,
+        "for_security": for_security,
+    }
+
+
+def send_alerts_summary_to_bot(alerts, status, for_security=False):
+    """
+    Ставит в очередь бота одно сводное уведомление на компанию о пакетной обработке тревог
+    (вместо уведомления на каждую тревогу). Достаточно полей Alert.STATUS_FIELDS.
+    """
+    if not alerts:
+        return []
+    if not BOT_URL:
+        logger.error("BOT_URL не задан в settings.")
+        return []
+    by_company = defaultdict(list)
+    for alert in alerts:
+        by_company[alert.company_id].append(alert)
+    recipients = get_recipients_map(set(by_company))
+    devices = {
+        device_id: {"aibox_id": aibox_id, "name": name}
+        for device_id, aibox_id, name in Device.objects.filter(
+            id__in={alert.device_id for alert in alerts}
+        ).values_list("id", "aibox_id", "name")
+    }
+    algorithms = {
+        alg_id: {"key": key, "name": name}
+        for alg_id, key, name in Algorithm.objects.filter(
+            id__in={alert.alg_id for alert in alerts if alert.alg_id}
+        ).values_list("id", "key", "name")
+    }
+
+    return BotNotification.objects.bulk_create([
+        BotNotification(
+            for_security=for_security,
+            destination=BOT_URL,
+            payload=build_summary_payload(
+                company_id, company_alerts, status, get_telegram_ids(recipients[company_id], for_security),
+                for_security, devices, algorithms,
+            ),
+        )
+        for company_id, company_alerts in by_company.items()
+    ])
+
+
+def add_previews_to_notifications(alerts):
+    """
+    Добавляет URL миниатюры и превью в ещё не отправленные уведомления о тревогах,
+    чтобы бот загружал уменьшенное изображение вместо оригинала.
+    """
+    alerts = {alert.pk: alert for alert in alerts}
+    if not alerts:
+        return 0
+    notifications = list(BotNotification.objects.filter(
+        alert_id__in=alerts, status=BotNotification.STATUS_PENDING
+    ).only("id", "alert_id", "payload"))
+    for notification in notifications:
+        alert = alerts[notification.alert_id]
+        # В payload URL абсолютные (от запроса, создавшего тревогу) — строим от URL оригинала
+        base_url = notification.payload.get("image") or ""
+        for field in ("image_thumbnail", "image_preview"):
+            media = getattr(alert, field)
+            notification.payload[field] = urljoin(base_url, media.url) if media else None
+    BotNotification.objects.bulk_update(notifications, ["payload"])
+    return len(notifications)
+
+
+def get_session():
+    """
+    Общая HTTP-сессия с пулом соединений. Транспорт повторяет только установку соединения:
+    POST после отправки не повторяется (иначе бот получит дубль), для этого есть расписание outbox.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            pool_size = settings.BOT_OUTBOX_CONCURRENCY
+            retry = Retry(total=TRANSPORT_RETRIES, connect=TRANSPORT_RETRIES, read=0, status=0, other=0,
+                          backoff_factor=0.5)
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+    return _session
 
-    # Отправляем POST-запрос
+
+def deliver_notification(notification, session=None):
+    """Отправляет одно уведомление боту. Возвращает текст ошибки или None при успехе."""
+    session = session or get_session()
+    started = time.perf_counter()
     try:
-        response = requests.post(BOT_URL, json=serialized_alert, timeout=10)
+        response = session.post(notification.destination, json=notification.payload,
+                                timeout=settings.BOT_OUTBOX_REQUEST_TIMEOUT)
         response_data = response.json()
+    except (requests.RequestException, ValueError) as e:
+        BOT_REQUEST_SECONDS.observe(time.perf_counter() - started, "error")
+        return f"Ошибка сети при отправке тревоги: {e}"
+
+    if response.status_code == 200 and response_data.get("error_code") == 0:
+        BOT_REQUEST_SECONDS.observe(time.perf_counter() - started, "sent")
+        return None
+    BOT_REQUEST_SECONDS.observe(time.perf_counter() - started, "error")
+    return f"Ошибка отправки тревоги: {response_data}"
+
+
+def get_retry_delay(attempts):
+    """Экспоненциальная задержка перед следующей попыткой."""
+    delay = settings.BOT_OUTBOX_BACKOFF_BASE * (2 ** max(attempts - 1, 0))
+    return timedelta(seconds=min(delay, settings.BOT_OUTBOX_BACKOFF_MAX))
+
+
+def get_lease_seconds(batch_size):
+    """
+    Срок аренды пачки: не меньше BOT_OUTBOX_LEASE_SECONDS и не меньше худшего времени её отправки —
+    все уведомления на один URL бота по BOT_OUTBOX_DESTINATION_CONCURRENCY за раз, каждое
+    с таймаутом на подключения с повторами и на ответ.
+    """
+    parallel = min(settings.BOT_OUTBOX_CONCURRENCY, settings.BOT_OUTBOX_DESTINATION_CONCURRENCY)
+    request_seconds = settings.BOT_OUTBOX_REQUEST_TIMEOUT * (TRANSPORT_RETRIES + 2)
+    return max(settings.BOT_OUTBOX_LEASE_SECONDS, math.ceil(batch_size / parallel) * request_seconds)
+
+
+def claim_notifications(batch_size):
+    """
+    Забирает пачку готовых к отправке уведомлений.
+    Строки блокируются через SKIP LOCKED и «арендуются» (next_attempt_at переносится на конец
+    аренды, см. `get_lease_seconds`), чтобы несколько воркеров не отправляли одно и то же уведомление.
+    """
+    with transaction.atomic():
+        batch = list(
+            BotNotification.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=BotNotification.STATUS_PENDING, next_attempt_at__lte=now())
+            .order_by("next_attempt_at", "id")[:batch_size]
+        )
+        if batch:
+            lease_until = now() + timedelta(seconds=get_lease_seconds(len(batch)))
+            BotNotification.objects.filter(id__in=[n.id for n in batch]).update(next_attempt_at=lease_until)
+            for notification in batch:
+                notification.next_attempt_at = lease_until
+    return batch
+
+
+def process_outbox(batch_size=None, session=None):
+    """
+    Отправляет одну пачку уведомлений параллельно (не более BOT_OUTBOX_CONCURRENCY
+    запросов всего и BOT_OUTBOX_DESTINATION_CONCURRENCY на один URL бота).
+    Возвращает количество обработанных уведомлений.
+    """
+    batch = claim_notifications(batch_size or settings.BOT_OUTBOX_BATCH_SIZE)
+    if not batch:
+        return 0
+
+    session = session or get_session()
+    limits = {
+        destination: threading.BoundedSemaphore(settings.BOT_OUTBOX_DESTINATION_CONCURRENCY)
+        for destination in {n.destination for n in batch}
+    }
+
+    def deliver(notification):
+        with limits[notification.destination]:
+            return deliver_notification(notification, session)
+
+    with ThreadPoolExecutor(max_workers=min(settings.BOT_OUTBOX_CONCURRENCY, len(batch))) as pool:
+        errors = list(pool.map(deliver, batch))
+
+    record_delivery_results(batch, errors)
+    return len(batch)
 
-        if response.status_code == 200 and response_data.get("error_code") == 0:
-            print("Тревога успешно отправлена боту.")
-        else:
-            print(f"Ошибка отправки тревоги: {response_data}")
-    except requests.RequestException as e:
-        print(f"Ошибка сети при отправке тревоги: {e}")
 
+def record_delivery_results(batch, errors):
+    """
+    Сохраняет итоги отправки пачки: успех, следующая попытка с задержкой или отказ.
+    Уведомления, чья аренда истекла и перешла к другому воркеру (next_attempt_at уже не тот,
+    что выставил `claim_notifications`), не трогаем — их итог запишет новый владелец.
+    """
+    delivered_at = now()
+    with transaction.atomic():
+        leases = dict(
+            BotNotification.objects.select_for_update()
+            .filter(id__in=[n.id for n in batch])
+            .values_list("id", "next_attempt_at")
+        )
+        held = []
+        for notification, error in zip(batch, errors):
+            if leases.get(notification.id) != notification.next_attempt_at:
+                logger.warning("Аренда уведомления %s истекла, результат попытки не сохранён", notification.id)
+                continue
+            held.append(notification)
+            notification.attempts += 1
+            if error is None:
+                notification.status = BotNotification.STATUS_SENT
+                notification.sent_at = delivered_at
+                notification.last_error = ""
+                BOT_DELIVERIES.inc("sent")
+                BOT_DELIVERY_DELAY_SECONDS.observe((delivered_at - notification.created_at).total_seconds())
+                continue
+            logger.warning("Уведомление %s не доставлено (попытка %s): %s",
+                           notification.id, notification.attempts, error)
+            notification.last_error = error
+            if notification.attempts >= settings.BOT_OUTBOX_MAX_ATTEMPTS:
+                notification.status = BotNotification.STATUS_FAILED
+                BOT_DELIVERIES.inc("failed")
+            else:
+                notification.next_attempt_at = delivered_at + get_retry_delay(notification.attempts)
+                BOT_DELIVERIES.inc("retry")
+
+        BotNotification.objects.bulk_update(
+            held, ["status", "attempts", "next_attempt_at", "last_error", "sent_at"]
+        )
+
+
+def get_async_client():
+    """Асинхронный HTTP-клиент для бота: пул на BOT_OUTBOX_CONCURRENCY соединений и повтор соединения."""
+    transport = httpx.AsyncHTTPTransport(
+        retries=TRANSPORT_RETRIES, limits=httpx.Limits(max_connections=settings.BOT_OUTBOX_CONCURRENCY)
+    )
+    return httpx.AsyncClient(transport=transport, timeout=settings.BOT_OUTBOX_REQUEST_TIMEOUT)
+
+
+async def adeliver_notification(notification, client):
+    """Асинхронный вариант `deliver_notification`."""
+    started = time.perf_counter()
+    try:
+        response = await client.post(notification.destination, json=notification.payload)
+        response_data = response.json()
+    except (httpx.HTTPError, ValueError) as e:
+        BOT_REQUEST_SECONDS.observe(time.perf_counter() - started, "error")
+        return f"Ошибка сети при отправке тревоги: {e}"
+
+    if response.status_code == 200 and response_data.get("error_code") == 0:
+        BOT_REQUEST_SECONDS.observe(time.perf_counter() - started, "sent")
+        return None
+    BOT_REQUEST_SECONDS.observe(time.perf_counter() - started, "error")
+    return f"Ошибка отправки тревоги: {response_data}"
+
+
+async def aprocess_outbox(batch_size=None, client=None):
+    """
+    Асинхронный вариант `process_outbox`: пачка отправляется корутинами в одном
+    потоке с теми же ограничениями параллельности, работа с БД — через sync_to_async.
+    """
+    batch = await sync_to_async(claim_notifications)(batch_size or settings.BOT_OUTBOX_BATCH_SIZE)
+    if not batch:
+        return 0
+
+    total = asyncio.Semaphore(settings.BOT_OUTBOX_CONCURRENCY)
+    limits = {
+        destination: asyncio.Semaphore(settings.BOT_OUTBOX_DESTINATION_CONCURRENCY)
+        for destination in {n.destination for n in batch}
+    }
+
+    async def deliver(notification, client):
+        async with total, limits[notification.destination]:
+            return await adeliver_notification(notification, client)
+
+    if client is None:
+        async with get_async_client() as client:
+            errors = await asyncio.gather(*(deliver(n, client) for n in batch))
+    else:
+        errors = await asyncio.gather(*(deliver(n, client) for n in batch))
+
+    await sync_to_async(record_delivery_results)(batch, errors)
+    return len(batch)
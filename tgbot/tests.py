@@ -1,3 +1,168 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+import httpx
+import requests
+from django.test import TestCase, override_settings
+from django.utils.timezone import now
+
+from .models import BotNotification
+from .services import (
+    TRANSPORT_RETRIES, aprocess_outbox, claim_notifications, get_session, process_outbox, record_delivery_results,
+)
+
+
+class FakeResponse:
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+class FakeSession:
+    """HTTP-сессия бота: отвечает заданными результатами по очереди (исключение — ошибка сети)."""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.payloads = []
+
+    def post(self, url, json, timeout):
+        self.payloads.append(json)
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+SENT = FakeResponse(200, {"error_code": 0})
+REJECTED = FakeResponse(500, {"error_code": -1, "message": "bot error"})
+
+
+@override_settings(BOT_OUTBOX_LEASE_SECONDS=60, BOT_OUTBOX_BACKOFF_BASE=2.0, BOT_OUTBOX_BACKOFF_MAX=600.0,
+                   BOT_OUTBOX_MAX_ATTEMPTS=3, BOT_OUTBOX_REQUEST_TIMEOUT=10.0, BOT_OUTBOX_CONCURRENCY=8,
+                   BOT_OUTBOX_DESTINATION_CONCURRENCY=4)
+class BotOutboxTests(TestCase):
+    """Outbox бота: аренда пачки, повтор с экспоненциальной задержкой и отказ после последней попытки."""
+
+    def create(self, **kwargs):
+        return BotNotification.objects.create(destination="http://bot.test/alerts", payload={"id": 1}, **kwargs)
+
+    def expire(self, notification):
+        """Переносит следующую попытку в прошлое, как будто задержка (или аренда) истекла."""
+        BotNotification.objects.filter(pk=notification.pk).update(next_attempt_at=now() - timedelta(seconds=1))
+
+    def assertDelay(self, notification, seconds):
+        delay = (notification.next_attempt_at - now()).total_seconds()
+        self.assertAlmostEqual(delay, seconds, delta=1)
+
+    def test_claim_leases_batch(self):
+        notifications = [self.create(), self.create()]
+        self.assertEqual([n.pk for n in claim_notifications(10)], [n.pk for n in notifications])
+        # Пока аренда не истекла, другой воркер пачку не получит
+        self.assertEqual(claim_notifications(10), [])
+        for notification in notifications:
+            notification.refresh_from_db()
+            self.assertDelay(notification, 60)
+            self.assertEqual(notification.status, BotNotification.STATUS_PENDING)
+        # Воркер упал, не записав результат: после аренды уведомление забирают снова
+        self.expire(notifications[0])
+        self.assertEqual([n.pk for n in claim_notifications(10)], [notifications[0].pk])
+
+    def test_lease_covers_slow_batch(self):
+        # 9 уведомлений на один URL по 4 за раз — три «волны» запросов с худшим временем каждого
+        notifications = [self.create() for _ in range(9)]
+        claim_notifications(10)
+        for notification in notifications:
+            notification.refresh_from_db()
+            self.assertDelay(notification, 3 * 10 * (TRANSPORT_RETRIES + 2))
+
+    def test_expired_lease_results_not_saved(self):
+        notification = self.create()
+        stale = claim_notifications(10)
+        # Аренда первого воркера истекла, пачку забрал второй
+        self.expire(notification)
+        claimed = claim_notifications(10)
+        record_delivery_results(stale, [None])
+        notification.refresh_from_db()
+        self.assertEqual((notification.status, notification.attempts), (BotNotification.STATUS_PENDING, 0))
+
+        record_delivery_results(claimed, ["bot error"])
+        notification.refresh_from_db()
+        self.assertEqual((notification.status, notification.attempts), (BotNotification.STATUS_PENDING, 1))
+        self.assertDelay(notification, 2)
+        # Опоздавший первый воркер не перезаписывает итог второго
+        record_delivery_results(stale, [None])
+        notification.refresh_from_db()
+        self.assertEqual((notification.status, notification.attempts), (BotNotification.STATUS_PENDING, 1))
+
+    def test_session_does_not_retry_sent_post(self):
+        retry = get_session().get_adapter("http://bot.test/").max_retries
+        self.assertEqual(retry.connect, TRANSPORT_RETRIES)
+        self.assertEqual((retry.read, retry.status, retry.other), (0, 0, 0))
+        self.assertFalse(retry.is_retry("POST", 503))
+
+    def test_claim_skips_future_and_finished(self):
+        self.create(next_attempt_at=now() + timedelta(minutes=1))
+        self.create(status=BotNotification.STATUS_SENT)
+        self.create(status=BotNotification.STATUS_FAILED)
+        self.assertEqual(claim_notifications(10), [])
+
+    def test_sent(self):
+        notification = self.create()
+        session = FakeSession(SENT)
+        self.assertEqual(process_outbox(session=session), 1)
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, BotNotification.STATUS_SENT)
+        self.assertEqual(notification.attempts, 1)
+        self.assertIsNotNone(notification.sent_at)
+        self.assertEqual(session.payloads, [{"id": 1}])
+        self.assertEqual(process_outbox(session=FakeSession()), 0)
+
+    def test_retry_with_backoff_then_failed(self):
+        notification = self.create()
+        session = FakeSession(REJECTED, requests.ConnectionError("refused"), REJECTED)
+        for attempt, delay in ((1, 2), (2, 4)):
+            self.assertEqual(process_outbox(session=session), 1)
+            notification.refresh_from_db()
+            self.assertEqual(notification.status, BotNotification.STATUS_PENDING)
+            self.assertEqual(notification.attempts, attempt)
+            self.assertDelay(notification, delay)
+            self.assertTrue(notification.last_error)
+            # До истечения задержки уведомление не отправляется
+            self.assertEqual(process_outbox(session=session), 0)
+            self.expire(notification)
+        self.assertEqual(process_outbox(session=session), 1)
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, BotNotification.STATUS_FAILED)
+        self.assertEqual(notification.attempts, 3)
+        self.assertIn("bot error", notification.last_error)
+        self.assertEqual(session.results, [])
+
+    def test_retry_then_sent(self):
+        notification = self.create()
+        session = FakeSession(requests.Timeout("timeout"), SENT)
+        process_outbox(session=session)
+        self.expire(notification)
+        process_outbox(session=session)
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, BotNotification.STATUS_SENT)
+        self.assertEqual(notification.attempts, 2)
+        self.assertEqual(notification.last_error, "")
+
+    async def test_async_outbox(self):
+        sent = await BotNotification.objects.acreate(destination="http://bot.test/alerts", payload={"id": 1})
+        failed = await BotNotification.objects.acreate(destination="http://bot.test/other", payload={"id": 2})
+
+        def handler(request):
+            if request.url.path == "/alerts":
+                return httpx.Response(200, json={"error_code": 0})
+            return httpx.Response(502, json={"error_code": -1})
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            self.assertEqual(await aprocess_outbox(client=client), 2)
+        await sent.arefresh_from_db()
+        await failed.arefresh_from_db()
+        self.assertEqual(sent.status, BotNotification.STATUS_SENT)
+        self.assertEqual((failed.status, failed.attempts), (BotNotification.STATUS_PENDING, 1))
+        self.assertDelay(failed, 2)
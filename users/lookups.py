@@ -0,0 +1,51 @@
+from collections import namedtuple
+
+from django.db.models import Q
+
+from visionaibox.cache import ReferenceCache
+from .models import User
+
+recipient_cache = ReferenceCache("recipients")
+
+Recipients = namedtuple("Recipients", ["security_telegram_ids", "executive_telegram_ids", "executive_ids"])
+
+
+def _load_recipients(company_ids):
+    """Получатели уведомлений компаний одним запросом `values_list`."""
+    rows = {company_id: ([], [], []) for company_id in company_ids}
+    for company_id, user_id, telegram_id, is_security, is_executive in User.objects.filter(
+        Q(is_security=True) | Q(is_executive=True), company_id__in=company_ids
+    ).values_list("company_id", "id", "telegram_id", "is_security", "is_executive").order_by("id"):
+        security, executive, executive_ids = rows[company_id]
+        if is_security and telegram_id:
+            security.append(telegram_id)
+        if is_executive:
+            executive_ids.append(user_id)
+            if telegram_id:
+                executive.append(telegram_id)
+    return {company_id: Recipients(*map(tuple, lists)) for company_id, lists in rows.items()}
+
+
+def get_recipients_map(company_ids):
+    """
+    Справочник получателей по компаниям: Telegram ID службы безопасности и учредителей
+    и id учредителей (для привязки к тревоге). Отсутствующие в кэше компании
+    загружаются одним запросом на всех.
+    """
+    result, missing = {}, []
+    for company_id in set(company_ids):
+        recipients = recipient_cache.get(company_id)
+        if recipients is None:
+            missing.append(company_id)
+        else:
+            result[company_id] = recipients
+    if missing:
+        for company_id, recipients in _load_recipients(missing).items():
+            recipient_cache.set(company_id, recipients)
+            result[company_id] = recipients
+    return result
+
+
+def get_recipients(company_id):
+    """Получатели уведомлений одной компании, см. `get_recipients_map`."""
+    return get_recipients_map([company_id])[company_id]
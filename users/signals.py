@@ -0,0 +1,15 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .lookups import recipient_cache
+from .models import User
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_recipient_cache(sender, update_fields=None, **kwargs):
+    # Обновление `last_login` при входе не меняет получателей
+    if update_fields is not None and set(update_fields) <= {"last_login"}:
+        return
+    # Сбрасываем после коммита, иначе параллельный запрос может закэшировать старые данные
+    transaction.on_commit(recipient_cache.invalidate)
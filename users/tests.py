@@ -1,3 +1,62 @@
 from django.test import TestCase
+from django.utils.timezone import now
 
-# Create your tests here.
+from companies.models import Company
+from visionaibox.tests import SharedReferenceCacheMixin
+from .lookups import Recipients, get_recipients, recipient_cache
+from .models import User
+
+
+class RecipientCacheTests(SharedReferenceCacheMixin, TestCase):
+    """Справочник получателей уведомлений сбрасывается после коммита изменений пользователей."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name="Test company")
+
+    def setUp(self):
+        super().setUp()
+        recipient_cache.invalidate()
+
+    def create_user(self, telegram_id, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return User.objects.create(telegram_id=telegram_id, company=self.company, **fields)
+
+    def test_new_recipients(self):
+        self.assertEqual(get_recipients(self.company.pk), Recipients((), (), ()))
+        self.assertCached(recipient_cache, self.company.pk, Recipients((), (), ()))
+        executive = self.create_user(101, is_executive=True)
+        self.assertNotCached(recipient_cache, self.company.pk)
+        self.assertEqual(get_recipients(self.company.pk), Recipients((), (101,), (executive.pk,)))
+        self.create_user(102, is_security=True)
+        self.assertEqual(get_recipients(self.company.pk), Recipients((102,), (101,), (executive.pk,)))
+
+    def test_change_and_delete(self):
+        executive = self.create_user(101, is_executive=True)
+        security = self.create_user(102, is_security=True)
+        get_recipients(self.company.pk)
+        executive.is_executive = False
+        with self.captureOnCommitCallbacks(execute=True):
+            executive.save()
+        self.assertEqual(get_recipients(self.company.pk), Recipients((102,), (), ()))
+        with self.captureOnCommitCallbacks(execute=True):
+            security.delete()
+        self.assertEqual(get_recipients(self.company.pk), Recipients((), (), ()))
+
+    def test_not_invalidated_before_commit(self):
+        get_recipients(self.company.pk)
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            User.objects.create(telegram_id=101, company=self.company, is_executive=True)
+        # До коммита сброса нет: иначе параллельный запрос закэширует незакоммиченное состояние
+        self.assertCached(recipient_cache, self.company.pk, Recipients((), (), ()))
+        for callback in callbacks:
+            callback()
+        self.assertNotCached(recipient_cache, self.company.pk)
+
+    def test_last_login_keeps_cache(self):
+        user = self.create_user(101, is_executive=True)
+        recipients = get_recipients(self.company.pk)
+        user.last_login = now()
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save(update_fields=["last_login"])
+        self.assertCached(recipient_cache, self.company.pk, recipients)
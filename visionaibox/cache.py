@@ -0,0 +1,164 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+_MISSING = object()
+# Отметка в локальном кэше ReferenceCache: объекта с таким ключом нет в БД
+_NOT_FOUND = object()
+
+
+class TTLCache:
+    """Потокобезопасный LRU-кэш процесса с ограничением размера и временем жизни записей."""
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ReferenceCache:
+    """
+    Кэш справочных объектов (устройства, источники, алгоритмы): локальный TTLCache
+    процесса и, если задан REFERENCE_CACHE_ALIAS, общий бэкенд Django-кэша.
+    Сброс (`invalidate`) очищает локальный кэш и меняет «поколение» ключей в общем,
+    остальные процессы увидят изменения не позже чем через REFERENCE_CACHE_TTL.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.local = TTLCache(settings.REFERENCE_CACHE_MAXSIZE, settings.REFERENCE_CACHE_TTL)
+
+    @property
+    def shared(self):
+        alias = settings.REFERENCE_CACHE_ALIAS
+        return caches[alias] if alias else None
+
+    def _generation_key(self):
+        return f"ref:{self.name}:generation"
+
+    def _format_key(self, generation, key):
+        if isinstance(key, tuple):
+            key = ":".join(str(part) for part in key)
+        return f"ref:{self.name}:{generation}:{key}"
+
+    def _shared_key(self, shared, key):
+        return self._format_key(shared.get_or_set(self._generation_key(), 0, None), key)
+
+    async def _ashared_key(self, shared, key):
+        return self._format_key(await shared.aget_or_set(self._generation_key(), 0, None), key)
+
+    def _lookup(self, key):
+        """Значение из кэша, None (нет в кэше) или _NOT_FOUND (закэширован промах загрузки)."""
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        shared = self.shared
+        if shared is not None:
+            value = shared.get(self._shared_key(shared, key))
+            if value is not None:
+                self.local.set(key, value)
+        return value
+
+    async def _alookup(self, key):
+        """Асинхронный `_lookup`: общий кэш — через async API бэкенда, без блокировки цикла событий."""
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        shared = self.shared
+        if shared is not None:
+            value = await shared.aget(await self._ashared_key(shared, key))
+            if value is not None:
+                self.local.set(key, value)
+        return value
+
+    def get(self, key):
+        value = self._lookup(key)
+        return None if value is _NOT_FOUND else value
+
+    def set(self, key, value):
+        self.local.set(key, value)
+        shared = self.shared
+        if shared is not None:
+            shared.set(self._shared_key(shared, key), value, settings.REFERENCE_CACHE_SHARED_TTL)
+
+    async def aset(self, key, value):
+        self.local.set(key, value)
+        shared = self.shared
+        if shared is not None:
+            await shared.aset(await self._ashared_key(shared, key), value, settings.REFERENCE_CACHE_SHARED_TTL)
+
+    def _store(self, key, value, cache_misses):
+        if value is not None:
+            self.set(key, value)
+        elif cache_misses:
+            # Промах — только в локальном кэше: сбрасывается вместе с ним и живёт не дольше REFERENCE_CACHE_TTL
+            self.local.set(key, _NOT_FOUND)
+
+    async def _astore(self, key, value, cache_misses):
+        if value is not None:
+            await self.aset(key, value)
+        elif cache_misses:
+            self.local.set(key, _NOT_FOUND)
+
+    def get_or_load(self, key, loader, cache_misses=False):
+        """
+        Значение из кэша или из `loader()`. None кэшируется только при `cache_misses`,
+        чтобы поток запросов с неизвестным ключом не обращался к БД каждый раз.
+        """
+        value = self._lookup(key)
+        if value is _NOT_FOUND:
+            return None
+        if value is None:
+            value = loader()
+            self._store(key, value, cache_misses)
+        return value
+
+    async def aget_or_load(self, key, loader, cache_misses=False):
+        """Асинхронный вариант `get_or_load`: `loader` возвращает awaitable (async ORM)."""
+        value = await self._alookup(key)
+        if value is _NOT_FOUND:
+            return None
+        if value is None:
+            value = await loader()
+            await self._astore(key, value, cache_misses)
+        return value
+
+    def invalidate(self):
+        self.local.clear()
+        shared = self.shared
+        if shared is not None:
+            shared.set(self._generation_key(), time.time_ns(), None)
@@ -0,0 +1,69 @@
+"""
+Быстрые JSON-парсер и рендерер для DRF на orjson с откатом на стандартный `json`,
+если orjson не установлен. Вывод совпадает с JSONRenderer DRF (компактный, UTF-8,
+даты и Decimal — через энкодер DRF).
+"""
+import json
+
+from django.conf import settings
+from rest_framework import parsers, renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.json import strict_constant
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    # datetime/date/time передаются энкодеру DRF (миллисекунды, `Z`), int-ключи словарей — строки, как в json
+    ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+    JSONDecodeError = orjson.JSONDecodeError
+else:
+    JSONDecodeError = json.JSONDecodeError
+
+_encoder = JSONEncoder()
+
+
+def dumps(data):
+    """Сериализует `data` в компактный UTF-8 JSON (bytes)."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, default=_encoder.default, option=ORJSON_OPTIONS)
+        except TypeError:
+            # Например, целые за пределами 64 бит — их orjson не поддерживает
+            pass
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def loads(data):
+    """Разбирает JSON из bytes или str (NaN/Infinity не допускаются), при ошибке — ValueError."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data, parse_constant=strict_constant)
+
+
+class JSONRenderer(renderers.JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        # Отступы (browsable API, `; indent=`) и нестандартные настройки DRF — стандартным рендерером
+        if self.get_indent(accepted_media_type, renderer_context or {}) or not self.compact or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Как в DRF: U+2028/U+2029 экранируются для совместимости с JavaScript
+        return dumps(data).replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+
+
+class JSONParser(parsers.JSONParser):
+    renderer_class = JSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get("encoding", settings.DEFAULT_CHARSET)
+        data = stream.read()
+        if encoding.lower().replace("-", "") != "utf8":
+            data = data.decode(encoding)
+        try:
+            return loads(data)
+        except ValueError as exc:
+            raise ParseError(f"JSON parse error - {exc}")
@@ -0,0 +1,181 @@
+"""
+Метрики процесса в текстовом формате Prometheus (`/metrics`, у воркера бота — `--metrics-port`).
+
+Счётчики и гистограммы хранятся в памяти процесса, при нескольких воркерах
+каждый отдаёт свои (Prometheus суммирует их по `instance`). Пока METRICS_ENABLED
+выключен, `inc`/`observe`/`time` ничего не делают, а счётчик SQL-запросов не ставится.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_NULL_TIMER = nullcontext()
+# Счётчик SQL-запросов текущего запроса; копия контекста попадает и в потоки sync_to_async
+_query_count = ContextVar("metrics_query_count", default=None)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Метрика {metric.name} уже зарегистрирована.")
+            self._metrics[metric.name] = metric
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus (bytes)."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return ("\n".join(lines) + "\n").encode()
+
+
+REGISTRY = Registry()
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Метрика с метками: значения меток передаются позиционно в порядке `labelnames`."""
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def format_labels(self, labelvalues, extra=()):
+        pairs = [*zip(self.labelnames, labelvalues), *extra]
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in pairs) + "}"
+
+    def snapshot(self):
+        with self._lock:
+            return sorted(self._values.items(), key=lambda item: tuple(map(str, item[0])))
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labelvalues, amount=1):
+        if not settings.METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def samples(self):
+        for labelvalues, value in self.snapshot():
+            yield f"{self.name}{self.format_labels(labelvalues)} {format_value(value)}"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+    DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, *labelvalues):
+        if not settings.METRICS_ENABLED:
+            return
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labelvalues)
+            if state is None:
+                # Счётчики по корзинам (последняя — +Inf) и сумма значений
+                state = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def time(self, *labelvalues):
+        """Контекстный менеджер: наблюдает длительность блока в секундах."""
+        if not settings.METRICS_ENABLED:
+            return _NULL_TIMER
+        return Timer(self, labelvalues)
+
+    def samples(self):
+        for labelvalues, (counts, total) in self.snapshot():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                labels = self.format_labels(labelvalues, [("le", format_value(float(bound)))])
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            yield f"{self.name}_sum{self.format_labels(labelvalues)} {format_value(total)}"
+            yield f"{self.name}_count{self.format_labels(labelvalues)} {cumulative}"
+
+
+class Timer:
+    __slots__ = ("histogram", "labelvalues", "started")
+
+    def __init__(self, histogram, labelvalues):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labelvalues)
+
+
+def _count_query(execute, sql, params, many, context):
+    count = _query_count.get()
+    if count is not None:
+        count[0] += 1
+    return execute(sql, params, many, context)
+
+
+def install_query_counter(connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _count_query)
+
+
+def enable_query_counting():
+    """Ставит счётчик SQL-запросов на текущие и все новые соединения с БД."""
+    connection_created.connect(install_query_counter, dispatch_uid="metrics_query_counter")
+    for connection in connections.all(initialized_only=True):
+        install_query_counter(connection)
+
+
+@contextmanager
+def count_queries():
+    """Считает SQL-запросы блока (включая sync_to_async); значение — `count[0]` после выхода."""
+    count = [0]
+    token = _query_count.set(count)
+    try:
+        yield count
+    finally:
+        _query_count.reset(token)
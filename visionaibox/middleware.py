@@ -0,0 +1,64 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .metrics import Counter, Histogram, count_queries, enable_query_counting
+
+HTTP_REQUESTS = Counter(
+    "visionaibox_http_requests_total", "HTTP-запросы по представлению, методу и коду ответа",
+    ("view", "method", "status"),
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "visionaibox_http_request_duration_seconds", "Время обработки HTTP-запроса до ответа (для потоков — до заголовков)",
+    ("view", "method"),
+)
+HTTP_REQUEST_QUERIES = Histogram(
+    "visionaibox_http_request_db_queries", "SQL-запросов за HTTP-запрос",
+    ("view", "method"), buckets=(0, 1, 2, 3, 5, 8, 13, 20, 50, 100, 200),
+)
+
+
+class MetricsMiddleware:
+    """
+    Время, число SQL-запросов и коды ответов HTTP-запросов по представлениям.
+    Работает и для WSGI, и для async-представлений под ASGI (без перехода в поток).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        if settings.METRICS_ENABLED:
+            enable_query_counting()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+        started = time.perf_counter()
+        with count_queries() as queries:
+            response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - started, queries[0])
+        return response
+
+    async def __acall__(self, request):
+        if not settings.METRICS_ENABLED:
+            return await self.get_response(request)
+        started = time.perf_counter()
+        with count_queries() as queries:
+            response = await self.get_response(request)
+        self.record(request, response, time.perf_counter() - started, queries[0])
+        return response
+
+    def record(self, request, response, elapsed, queries):
+        match = request.resolver_match
+        # Имя маршрута, а не путь: число меток не растёт с числом тревог
+        view = (match.view_name or match.url_name or "unnamed") if match else "unmatched"
+        HTTP_REQUESTS.inc(view, request.method, response.status_code)
+        HTTP_REQUEST_SECONDS.observe(elapsed, view, request.method)
+        HTTP_REQUEST_QUERIES.observe(queries, view, request.method)
@@ -93,3 +93,36 @@ class NestedViewSetMixin(object):
             serializer.save(created_by=self.request.user, **{self.get_model_lookup(): self.parent.id})
         else:
             serializer.save(**{self.get_model_lookup(): self.parent.id})
+
+
+class DynamicFieldsMixin:
+    """
+    Миксин для сериализатора: принимает `fields` (список имён) и оставляет
+    только эти поля, например для компактного ответа списка.
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop("fields", None)
+        super().__init__(*args, **kwargs)
+        if fields:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+
+class SparseFieldsetMixin:
+    """Миксин для ViewSet: параметр `?fields=id,alert_time,...` ограничивает поля в ответе списка."""
+    fields_query_param = "fields"
+    sparse_fieldset_actions = ("list",)
+
+    def get_requested_fields(self):
+        value = self.request.query_params.get(self.fields_query_param)
+        if not value:
+            return None
+        return [name.strip() for name in value.split(",") if name.strip()]
+
+    def get_serializer(self, *args, **kwargs):
+        if getattr(self, "action", None) in self.sparse_fieldset_actions:
+            fields = self.get_requested_fields()
+            if fields:
+                kwargs["fields"] = fields
+        return super().get_serializer(*args, **kwargs)
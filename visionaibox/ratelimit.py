@@ -0,0 +1,102 @@
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .cache import TTLCache
+
+
+class TokenBucketLimiter:
+    """
+    Ограничитель частоты «token bucket»: на ключ до `burst` запросов подряд, далее
+    `rate` запросов в секунду. `rate` и `burst` — функции без аргументов, чтобы
+    настройки читались при каждом вызове. Пачка больше `burst` пропускается при полной
+    корзине и уводит её в долг: следующие запросы ждут, пока долг не погасится.
+
+    По умолчанию корзины хранятся в памяти процесса. Если задан RATE_LIMIT_CACHE_ALIAS,
+    используется общий Django-кэш: атомарный `incr` счётчика в окне `burst / rate` секунд
+    (приближение token bucket с той же средней скоростью и тем же всплеском).
+    """
+
+    def __init__(self, name, rate, burst):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.local = TTLCache(settings.RATE_LIMIT_MAXSIZE, ttl=3600)
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self):
+        alias = settings.RATE_LIMIT_CACHE_ALIAS
+        return caches[alias] if alias else None
+
+    def consume(self, key, cost=1):
+        """
+        Списывает `cost` токенов с корзины ключа. Возвращает 0, если запрос разрешён,
+        иначе — через сколько секунд повторить (токены при отказе не списываются).
+        """
+        rate, burst = self.rate(), self.burst()
+        if not rate:
+            return 0
+        burst = max(burst, 1)
+        required = min(cost, burst)
+        shared = self.shared
+        if shared is not None:
+            return self._consume_shared(shared, key, cost, rate, burst)
+
+        now = time.monotonic()
+        with self._lock:
+            bucket = self.local.get(key)
+            if bucket is None:
+                tokens = burst
+            else:
+                tokens, updated = bucket
+                tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= required:
+                self.local.set(key, (tokens - cost, now))
+                return 0
+            self.local.set(key, (tokens, now))
+        return (required - tokens) / rate
+
+    def refund(self, key, cost=1):
+        """Возвращает `cost` токенов, списанных `consume`, если запрос всё же отклонён другим лимитом."""
+        rate, burst = self.rate(), self.burst()
+        if not rate:
+            return
+        burst = max(burst, 1)
+        shared = self.shared
+        if shared is not None:
+            try:
+                shared.decr(self._window_key(key, burst / rate, time.time()), cost)
+            except ValueError:
+                # Счётчик окна истёк или вытеснен — возвращать нечего
+                pass
+            return
+        with self._lock:
+            bucket = self.local.get(key)
+            if bucket is not None:
+                tokens, updated = bucket
+                self.local.set(key, (min(burst, tokens + cost), updated))
+
+    def _window_key(self, key, period, now):
+        return f"ratelimit:{self.name}:{key}:{math.floor(now / period)}"
+
+    def _consume_shared(self, shared, key, cost, rate, burst):
+        period = burst / rate
+        now = time.time()
+        window = math.floor(now / period)
+        cache_key = self._window_key(key, period, now)
+        # add не перезапишет счётчик, созданный другим процессом
+        shared.add(cache_key, 0, math.ceil(period) + 1)
+        try:
+            used = shared.incr(cache_key, cost)
+        except ValueError:
+            # Ключ вытеснен между add и incr — считаем окно новым
+            shared.set(cache_key, cost, math.ceil(period) + 1)
+            used = cost
+        if used <= burst or used == cost:
+            return 0
+        shared.decr(cache_key, cost)
+        return (window + 1) * period - now
@@ -48,6 +48,7 @@ THIRD_PARTY_APPS = [
     'drf_spectacular_sidecar',
     'corsheaders',
     'rest_framework.authtoken',
+    'django_filters',
 ]
 
 
@@ -65,6 +66,7 @@ INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 
 
 MIDDLEWARE = [
+    'visionaibox.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -93,6 +95,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'visionaibox.wsgi.application'
+ASGI_APPLICATION = 'visionaibox.asgi.application'
 
 
 # Database
@@ -157,9 +160,108 @@ MEDIA_ROOT = os.path.join(BASE_DIR, "media/")
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# JSON через orjson (если не установлен — стандартный json), см. visionaibox/fastjson.py
+REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": [
+        "visionaibox.fastjson.JSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "visionaibox.fastjson.JSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
+}
+
 # Telegram-бот
 TELEGRAM_BOT_TOKEN = env("TELEGRAM_BOT_TOKEN")
 TELEGRAM_ADMIN_CHAT_ID = env("TELEGRAM_ADMIN_CHAT_ID")
 
 BOT_ALERT_URL = env("BOT_ALERT_URL", default="http://localhost:8001/alerts")
 TELEGRAM_BOT_USERNAME = env("TELEGRAM_BOT_USERNAME", default="visionai_kg_bot")
+
+# Очередь уведомлений для бота (outbox), см. `python manage.py run_bot_outbox`
+BOT_OUTBOX_BATCH_SIZE = env.int("BOT_OUTBOX_BATCH_SIZE", default=50)
+BOT_OUTBOX_CONCURRENCY = env.int("BOT_OUTBOX_CONCURRENCY", default=8)
+BOT_OUTBOX_DESTINATION_CONCURRENCY = env.int("BOT_OUTBOX_DESTINATION_CONCURRENCY", default=4)
+BOT_OUTBOX_MAX_ATTEMPTS = env.int("BOT_OUTBOX_MAX_ATTEMPTS", default=8)
+BOT_OUTBOX_BACKOFF_BASE = env.float("BOT_OUTBOX_BACKOFF_BASE", default=2.0)
+BOT_OUTBOX_BACKOFF_MAX = env.float("BOT_OUTBOX_BACKOFF_MAX", default=600.0)
+# Минимальный срок аренды пачки воркером; для больших пачек он растёт до худшего времени их отправки
+BOT_OUTBOX_LEASE_SECONDS = env.int("BOT_OUTBOX_LEASE_SECONDS", default=60)
+BOT_OUTBOX_REQUEST_TIMEOUT = env.float("BOT_OUTBOX_REQUEST_TIMEOUT", default=10.0)
+BOT_OUTBOX_POLL_INTERVAL = env.float("BOT_OUTBOX_POLL_INTERVAL", default=1.0)
+
+# Максимальное количество тревог в одном запросе пакетной загрузки
+ALERT_BULK_MAX_ITEMS = env.int("ALERT_BULK_MAX_ITEMS", default=1000)
+
+# Метрики Prometheus (`/metrics`, у воркера бота — `run_bot_outbox --metrics-port`); выключены по умолчанию.
+# METRICS_TOKEN — если задан, `/metrics` требует заголовок `Authorization: Bearer <токен>`
+METRICS_ENABLED = env.bool("METRICS_ENABLED", default=False)
+METRICS_TOKEN = env("METRICS_TOKEN", default=None)
+
+# Ограничение частоты приёма тревог (token bucket): тревог в секунду и допустимый всплеск
+# на устройство AIBox и на компанию (0 — без ограничения). RATE_LIMIT_CACHE_ALIAS — алиас из CACHES
+# для общих счётчиков между процессами (по умолчанию корзины в памяти каждого процесса)
+ALERT_RATE_LIMIT_DEVICE = env.float("ALERT_RATE_LIMIT_DEVICE", default=0)
+ALERT_RATE_LIMIT_DEVICE_BURST = env.int("ALERT_RATE_LIMIT_DEVICE_BURST", default=20)
+ALERT_RATE_LIMIT_COMPANY = env.float("ALERT_RATE_LIMIT_COMPANY", default=0)
+ALERT_RATE_LIMIT_COMPANY_BURST = env.int("ALERT_RATE_LIMIT_COMPANY_BURST", default=200)
+RATE_LIMIT_CACHE_ALIAS = env("RATE_LIMIT_CACHE_ALIAS", default=None)
+RATE_LIMIT_MAXSIZE = env.int("RATE_LIMIT_MAXSIZE", default=10000)
+
+# Сброс нагрузки при приёме тревог (0 — выключено): максимум одновременных запросов приёма
+# в процессе и неотправленных уведомлений в outbox бота (проверяется раз в ALERT_SHED_CHECK_INTERVAL
+# секунд); ALERT_SHED_RETRY_AFTER — через сколько секунд AIBox предлагается повторить
+ALERT_SHED_MAX_INFLIGHT = env.int("ALERT_SHED_MAX_INFLIGHT", default=0)
+ALERT_SHED_MAX_OUTBOX = env.int("ALERT_SHED_MAX_OUTBOX", default=0)
+ALERT_SHED_CHECK_INTERVAL = env.float("ALERT_SHED_CHECK_INTERVAL", default=5.0)
+ALERT_SHED_RETRY_AFTER = env.int("ALERT_SHED_RETRY_AFTER", default=10)
+
+# Подавление повторов тревог (то же устройство, источник и алгоритм) при приёме, см. algorithms/suppression.py:
+# окно в секундах от последнего срабатывания (0 — выключено, у алгоритма можно задать своё),
+# максимальное расстояние Хэмминга dHash для «той же сцены» (пусто — кадры не сравниваются), размер индекса серий
+ALERT_SUPPRESSION_WINDOW = env.int("ALERT_SUPPRESSION_WINDOW", default=0)
+ALERT_SUPPRESSION_HASH_DISTANCE = env.int("ALERT_SUPPRESSION_HASH_DISTANCE", default=None)
+ALERT_SUPPRESSION_INDEX_SIZE = env.int("ALERT_SUPPRESSION_INDEX_SIZE", default=10000)
+
+# Сколько тревог обрабатывает за запрос пакетное подтверждение/отклонение по фильтру
+ALERT_BULK_ACTION_MAX_ALERTS = env.int("ALERT_BULK_ACTION_MAX_ALERTS", default=10000)
+
+# Максимальный размер изображения/видео тревоги, байт
+ALERT_MEDIA_MAX_SIZE = env.int("ALERT_MEDIA_MAX_SIZE", default=100 * 1024 * 1024)
+
+# Через сколько секунд без ссылок удаляются файлы тревог (см. `python manage.py gc_alert_media`)
+ALERT_MEDIA_GC_GRACE = env.int("ALERT_MEDIA_GC_GRACE", default=3600)
+
+# Хранение тревог для компаний без AlertRetentionPolicy (пусто — хранить всегда),
+# архив удаляемых тревог (NDJSON.gz), см. `python manage.py apply_alert_retention`
+ALERT_RETENTION_DAYS = env.int("ALERT_RETENTION_DAYS", default=None)
+ALERT_MEDIA_RETENTION_DAYS = env.int("ALERT_MEDIA_RETENTION_DAYS", default=None)
+ALERT_ARCHIVE_ROOT = env("ALERT_ARCHIVE_ROOT", default=os.path.join(BASE_DIR, "archive"))
+ALERT_RETENTION_BATCH_SIZE = env.int("ALERT_RETENTION_BATCH_SIZE", default=1000)
+
+# Поток событий тревог для дашборда (`v2/alerts/stream/`): "memory" — в пределах процесса,
+# "postgres" — через LISTEN/NOTIFY, если воркеров несколько
+ALERT_STREAM_BACKEND = env("ALERT_STREAM_BACKEND", default="memory")
+ALERT_STREAM_HEARTBEAT = env.float("ALERT_STREAM_HEARTBEAT", default=15.0)
+ALERT_STREAM_QUEUE_SIZE = env.int("ALERT_STREAM_QUEUE_SIZE", default=1000)
+
+# Сколько месяцев вперёд заранее создавать секции таблицы тревог (см. `python manage.py manage_alert_partitions`)
+ALERT_PARTITIONS_AHEAD = env.int("ALERT_PARTITIONS_AHEAD", default=3)
+
+# Превью изображений тревог (см. `python manage.py generate_alert_previews`), размер — по длинной стороне, px
+ALERT_THUMBNAIL_SIZE = env.int("ALERT_THUMBNAIL_SIZE", default=320)
+ALERT_PREVIEW_SIZE = env.int("ALERT_PREVIEW_SIZE", default=1280)
+ALERT_PREVIEW_QUALITY = env.int("ALERT_PREVIEW_QUALITY", default=80)
+ALERT_PREVIEW_BATCH_SIZE = env.int("ALERT_PREVIEW_BATCH_SIZE", default=50)
+ALERT_PREVIEW_POLL_INTERVAL = env.float("ALERT_PREVIEW_POLL_INTERVAL", default=5.0)
+# На сколько секунд воркер превью забирает пачку тревог; после падения воркера их возьмёт другой
+ALERT_PREVIEW_LEASE_SECONDS = env.int("ALERT_PREVIEW_LEASE_SECONDS", default=300)
+
+# Кэш справочных объектов при приёме тревог (устройства, источники, алгоритмы).
+# REFERENCE_CACHE_ALIAS — алиас из CACHES для общего кэша между процессами (по умолчанию только локальный)
+REFERENCE_CACHE_TTL = env.int("REFERENCE_CACHE_TTL", default=60)
+REFERENCE_CACHE_MAXSIZE = env.int("REFERENCE_CACHE_MAXSIZE", default=4096)
+REFERENCE_CACHE_ALIAS = env("REFERENCE_CACHE_ALIAS", default=None)
+REFERENCE_CACHE_SHARED_TTL = env.int("REFERENCE_CACHE_SHARED_TTL", default=600)
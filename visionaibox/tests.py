@@ -0,0 +1,247 @@
+import asyncio
+import importlib
+import io
+import sys
+import uuid
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+from unittest import mock
+from zoneinfo import ZoneInfo
+
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils.translation import gettext_lazy
+from rest_framework import renderers
+from rest_framework.exceptions import ParseError
+
+from . import fastjson
+from .cache import ReferenceCache
+from .metrics import CONTENT_TYPE, Histogram, Registry
+from .middleware import HTTP_REQUEST_QUERIES, HTTP_REQUEST_SECONDS, HTTP_REQUESTS
+
+# Общий кэш справочников для тестов: отдельный LocMemCache вместо Redis/Memcached
+REFERENCE_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "reference": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "reference-tests"},
+}
+
+
+class SharedReferenceCacheMixin:
+    """Справочники кэшируются и локально, и в общем кэше (чистый перед каждым тестом)."""
+
+    def setUp(self):
+        self.enterContext(override_settings(CACHES=REFERENCE_CACHES, REFERENCE_CACHE_ALIAS="reference"))
+        caches["reference"].clear()
+        super().setUp()
+
+    def assertCached(self, cache, key, value):
+        """Значение есть в локальном кэше процесса и в общем (как его увидит другой процесс)."""
+        self.assertEqual(cache.local.get(key), value)
+        other_process = ReferenceCache(cache.name)
+        self.assertEqual(other_process.get(key), value)
+
+    def assertNotCached(self, cache, key):
+        self.assertIsNone(cache.local.get(key))
+        self.assertIsNone(ReferenceCache(cache.name).get(key))
+
+
+def sync_only(method):
+    """Обёртка метода кэша: падает, если блокирующий вызов сделан прямо в цикле событий."""
+    def wrapper(*args, **kwargs):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return method(*args, **kwargs)
+        raise AssertionError(f"{method.__name__}() вызван в цикле событий")
+    return wrapper
+
+
+class ReferenceCacheTests(SharedReferenceCacheMixin, SimpleTestCase):
+    """ReferenceCache: общий кэш с поколением ключей, кэширование промахов и async-загрузка."""
+
+    def setUp(self):
+        super().setUp()
+        self.cache = ReferenceCache("test")
+        self.loads = []
+
+    def loader(self, value):
+        def load():
+            self.loads.append(value)
+            return value
+        return load
+
+    def aloader(self, value):
+        async def aload():
+            self.loads.append(value)
+            return value
+        return aload
+
+    def test_shared(self):
+        self.cache.set(("device", 1), "camera")
+        self.assertCached(self.cache, ("device", 1), "camera")
+        # Сброс в одном процессе виден другим через новое поколение ключей
+        other_process = ReferenceCache("test")
+        self.cache.invalidate()
+        self.assertNotCached(self.cache, ("device", 1))
+        self.assertIsNone(other_process.get(("device", 1)))
+
+    def test_cache_misses(self):
+        for _ in range(2):
+            self.assertIsNone(self.cache.get_or_load("unknown", self.loader(None)))
+        self.assertEqual(len(self.loads), 2)
+        for _ in range(2):
+            self.assertIsNone(self.cache.get_or_load("missing", self.loader(None), cache_misses=True))
+        self.assertEqual(len(self.loads), 3)
+        # Промах не попадает в общий кэш и сбрасывается вместе с локальным
+        self.assertIsNone(caches["reference"].get(self.cache._shared_key(caches["reference"], "missing")))
+        self.cache.invalidate()
+        self.assertEqual(self.cache.get_or_load("missing", self.loader("found"), cache_misses=True), "found")
+
+    async def test_async_load(self):
+        with mock.patch.object(LocMemCache, "get", sync_only(LocMemCache.get)), \
+                mock.patch.object(LocMemCache, "set", sync_only(LocMemCache.set)), \
+                mock.patch.object(LocMemCache, "get_or_set", sync_only(LocMemCache.get_or_set)):
+            for _ in range(2):
+                self.assertEqual(await self.cache.aget_or_load("device", self.aloader("camera")), "camera")
+            self.cache.local.clear()
+            # Из общего кэша, без повторной загрузки
+            self.assertEqual(await self.cache.aget_or_load("device", self.aloader("camera")), "camera")
+            for _ in range(2):
+                self.assertIsNone(await self.cache.aget_or_load("missing", self.aloader(None), cache_misses=True))
+        self.assertEqual(self.loads, ["camera", None])
+
+
+class FastJSONTests(SimpleTestCase):
+    """Рендерер и парсер на orjson дают тот же JSON, что и стандартные DRF, в том числе без orjson."""
+
+    DATA = {
+        "alert_time": datetime(2025, 3, 1, 12, 30, 15, 123456, tzinfo=timezone.utc),
+        "local_time": datetime(2025, 3, 1, 18, 30, 15, tzinfo=ZoneInfo("Asia/Bishkek")),
+        "naive_time": datetime(2025, 3, 1, 12, 30),
+        "day": date(2025, 3, 1),
+        "clock": time(12, 30, 15, 500000),
+        "duration": timedelta(minutes=5),
+        "score": Decimal("0.950"),
+        "uuid": uuid.UUID("12345678-1234-5678-1234-567812345678"),
+        "label": gettext_lazy("Тревога"),
+        "counts": {1: "one", 2: [True, None, 1.5]},
+        "text": "строка\u2028с разделителями\u2029 \"кавычки\" \\",
+        "big": 2 ** 70,
+    }
+
+    def assertSameAsDRF(self, data):
+        self.assertEqual(fastjson.JSONRenderer().render(data), renderers.JSONRenderer().render(data))
+
+    def test_render_matches_drf(self):
+        self.assertSameAsDRF(self.DATA)
+        self.assertSameAsDRF([self.DATA, {}, []])
+        self.assertEqual(fastjson.JSONRenderer().render(None), b"")
+
+    def test_render_indent_uses_drf(self):
+        context = {"indent": 4}
+        self.assertEqual(
+            fastjson.JSONRenderer().render(self.DATA, "application/json", context),
+            renderers.JSONRenderer().render(self.DATA, "application/json", context),
+        )
+
+    def test_parse(self):
+        parser = fastjson.JSONParser()
+        body = fastjson.JSONRenderer().render({"id": 1, "name": "Камера", "items": [1.5, None]})
+        self.assertEqual(parser.parse(io.BytesIO(body)), {"id": 1, "name": "Камера", "items": [1.5, None]})
+        self.assertEqual(
+            parser.parse(io.BytesIO("{\"name\": \"Камера\"}".encode("cp1251")), parser_context={"encoding": "cp1251"}),
+            {"name": "Камера"},
+        )
+        for body in (b"{\"id\": NaN}", b"{\"id\": Infinity}", b"{\"id\": ", b"\xff"):
+            with self.assertRaises(ParseError):
+                parser.parse(io.BytesIO(body))
+
+    def test_stdlib_fallback(self):
+        # Модуль заново импортируется так, будто orjson не установлен
+        with mock.patch.dict(sys.modules, {"orjson": None}):
+            importlib.reload(fastjson)
+        try:
+            self.assertIsNone(fastjson.orjson)
+            self.test_render_matches_drf()
+            self.test_parse()
+        finally:
+            importlib.reload(fastjson)
+        self.assertIsNotNone(fastjson.orjson)
+
+
+def get_sample(metric, *labelvalues):
+    """Значение метрики с метками: для счётчика — число, для гистограммы — число наблюдений."""
+    value = dict(metric.snapshot()).get(labelvalues, 0)
+    return sum(value[0]) if isinstance(value, list) else value
+
+
+class MetricsTests(TestCase):
+    """`/metrics` и MetricsMiddleware; метрики общие для процесса, поэтому проверяются приращения."""
+
+    def get_metrics(self, **headers):
+        return self.client.get("/metrics", headers=headers)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled(self):
+        before = get_sample(HTTP_REQUESTS, "metrics", "GET", 404)
+        self.assertEqual(self.get_metrics().status_code, 404)
+        # Выключенная middleware ничего не записывает
+        self.assertEqual(get_sample(HTTP_REQUESTS, "metrics", "GET", 404), before)
+
+    @override_settings(METRICS_ENABLED=True, METRICS_TOKEN=None)
+    def test_enabled(self):
+        before = get_sample(HTTP_REQUESTS, "metrics", "GET", 200)
+        seconds = get_sample(HTTP_REQUEST_SECONDS, "metrics", "GET")
+        response = self.get_metrics()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], CONTENT_TYPE)
+        self.assertIn(b"# TYPE visionaibox_http_requests_total counter", response.content)
+        self.assertIn(b"# TYPE visionaibox_alert_stage_seconds histogram", response.content)
+        self.assertEqual(get_sample(HTTP_REQUESTS, "metrics", "GET", 200), before + 1)
+        self.assertEqual(get_sample(HTTP_REQUEST_SECONDS, "metrics", "GET"), seconds + 1)
+        # Предыдущий запрос уже виден в выдаче следующего
+        line = f'visionaibox_http_requests_total{{view="metrics",method="GET",status="200"}} {before + 1}'
+        self.assertIn(line.encode(), self.get_metrics().content.splitlines())
+
+    @override_settings(METRICS_ENABLED=True)
+    def test_unmatched_route(self):
+        before = get_sample(HTTP_REQUESTS, "unmatched", "GET", 404)
+        queries = get_sample(HTTP_REQUEST_QUERIES, "unmatched", "GET")
+        self.assertEqual(self.client.get("/missing/").status_code, 404)
+        # Путь не попадает в метки: все ненайденные маршруты — одна серия
+        self.assertEqual(get_sample(HTTP_REQUESTS, "unmatched", "GET", 404), before + 1)
+        self.assertEqual(get_sample(HTTP_REQUEST_QUERIES, "unmatched", "GET"), queries + 1)
+
+    @override_settings(METRICS_ENABLED=True, METRICS_TOKEN="secret")
+    def test_token(self):
+        self.assertEqual(self.get_metrics().status_code, 401)
+        self.assertEqual(self.get_metrics(Authorization="Bearer wrong").status_code, 401)
+        self.assertEqual(self.get_metrics(Authorization="secret").status_code, 401)
+        response = self.get_metrics(Authorization="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"visionaibox_http_requests_total", response.content)
+
+    @override_settings(METRICS_ENABLED=True)
+    def test_histogram_render(self):
+        registry = Registry()
+        histogram = Histogram("test_seconds", "Тестовая гистограмма", ("stage",), buckets=(0.1, 1.0), registry=registry)
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value, "save")
+        with histogram.time("parse"):
+            pass
+        lines = registry.render().decode().splitlines()
+        self.assertEqual(lines[:2], ["# HELP test_seconds Тестовая гистограмма", "# TYPE test_seconds histogram"])
+        self.assertIn('test_seconds_bucket{stage="parse",le="0.1"} 1', lines)
+        self.assertEqual(lines[-5:], [
+            'test_seconds_bucket{stage="save",le="0.1"} 2',
+            'test_seconds_bucket{stage="save",le="1.0"} 3',
+            'test_seconds_bucket{stage="save",le="+Inf"} 4',
+            'test_seconds_sum{stage="save"} 3.65',
+            'test_seconds_count{stage="save"} 4',
+        ])
+        with self.assertRaises(ValueError):
+            Histogram("test_seconds", "Повтор", registry=registry)
+        with override_settings(METRICS_ENABLED=False):
+            histogram.observe(1.0, "save")
+        self.assertEqual(get_sample(histogram, "save"), 4)
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+
+from .metrics import CONTENT_TYPE, REGISTRY
+
+
+def metrics(request):
+    """Метрики процесса для Prometheus; 404, пока METRICS_ENABLED выключен."""
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    if settings.METRICS_TOKEN and not constant_time_compare(
+        request.headers.get("Authorization", ""), f"Bearer {settings.METRICS_TOKEN}"
+    ):
+        return HttpResponse(status=401)
+    return HttpResponse(REGISTRY.render(), content_type=CONTENT_TYPE)